@@ -0,0 +1,511 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import bpy
+import numpy as np
+from mathutils import Vector, noise
+from mathutils.kdtree import KDTree
+from random import random, randint, gauss
+
+from frame_writer import Frame_writer
+from ground_projection import Ground_projector
+from profiling import No_profiler
+from guide_path import Guide_path
+from lifecycle import swap_remove_order
+import noise_field
+from parallel_step import Tile_pool
+from random_streams import Random_streams
+from spatial_grid import Spatial_grid
+from time_integration import Time_integrator
+
+'''
+Structure-of-arrays ant colony engine
+Same model as fourmis.Particle_system, but every ant attribute lives in a
+contiguous NumPy array and each stage of the step runs over all ants at once
+'''
+
+# mathutils works in single precision, keep the same for vectors
+FLOAT = np.float32
+
+# per-ant arrays, everything step() depends on along with the frame
+STATE = ('location', 'velocity', 'noise_seed', 'MAX_VEL',
+         'guide_index', 'guide_param', 'direction', 'behaviour', 'active',
+         'ids', 'age', 'lifetime')
+
+
+def normalized(vectors):
+    '''Normalize rows, zero vectors stay zero (like Vector.normalized)'''
+    length = np.sqrt((vectors * vectors).sum(axis=1))
+    safe = np.where(length > 0.0, length, 1.0)
+    return vectors / safe[:, None]
+
+
+def set_length(vectors, new_length):
+    '''Row-wise equivalent of Vector.length = new_length'''
+    length = np.sqrt((vectors * vectors).sum(axis=1))
+    factor = np.where(length > 0.0, new_length / np.where(length > 0.0, length, 1.0), 1.0)
+    return (vectors * factor[:, None]).astype(FLOAT)
+
+
+def repulsion(location, grid):
+    '''Sum of the unit vectors pushing each point away from its neighbours in grid'''
+    first, second, distance = grid.pairs()
+    far_enough = distance * distance >= 0.0001
+    first, second = first[far_enough], second[far_enough]
+    other_vec = location[first] - location[second]
+    other_vec /= distance[far_enough][:, None]
+
+    # each pair pushes both ants apart
+    avoid_vector = np.zeros((len(location), 3), dtype=FLOAT)
+    np.add.at(avoid_vector, first, other_vec)
+    np.add.at(avoid_vector, second, -other_vec)
+    return avoid_vector
+
+
+class Ant_system:
+
+
+    def __init__(self, guide, ground, scale, heightfield=False, turbulence_spacing=0.0, turbulence_cache=None,
+                 guide_mode='VERTEX', workers=1, stream_seed=None, steps_per_frame=1.0, subframes=0):
+
+        self.GUIDE_STRENGTH = 1.0 * scale
+
+        self.TURBULENCE_FREQUENCY = 10 * scale
+        self.TURBULENCE_STRENGTH = 1.0 * scale
+
+        self.AVOID_THRESHOLD = 0.01 * scale
+        self.AVOID_STRENGTH = 0.2 * scale
+
+        self.frame = 0
+
+        self.guide = guide
+        guide_vertices = self.guide.data.vertices
+        # 'VERTEX': target the next guide vertex like fourmis
+        # 'ARC': target a distance along the guide, see guide_path
+        self.guide_mode = guide_mode
+        self.guide_path = Guide_path.from_object(guide)
+        # the vertices as read, single precision
+        self.guide_points = self.guide_path.points.astype(FLOAT)
+        if guide_mode == 'VERTEX':
+            self.guide_tree = KDTree(len(guide_vertices))
+            for v in guide_vertices:
+                self.guide_tree.insert(v.co, v.index)
+            self.guide_tree.balance()
+
+        self.ground = ground
+        self.ground_projector = Ground_projector(ground, heightfield)
+        self.scale = scale
+
+        # 0: exact turbulence per ant, else spacing of the baked lattice
+        self.turbulence_spacing = turbulence_spacing
+        self.turbulence_cache = turbulence_cache
+        self.turbulence_field = None
+
+        self.grid = Spatial_grid(self.AVOID_THRESHOLD)
+        # more than one worker: step spatial tiles in parallel, see parallel_step
+        self.tiles = Tile_pool(workers) if workers > 1 else None
+        # None draws from random and mathutils.noise in particle order like
+        # fourmis, else per ant counter-based streams, see random_streams
+        self.streams = Random_streams(stream_seed) if stream_seed is not None else None
+        # None steps once per frame, else substeps, long steps with
+        # interpolated frames and sub-frame samples, see time_integration
+        self.integrator = None
+        if steps_per_frame != 1.0 or subframes:
+            self.integrator = Time_integrator(steps_per_frame, subframes)
+
+        # one row per ant
+        self.location = np.zeros((0, 3), dtype=FLOAT)
+        self.velocity = np.zeros((0, 3), dtype=FLOAT)
+        self.noise_seed = np.zeros((0, 3), dtype=FLOAT)
+        self.MAX_VEL = np.zeros(0)
+        self.guide_index = np.zeros(0, dtype=np.int64)
+        self.guide_param = np.zeros(0)
+        self.direction = np.zeros(0, dtype=np.int64)
+        self.behaviour = np.zeros(0)
+        self.active = np.zeros(0, dtype=bool)
+        # stable through kills, for the output
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.age = np.zeros(0, dtype=np.int64)
+        self.lifetime = np.zeros(0, dtype=np.int64)
+        self.next_id = 0
+
+        # births and deaths, see lifecycle
+        self.lifecycle = None
+
+        self.instance_obj = bpy.data.objects[bpy.context.scene.ant_instance]
+        self.instance_mesh = self.instance_obj.data
+        self.writer = Frame_writer(self.instance_mesh)
+        self.profiler = No_profiler()
+
+    def __len__(self):
+        return len(self.location)
+
+    def add_particles(self, particles_number, guide_indices=None):
+        '''Add new ants to the system, on random guide vertices or the given ones'''
+        if not particles_number:
+            return
+        ids = np.arange(self.next_id, self.next_id + particles_number)
+        if self.streams is None:
+            guide_index, max_vel, velocity, noise_seed, direction, lifetime = self.draw_particles(
+                particles_number, guide_indices)
+        else:
+            guide_index, max_vel, velocity, noise_seed, direction, lifetime = self.draw_particle_streams(
+                ids, guide_indices)
+
+        self.location = np.concatenate((self.location, self.guide_points[guide_index]))
+        self.velocity = np.concatenate((self.velocity, np.array(velocity, dtype=FLOAT)))
+        self.noise_seed = np.concatenate((self.noise_seed, np.array(noise_seed, dtype=FLOAT)))
+        self.MAX_VEL = np.concatenate((self.MAX_VEL, max_vel))
+        self.guide_index = np.concatenate((self.guide_index, guide_index))
+        self.guide_param = np.concatenate((self.guide_param, self.guide_path.arc[guide_index]))
+        self.direction = np.concatenate((self.direction, direction))
+        self.behaviour = np.concatenate((self.behaviour, np.full(particles_number, 0.6)))
+        self.active = np.concatenate((self.active, np.ones(particles_number, dtype=bool)))
+        self.ids = np.concatenate((self.ids, ids))
+        self.age = np.concatenate((self.age, np.zeros(particles_number, dtype=np.int64)))
+        self.lifetime = np.concatenate((self.lifetime, np.array(lifetime, dtype=np.int64)))
+        self.next_id += particles_number
+
+    def draw_particles(self, particles_number, guide_indices):
+        '''
+        Starting state of new ants, drawn in the exact order of
+        fourmis.Particle so a seeded run starts from the same colony
+        '''
+        velocity, noise_seed = [], []
+        max_vel, guide_index, direction, lifetime = [], [], [], []
+        targ_vel = 0.005 * self.scale
+        for p in range(particles_number):
+            ind = randint(1, len(self.guide_points)-2) if guide_indices is None else guide_indices[p]
+            vel = gauss(targ_vel, targ_vel / 10)
+            velocity.append(noise.random_unit_vector() * vel)
+            noise_seed.append(noise.random_unit_vector())
+            direction.append(randint(0,1)*2-1)
+            max_vel.append(vel)
+            guide_index.append(ind)
+            lifetime.append(self.lifecycle.draw_lifetime() if self.lifecycle else 0)
+        return np.array(guide_index, dtype=np.int64), max_vel, velocity, noise_seed, direction, lifetime
+
+    def draw_particle_streams(self, ids, guide_indices):
+        '''Starting state of new ants from their own streams, birth draws use frame 0'''
+        streams = self.streams
+        targ_vel = 0.005 * self.scale
+        if guide_indices is None:
+            guide_index = streams.integers(ids, 0, 'guide vertex', 1, len(self.guide_points)-2)
+        else:
+            guide_index = np.asarray(guide_indices, dtype=np.int64)
+        max_vel = streams.normal(ids, 0, 'speed', targ_vel, targ_vel / 10)
+        velocity = streams.unit_vectors(ids, 0, 'velocity') * max_vel[:, None]
+        noise_seed = streams.unit_vectors(ids, 0, 'noise seed')
+        direction = streams.integers(ids, 0, 'direction', 0, 1) * 2 - 1
+        if self.lifecycle is not None:
+            lifetime = self.lifecycle.lifetimes(streams.normal(ids, 0, 'lifetime'))
+        else:
+            lifetime = np.zeros(len(ids), dtype=np.int64)
+        return guide_index, max_vel, velocity, noise_seed, direction, lifetime
+
+    def kill_index(self, index):
+        self.kill_particles([index])
+
+    def kill_particles(self, indices):
+        '''Move the last ant into each dead one's row, the same order as fourmis'''
+        count = len(self)
+        for i in swap_remove_order(indices):
+            count -= 1
+            if i != count:
+                for attr in STATE:
+                    array = getattr(self, attr)
+                    array[i] = array[count]
+        for attr in STATE:
+            setattr(self, attr, getattr(self, attr)[:count])
+
+    def get_state(self):
+        '''Copy of the simulation state, see checkpoint'''
+        state = dict((attr, getattr(self, attr).copy()) for attr in STATE)
+        state['frame'] = self.frame
+        state['next_id'] = self.next_id
+        return state
+
+    def set_state(self, state):
+        for attr in STATE:
+            if attr in state:
+                setattr(self, attr, np.array(state[attr], dtype=getattr(self, attr).dtype))
+        self.frame = int(state['frame'])
+        self.next_id = int(state.get('next_id', len(self)))
+
+    def create_tree(self):
+        '''Refresh the neighbour grid, only ants that changed cell move in it'''
+        self.grid.update(self.location)
+
+    def guide_vectors(self, location, act):
+        '''Unit vectors towards each ant's guide target'''
+        if self.guide_mode == 'ARC':
+            target = self.guide_path.point_at(self.guide_param[act]).astype(FLOAT)
+        else:
+            target = self.guide_points[self.guide_index[act]]
+        return normalized(target - location) * FLOAT(self.GUIDE_STRENGTH)
+
+    def turbulence(self, location, noise_seed):
+        '''Turbulence vectors, exact per ant or interpolated from a baked lattice'''
+        samples = noise_seed + location
+        if self.turbulence_spacing:
+            self.cover_turbulence(samples)
+            return self.turbulence_field.sample(samples)
+
+        turbulence = np.empty_like(samples)
+        for i, co in enumerate(samples):
+            turbulence[i] = noise_field.turbulence(co, self.TURBULENCE_STRENGTH, self.TURBULENCE_FREQUENCY)
+        return turbulence
+
+    def cover_turbulence(self, samples):
+        '''Bake a new lattice if the current one misses some of the samples'''
+        if self.turbulence_field is None or not self.turbulence_field.contains(samples):
+            self.turbulence_field = self.turbulence_lattice(samples)
+
+    def turbulence_lattice(self, samples):
+        '''
+        Lattice over the ground, widened by the unit noise seeds, and in z
+        over the samples with about a hundred frames of seed drift ahead
+        and the ground's relief below, for ants walking down a slope
+        The z window moves up with the seeds instead of growing from the
+        ground, every rebuild has the same height as long as the samples
+        don't spread out, eg. ants born with fresh seeds among old ones
+        '''
+        corners = np.array([tuple(co) for co in self.ground.bound_box])
+        low, high = samples.min(axis=0), samples.max(axis=0)
+        bounds_min = np.minimum(corners.min(axis=0) - 1.0, low)
+        bounds_max = np.maximum(corners.max(axis=0) + 1.0, high)
+        # snapped to the lattice, the height is whole spacings of the relief,
+        # the spread and the drift
+        spacing = self.turbulence_spacing
+        relief = np.ceil((corners[:, 2].max() - corners[:, 2].min()) / spacing) + 1
+        bounds_min[2] = (np.floor(low[2] / spacing) - relief) * spacing
+        bounds_max[2] = bounds_min[2] + (relief + np.ceil((high[2] - low[2]) / spacing) + np.ceil(1.0 / spacing) + 1) * spacing
+        return noise_field.field(bounds_min, bounds_max, self.turbulence_spacing,
+                                 self.TURBULENCE_STRENGTH, self.TURBULENCE_FREQUENCY,
+                                 self.turbulence_cache)
+
+    def avoid_vectors(self, indices):
+        '''Boid-like repulsion from every close neighbour'''
+        return repulsion(self.location, self.grid)[indices] * FLOAT(self.AVOID_STRENGTH)
+
+    def limit_velocity(self, velocity, previous_velocity, max_vel, dt=1.0):
+        '''Drag and rotation limit, the rotation compounds over dt frames'''
+        length = np.sqrt((velocity * velocity).sum(axis=1))
+        too_fast = length > max_vel
+        velocity[too_fast] = set_length(velocity[too_fast], max_vel[too_fast])
+
+        rotation_scalar = (previous_velocity * velocity).sum(axis=1) * 0.5 + 0.5
+        rotation_scalar = np.minimum(rotation_scalar, 0.1)
+        if dt != 1.0:
+            rotation_scalar = 1.0 - (1.0 - rotation_scalar) ** dt
+        rotation_scalar = rotation_scalar.astype(FLOAT)[:, None]
+        velocity *= rotation_scalar
+        velocity += previous_velocity * (1-rotation_scalar)
+        return velocity
+
+    def project_on_ground(self, location):
+        '''Closest ground point and normal for each ant'''
+        return self.ground_projector.project(location)
+
+    def advance_guide(self, location, guide_index, direction):
+        '''Move on to the next guide vertex when the current one is reached'''
+        nearest = np.array([self.guide_tree.find(Vector(co))[1] for co in location], dtype=np.int64)
+        guide_index = guide_index + np.where(np.abs(nearest - guide_index) < 2, direction, 0)
+
+        # switch direction if end reached
+        end_reached = (guide_index >= len(self.guide_points)-1) | (guide_index == 1)
+        direction = np.where(end_reached, -direction, direction)
+        guide_index = guide_index + np.where(end_reached, direction, 0)
+        return guide_index, direction, end_reached
+
+    def advance_guide_arc(self, location, guide_param, direction):
+        '''
+        Keep the target a vertex spacing ahead of the ant's projection on
+        the guide, it never moves back, and turn around near the ends
+        '''
+        lookahead = self.guide_path.spacing
+        ahead = self.guide_path.project(location, guide_param) + direction * lookahead
+        guide_param = np.where(direction > 0, np.maximum(guide_param, ahead), np.minimum(guide_param, ahead))
+
+        end = self.guide_path.length - lookahead
+        end_reached = (guide_param >= end) | (guide_param <= lookahead)
+        direction = np.where(end_reached, -direction, direction)
+        guide_param = np.clip(guide_param, lookahead, end) + np.where(end_reached, direction * lookahead, 0.0)
+        return guide_param, direction, end_reached
+
+    def step(self, write=True):
+        '''Simulate next frame'''
+        self.frame += 1
+        integrator = self.integrator
+        if integrator is not None and not integrator.due(self.frame):
+            # between the states of a long step, nothing to simulate
+            self.finish_frame(write)
+            return
+
+        substeps, frames = (1, 1) if integrator is None else (integrator.substeps, integrator.frames_per_step)
+        profiler = self.profiler
+        profiler.start()
+        if integrator is not None:
+            integrator.begin(self)
+        if self.lifecycle is not None:
+            # a long step emits for all the frames it covers
+            for frame in range(self.frame, self.frame + frames):
+                self.lifecycle.emit(self, frame)
+            profiler.lap('lifecycle')
+
+        act = np.flatnonzero(self.active)
+        # behaviour change, one draw per ant in particle order, nothing else
+        # draws during the move so it can be done up front
+        if self.streams is None:
+            jitter = np.array([random() for i in act]) * 0.1 - 0.05
+        else:
+            jitter = self.streams.uniform(self.ids[act], self.frame, 'jitter') * 0.1 - 0.05
+        if integrator is not None:
+            # the same drift per frame, spread over the steps
+            jitter *= float(integrator.dt)
+
+        end_reached = np.zeros(len(act), dtype=bool)
+        for substep in range(substeps):
+            if self.tiles is None:
+                self.create_tree()
+                profiler.lap('tree build')
+                avoid_vector = self.avoid_vectors(act)
+                profiler.lap('avoidance')
+                end_reached |= self.move(act, avoid_vector, jitter, profiler)
+            else:
+                end_reached |= self.step_tiles(act, jitter)
+            if integrator is not None:
+                integrator.advance()
+                if substep < substeps - 1:
+                    integrator.record(self)
+
+        self.age[act] += frames
+        if self.lifecycle is not None:
+            dead = self.lifecycle.dead(self.age[act], self.lifetime[act], end_reached)
+            self.kill_particles(act[dead])
+            profiler.lap('lifecycle')
+        if integrator is not None:
+            integrator.record(self)
+            profiler.lap('integration')
+
+        self.finish_frame(write)
+
+    def finish_frame(self, write):
+        if self.integrator is not None:
+            # sub-frames go to a cache, also while the frame output waits for the main thread
+            self.integrator.frame_done(self.frame)
+        if write:
+            self.create_frame(self.frame)
+
+    def move(self, act, avoid_vector, jitter, profiler):
+        '''
+        Forces, ground snap and guide progress of the ants act, given their
+        repulsion. Only their own rows are read and written, so disjoint sets
+        of ants can move at the same time. Returns the ants that reached an
+        end of the guide
+        '''
+        location = self.location[act]
+        previous_velocity = self.velocity[act]
+        behaviour = self.behaviour[act][:, None]
+        # frames simulated by this step, forces and moves scale with it
+        dt = 1.0 if self.integrator is None else float(self.integrator.dt)
+
+        guide_vector = self.guide_vectors(location, act)
+        profiler.lap('guide')
+        turbulence = self.turbulence(location, self.noise_seed[act])
+        self.noise_seed[act, 2] += FLOAT(0.01 * dt)
+        profiler.lap('turbulence')
+
+        # velocity change
+        velocity = previous_velocity + avoid_vector * FLOAT(dt)
+        velocity += (turbulence * (1.0-behaviour) * dt).astype(FLOAT)
+        velocity += (guide_vector * behaviour * dt).astype(FLOAT)
+
+        velocity = self.limit_velocity(velocity, previous_velocity, self.MAX_VEL[act], dt)
+        profiler.lap('velocity limits')
+
+        # put it on the ground, velocity parallel to the ground
+        closest, normal = self.project_on_ground(location)
+        vel_norm = np.sqrt((velocity * velocity).sum(axis=1))
+        inter = np.cross(velocity, normal)
+        velocity = set_length(np.cross(normal, inter), vel_norm)
+
+        # set new location
+        self.location[act] = closest + velocity * FLOAT(dt)
+        self.velocity[act] = velocity
+        profiler.lap('ground snap')
+
+        self.behaviour[act] = np.clip(behaviour[:, 0] + jitter, 0.8, 0.9)
+
+        if self.guide_mode == 'ARC':
+            self.guide_param[act], self.direction[act], end_reached = self.advance_guide_arc(
+                self.location[act], self.guide_param[act], self.direction[act])
+        else:
+            self.guide_index[act], self.direction[act], end_reached = self.advance_guide(
+                self.location[act], self.guide_index[act], self.direction[act])
+        profiler.lap('guide')
+        return end_reached
+
+    def step_tiles(self, act, jitter):
+        '''
+        The move split over spatial tiles stepped by the worker pool
+        Every tile finds the neighbours of its own ants among its own and
+        halo ants, in the frame's starting positions, then moves its own.
+        Ants are assigned to tiles again every frame, so they migrate as they
+        cross tile borders. Results are identical to the serial step.
+        '''
+        profiler = self.profiler
+        # neighbours are read from the positions the frame starts with,
+        # other tiles write new ones meanwhile
+        location = self.location.copy()
+        if self.turbulence_spacing:
+            # one lattice for all tiles, baked before they start
+            self.cover_turbulence(self.noise_seed[act] + location[act])
+        tiles = self.tiles.split(location, self.AVOID_THRESHOLD)
+        profiler.lap('tiling')
+
+        jitter_per_ant = np.zeros(len(self))
+        jitter_per_ant[act] = jitter
+
+        def step_tile(tile):
+            members, owned = tile
+            grid = Spatial_grid(self.AVOID_THRESHOLD)
+            grid.update(location[members])
+            moving = owned & self.active[members]
+            avoid_vector = repulsion(location[members], grid)[moving] * FLOAT(self.AVOID_STRENGTH)
+            ants = members[moving]
+            return ants, self.move(ants, avoid_vector, jitter_per_ant[ants], No_profiler())
+
+        end_reached = np.zeros(len(self), dtype=bool)
+        for ants, ended in self.tiles.map(step_tile, tiles):
+            end_reached[ants] = ended
+        profiler.lap('tiles')
+        return end_reached[act]
+
+    def frame_arrays(self):
+        '''Flat location and velocity, and ids of the current frame, interpolated between long steps'''
+        if self.integrator is None:
+            return self.location.ravel(), self.velocity.ravel(), self.ids
+        ids, co, velocity = self.integrator.state_at(self.frame)
+        return co.ravel(), velocity.ravel(), ids
+
+    def create_frame(self, frame):
+        '''Write this frame's ants straight from the arrays'''
+        self.profiler.start()
+        self.writer.write(frame, *self.frame_arrays())
+        self.profiler.lap('frame output')
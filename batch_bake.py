@@ -0,0 +1,113 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import argparse
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from multiprocessing import cpu_count
+from time import time
+
+import frame_cache
+from compressed_cache import open_cache
+
+'''
+Parallel baking of independent colonies and seed variations
+Every (guide, seed) pair is baked by its own background Blender process
+running fourmis.py, to its own cache file, then all the caches are merged
+into one playable cache. Runs with a plain Python, no Blender needed:
+
+    python batch_bake.py shot.blend --guides Chemin,Chemin.001 --seeds 0-15 --jobs 32 --out cache/ -- --ants 5000 --frames 1-1500
+'''
+
+FOURMIS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fourmis.py')
+
+
+def parse_seeds(text):
+    '''"0-15" or a comma separated list "1,4,9"'''
+    if '-' in text:
+        start, end = text.split('-')
+        return list(range(int(start), int(end) + 1))
+    return [int(s) for s in text.split(',')]
+
+
+def job_name(guide, random_seed):
+    '''Cache file name of a job, object names may hold any character'''
+    guide = ''.join(c if c.isalnum() or c in '-_' else '_' for c in guide)
+    return '{}_seed{:03}'.format(guide or 'colony', random_seed)
+
+
+def bake_job(blender, blend, out, guide, random_seed, extra):
+    '''One background Blender, single threaded, writing out/<job>.cache'''
+    name = job_name(guide, random_seed)
+    command = [blender, '-b', blend, '-t', '1', '--python', FOURMIS, '--',
+               '--out', out, '--name', name, '--seed', str(random_seed)]
+    if guide:
+        command += ['--guide', guide]
+    command += extra
+
+    start = time()
+    with open(os.path.join(out, name + '.log'), 'w') as log:
+        returncode = subprocess.call(command, stdout=log, stderr=subprocess.STDOUT)
+    if returncode:
+        raise RuntimeError('{} failed, see {}.log'.format(name, os.path.join(out, name)))
+    print('{} baked in {:05.5f} seconds'.format(name, time() - start))
+    return os.path.join(out, name + '.cache')
+
+
+def main(argv):
+    if '--' in argv:
+        argv, extra = argv[:argv.index('--')], argv[argv.index('--')+1:]
+    else:
+        extra = []
+
+    parser = argparse.ArgumentParser(description='Bake colonies and seeds in parallel')
+    parser.add_argument('blend', help='.blend file holding the shot')
+    parser.add_argument('--blender', default='blender', help='Blender executable')
+    parser.add_argument('--guides', default='', help='comma separated guide objects, one colony each')
+    parser.add_argument('--seeds', type=parse_seeds, default=[0], help='eg. 0-15 or 1,4,9')
+    parser.add_argument('--jobs', type=int, default=cpu_count())
+    parser.add_argument('--out', default='cache')
+    parser.add_argument('--merged', default='colony.cache', help='merged cache name, in the output directory')
+    args = parser.parse_args(argv)
+
+    out = os.path.abspath(args.out)
+    if not os.path.isdir(out):
+        os.makedirs(out)
+    guides = args.guides.split(',') if args.guides else ['']
+    jobs = list(product(guides, args.seeds))
+
+    print('{} bakes on {} workers'.format(len(jobs), args.jobs))
+    start = time()
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(bake_job, args.blender, args.blend, out, guide, random_seed, extra)
+                   for guide, random_seed in jobs]
+        paths = [f.result() for f in futures]
+    baked = time() - start
+
+    merged = os.path.join(out, args.merged)
+    # the jobs may write compressed caches (--cache-error), the merge is raw
+    frame_cache.merge(paths, merged, open_cache)
+    print('Baked {} caches in {:05.5f} seconds, merged into {} in {:05.5f} seconds'.format(
+        len(paths), baked, merged, time() - start - baked))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
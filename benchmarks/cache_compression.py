@@ -0,0 +1,101 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import argparse
+import os
+import tempfile
+import numpy as np
+from time import time
+
+import simulation
+from compressed_cache import Compressed_cache_writer, Compressed_cache_reader
+from frame_cache import Frame_cache_writer, Frame_cache_reader
+
+'''
+Size and decode speed of the compressed cache against the raw frame cache
+A colony is baked once to a raw cache on the stand-ins, then encoded again
+at each error bound. Playback reads the frames in order, seeking reads them
+in a random order, both have to beat the frame rate:
+    python benchmarks/cache_compression.py --ants 20000 --frames 100 --errors 0.01,0.001,0.0001
+'''
+
+
+def bake(path, ants, frames):
+    a_ps = simulation.create('ARRAY_STREAMS', ants, 1.0)
+    a_ps.writer = Frame_cache_writer(path, 1, frames)
+    for f in range(frames):
+        a_ps.step()
+    a_ps.writer.close()
+    return a_ps.ground
+
+
+def decode(reader, frames):
+    start = time()
+    for f in frames:
+        reader.frame(f)
+    return len(frames) / (time() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Size and decode speed of the compressed cache')
+    parser.add_argument('--ants', type=int, default=20000)
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--errors', default='0.01,0.001,0.0001', help='error bounds, comma separated')
+    parser.add_argument('--keyframes', type=int, default=25)
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    raw_path = os.path.join(directory, 'raw.cache')
+    ground = bake(raw_path, args.ants, args.frames)
+    raw = Frame_cache_reader(raw_path)
+    frames = raw.frames()
+    bounds_min = np.array([tuple(co) for co in ground.bound_box]).min(axis=0)
+    shuffled = np.random.RandomState(0).permutation(frames)
+
+    print('{} ants x {} frames, raw cache {:.1f} MB, plays at {:.0f} fps, seeks at {:.0f} fps'.format(
+        args.ants, len(frames), os.path.getsize(raw_path) / 2**20, decode(raw, frames), decode(raw, shuffled)))
+    print('{:>10} {:>10} {:>8} {:>12} {:>12} {:>10} {:>10}'.format(
+        'error', 'MB', 'ratio', 'max error', 'vel error', 'play fps', 'seek fps'))
+    for error in [float(e) for e in args.errors.split(',')]:
+        path = os.path.join(directory, 'compressed.cache')
+        writer = Compressed_cache_writer(path, raw.frame_start, raw.frame_end, bounds_min, error, args.keyframes)
+        for f in frames:
+            writer.write(f, *raw.frame(f)[1:], ids=raw.frame(f)[0])
+        writer.close()
+
+        reader = Compressed_cache_reader(path)
+        position_error = velocity_error = 0.0
+        for f in frames:
+            ids, co, velocity = raw.frame(f)
+            decoded = reader.frame(f)
+            assert np.array_equal(ids, decoded[0])
+            position_error = max(position_error, float(np.abs(decoded[1] - co).max()))
+            speed = np.sqrt((velocity * velocity).sum(axis=1)).max()
+            velocity_error = max(velocity_error, float(np.abs(decoded[2] - velocity).max() / speed))
+        play = decode(Compressed_cache_reader(path), frames)
+        seek = decode(Compressed_cache_reader(path), shuffled)
+        size = os.path.getsize(path)
+        print('{:>10g} {:>10.2f} {:>8.1f} {:>12.2e} {:>12.2e} {:>10.0f} {:>10.0f}'.format(
+            error, size / 2**20, os.path.getsize(raw_path) / size, position_error, velocity_error, play, seek))
+        reader.close()
+        os.remove(path)
+    raw.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import sys
+import numpy as np
+from time import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spatial_grid import Spatial_grid
+
+'''
+Neighbour search benchmark: per-frame KDTree rebuild and find_range per ant
+against the uniform grid
+Run inside Blender for the KDTree column:
+    blender -b --python benchmarks/neighbours.py
+'''
+
+RADIUS = 0.01
+# ants per square unit, about what a dense trail looks like
+DENSITY = 20000.0
+
+
+def colony(number, rng):
+    side = np.sqrt(number / DENSITY)
+    positions = rng.random_sample((number, 3)) * (side, side, 0.0)
+    return positions.astype(np.float32)
+
+
+def kdtree_frame(positions):
+    from mathutils.kdtree import KDTree
+    start = time()
+    tree = KDTree(len(positions))
+    for i, co in enumerate(positions):
+        tree.insert(co, i)
+    tree.balance()
+    build = time() - start
+    pairs = 0
+    for co in positions:
+        pairs += len(tree.find_range(co, RADIUS))
+    # find_range returns every pair twice plus the ant itself
+    return build, time() - start - build, (pairs - len(positions)) // 2
+
+
+def grid_frame(grid, positions):
+    start = time()
+    grid.update(positions)
+    build = time() - start
+    first, second, distance = grid.pairs()
+    return build, time() - start - build, len(first)
+
+
+def main(counts=(1000, 10000, 100000)):
+    try:
+        import mathutils
+    except ImportError:
+        mathutils = None
+        print('mathutils not found, KDTree column skipped (run inside Blender)')
+
+    rng = np.random.RandomState(0)
+    print('{:>8} {:>24} {:>24} {:>24}'.format('ants', 'kdtree build/query', 'grid build/query', 'grid incremental'))
+    for number in counts:
+        positions = colony(number, rng)
+
+        if mathutils:
+            kd_build, kd_query, kd_pairs = kdtree_frame(positions)
+            kdtree = '{:10.4f} / {:10.4f}'.format(kd_build, kd_query)
+        else:
+            kdtree = '-'
+
+        grid = Spatial_grid(RADIUS)
+        build, query, pairs = grid_frame(grid, positions)
+        if mathutils and pairs != kd_pairs:
+            print('pair count mismatch: {} kdtree, {} grid'.format(kd_pairs, pairs))
+
+        # next frame, ants moved by about their walking speed
+        positions = positions + (rng.random_sample(positions.shape) - 0.5).astype(np.float32) * 0.005
+        positions[:, 2] = 0.0
+        inc_build, inc_query, inc_pairs = grid_frame(grid, positions)
+
+        print('{:>8} {:>24} {:>24} {:>24}'.format(
+            number, kdtree,
+            '{:10.4f} / {:10.4f}'.format(build, query),
+            '{:10.4f} / {:10.4f}'.format(inc_build, inc_query)))
+
+
+if __name__ == "__main__":
+    main()
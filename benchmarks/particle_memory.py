@@ -0,0 +1,73 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import sys
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if 'bpy' not in sys.modules:
+    sys.path.insert(0, os.path.join(HERE, 'standin'))
+sys.path.append(os.path.dirname(HERE))
+from mathutils import Vector
+
+import fourmis
+from particle_store import Particle_store
+
+'''
+Memory per ant of the Objects and Compact Objects engines
+Compact Objects is a memory option, it steps slower than Objects. Run inside
+Blender for the real mathutils Vectors, the stand-in ones are plain Python
+lists and much larger:
+    blender -b --python benchmarks/particle_memory.py
+    python benchmarks/particle_memory.py
+'''
+
+
+def measure(build, ants):
+    '''Bytes per ant still allocated after build(ants)'''
+    tracemalloc.start()
+    particles = build(ants)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del particles
+    return float(size) / ants
+
+
+def objects(ants):
+    return [fourmis.Particle(i, 1.0, Vector((i, 0.0, 0.0))) for i in range(ants)]
+
+
+def compact(ants):
+    particles = Particle_store(fourmis.COMPACT_FIELDS, ants)
+    for part in objects(ants):
+        particles.append(part)
+    return particles
+
+
+def main(ants=100000):
+    object_bytes = measure(objects, ants)
+    compact_bytes = measure(compact, ants)
+    print('{} ants'.format(ants))
+    print('{:>16} {:>12}'.format('engine', 'bytes/ant'))
+    print('{:>16} {:>12.1f}'.format('Objects', object_bytes))
+    print('{:>16} {:>12.1f}'.format('Compact Objects', compact_bytes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import sys
+import numpy as np
+from time import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reorder_curve_vertices import chain_order
+
+'''
+Chain ordering on shuffled chains, open, closed and in several strands
+Run inside Blender:
+    blender -b --python benchmarks/reorder_chains.py
+'''
+
+
+def shuffled_strands(lengths, closed, rng):
+    '''Edges of strands whose vertex indices and edge order are shuffled'''
+    total = sum(lengths)
+    labels = rng.permutation(total)
+    edges = []
+    offset = 0
+    for length in lengths:
+        chain = labels[offset:offset + length]
+        edges.append(np.stack((chain[:-1], chain[1:]), axis=1))
+        if closed:
+            edges.append(np.array([[chain[-1], chain[0]]]))
+        offset += length
+    edges = np.concatenate(edges)
+    edges = edges[rng.permutation(len(edges))]
+    return edges, total
+
+
+def check(strands, edges, total):
+    '''Every vertex once, every edge between consecutive vertices of a strand'''
+    order = np.concatenate([s for s, closed in strands])
+    assert np.array_equal(np.sort(order), np.arange(total))
+    linked = set()
+    for strand, closed in strands:
+        pairs = list(zip(strand[:-1], strand[1:]))
+        if closed:
+            pairs.append((strand[-1], strand[0]))
+        linked.update(frozenset(p) for p in pairs)
+    assert linked == set(frozenset(e) for e in edges.tolist())
+
+
+def main(sizes=(1000, 10000, 100000)):
+    rng = np.random.RandomState(0)
+    print('{:>8} {:>12} {:>12} {:>12}'.format('vertices', 'open s', 'closed s', '100 strands s'))
+    for size in sizes:
+        times = []
+        for lengths, closed in (([size], False), ([size], True), ([size // 100] * 100, False)):
+            edges, total = shuffled_strands(lengths, closed, rng)
+            start = time()
+            strands = chain_order(edges, total)
+            times.append(time() - start)
+            check(strands, edges, total)
+            assert len(strands) == len(lengths)
+        print('{:>8} {:>12.4f} {:>12.4f} {:>12.4f}'.format(size, *times))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import argparse
+import json
+import os
+import platform
+import sys
+import numpy as np
+from random import seed
+from time import time
+
+'''
+Simulation benchmark outside of Blender
+bpy and mathutils are replaced by the plain Python stand-ins in
+benchmarks/standin, the systems are stepped for a few frames at several
+particle counts and the time spent in each stage is written as JSON, to
+compare against a previous run:
+    python benchmarks/simulation.py --out before.json
+    python benchmarks/simulation.py --out after.json --compare before.json
+
+The stand-ins are not Blender: stages that call into mathutils (KDTree,
+turbulence, ground projection) are much slower than the real thing, the
+NumPy stages are representative. Compare runs with each other, not with
+timings printed in Blender.
+'''
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+if 'bpy' in sys.modules:
+    sys.exit('Run with a plain Python, the stand-ins cannot replace a loaded bpy')
+sys.path.insert(0, os.path.join(HERE, 'standin'))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import bpy
+from mathutils import noise
+from mathutils.kdtree import KDTree
+
+import fourmis
+import noise_field
+import particle_system_template
+
+# name: (system, options for the Ant_system)
+ENGINES = {
+    'OBJECT': ('OBJECT', {}),
+    'COMPACT': ('COMPACT', {}),
+    'ARRAY': ('ARRAY', {}),
+    # every stage in NumPy
+    'ARRAY_BAKED': ('ARRAY', {'heightfield': True, 'turbulence_spacing': 0.1, 'guide_mode': 'ARC'}),
+    # and the random draws
+    'ARRAY_STREAMS': ('ARRAY', {'heightfield': True, 'turbulence_spacing': 0.1, 'guide_mode': 'ARC', 'stream_seed': 0}),
+    'TEMPLATE': ('TEMPLATE', {}),
+    }
+
+# stage: (owner, attribute) timed for each system, the owner is the system
+# itself when None
+STAGES = {
+    'OBJECT': {
+        'tree build': (None, 'create_tree'),
+        'neighbour query': (KDTree, 'find_range'),
+        'guide': (KDTree, 'find'),
+        'turbulence': (noise, 'turbulence_vector'),
+        'ground projection': (bpy.Object, 'closest_point_on_mesh'),
+        'frame write': (None, 'create_frame'),
+        },
+    'ARRAY': {
+        'tree build': (None, 'create_tree'),
+        'neighbour query': (None, 'avoid_vectors'),
+        'guide': (None, 'guide_vectors'),
+        'turbulence': (None, 'turbulence'),
+        'ground projection': (None, 'project_on_ground'),
+        'frame write': (None, 'create_frame'),
+        },
+    'TEMPLATE': {
+        'frame write': (None, 'create_frame'),
+        },
+    }
+STAGES['COMPACT'] = STAGES['OBJECT']
+
+
+MISSING = object()
+
+
+class Stage_timer:
+    '''Wraps functions to add up their time and calls, restore() puts them back'''
+
+
+    def __init__(self):
+        self.stages = {}
+        self.wrapped = []
+
+    def wrap(self, owner, attribute, stage):
+        function = getattr(owner, attribute)
+        totals = self.stages.setdefault(stage, [0.0, 0])
+
+        def timed(*args, **kwargs):
+            start = time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                totals[0] += time() - start
+                totals[1] += 1
+
+        # what the owner itself holds, methods and stand-in functions live on the class or module
+        self.wrapped.append((owner, attribute, vars(owner).get(attribute, MISSING)))
+        setattr(owner, attribute, timed)
+
+    def restore(self):
+        for owner, attribute, previous in reversed(self.wrapped):
+            if previous is MISSING:
+                delattr(owner, attribute)
+            else:
+                setattr(owner, attribute, previous)
+        self.wrapped = []
+
+    def result(self):
+        return dict((stage, {'seconds': seconds, 'calls': calls})
+                    for stage, (seconds, calls) in self.stages.items())
+
+
+def make_scene():
+    bpy.reset()
+    scene = bpy.context.scene
+    guide = bpy.guide('Chemin')
+    ground = bpy.ground('Sol')
+    instance = bpy.data.objects.new('Fleche', bpy.data.meshes.new('Fleche'))
+    scene.ant_instance = instance.name
+    scene.particle_simulation_settings = bpy.types.PropertyGroup()
+    scene.particle_simulation_settings.instance = 'Icosphere'
+    return guide, ground
+
+
+def create(name, ants, scale, **extra):
+    '''System of the engine name with ants particles, extra overrides its options'''
+    system, options = ENGINES[name]
+    options = dict(options, **extra)
+    seed(0)
+    noise.seed_set(0)
+    guide, ground = make_scene()
+    if system == 'TEMPLATE':
+        a_ps = particle_system_template.Particle_system()
+        a_ps.add_particle(ants)
+    else:
+        a_ps = fourmis.create_system(system, guide, ground, scale, **options)
+        a_ps.add_particles(ants)
+        if options.get('turbulence_spacing'):
+            # the lattice is baked as part of the setup, not in the first step
+            noise_field.clear()
+            a_ps.turbulence_field = a_ps.turbulence_lattice(a_ps.noise_seed + a_ps.location)
+    return a_ps
+
+
+def run(name, ants, frames, scale=1.0):
+    '''Setup, frames steps and writer close of one system, timed by stage'''
+    start = time()
+    a_ps = create(name, ants, scale)
+    setup = time() - start
+
+    system = ENGINES[name][0]
+    timer = Stage_timer()
+    for stage, (owner, attribute) in STAGES[system].items():
+        timer.wrap(a_ps if owner is None else owner, attribute, stage)
+    try:
+        start = time()
+        for f in range(frames):
+            a_ps.step()
+        steps = time() - start
+    finally:
+        timer.restore()
+
+    start = time()
+    a_ps.writer.close()
+    close = time() - start
+
+    return {
+        'engine': name,
+        'ants': ants,
+        'frames': frames,
+        'setup': setup,
+        'steps': steps,
+        'per_frame': steps / frames,
+        'close': close,
+        'stages': timer.result(),
+        }
+
+
+def print_run(result, baseline=None):
+    print('{engine} {ants} ants: setup {setup:.3f} s, {per_frame:.4f} s per frame, close {close:.3f} s'.format(**result))
+    for stage, timing in sorted(result['stages'].items(), key=lambda item: -item[1]['seconds']):
+        line = '    {:<18} {:>10.4f} s {:>9} calls'.format(stage, timing['seconds'], timing['calls'])
+        if baseline and stage in baseline['stages'] and baseline['stages'][stage]['seconds']:
+            line += '  x{:.2f}'.format(timing['seconds'] / baseline['stages'][stage]['seconds'])
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the particle systems on stand-in bpy and mathutils')
+    parser.add_argument('--counts', default='100,1000,10000,100000',
+                        help='Particle counts, comma separated')
+    parser.add_argument('--engines', default='ARRAY,ARRAY_BAKED,ARRAY_STREAMS,OBJECT,COMPACT,TEMPLATE',
+                        help='Comma separated, among ' + ', '.join(sorted(ENGINES)))
+    parser.add_argument('--frames', type=int, default=5)
+    parser.add_argument('--object-limit', type=int, default=10000,
+                        help='Skip the per-particle Python engines above this many particles')
+    parser.add_argument('--out', help='JSON file for the results')
+    parser.add_argument('--compare', help='JSON results of a previous run, prints the time ratio per stage')
+    args = parser.parse_args(argv)
+
+    baselines = {}
+    if args.compare:
+        with open(args.compare) as f:
+            for result in json.load(f)['runs']:
+                baselines[(result['engine'], result['ants'])] = result
+
+    runs = []
+    for ants in [int(n) for n in args.counts.split(',')]:
+        for name in args.engines.split(','):
+            if ENGINES[name][0] != 'ARRAY' and ants > args.object_limit:
+                continue
+            result = run(name, ants, args.frames)
+            print_run(result, baselines.get((name, ants)))
+            runs.append(result)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'machine': platform.machine(),
+                'runs': runs,
+                }, f, indent=1, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,524 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import sys
+import types as _types
+import numpy as np
+from math import sin, cos
+
+from mathutils import Vector
+
+'''
+Plain Python stand-in for the parts of bpy the simulations touch
+Enough to build and step the particle systems and run the frame writers
+outside of Blender, vertices are kept in NumPy arrays so writing 100k
+particles stays cheap. Properties and UI registration do nothing.
+'''
+
+
+class _Props:
+    '''bpy.props, every property is None until set on the scene'''
+
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+props = _Props()
+
+
+class _Registrable:
+    pass
+
+
+types = _types.SimpleNamespace(Panel=_Registrable, Operator=_Registrable,
+                               PropertyGroup=_Registrable, Scene=_Registrable)
+utils = _types.SimpleNamespace(register_module=lambda *a: None, unregister_module=lambda *a: None,
+                               register_class=lambda *a: None, unregister_class=lambda *a: None)
+
+app = _types.ModuleType('bpy.app')
+app.handlers = _types.ModuleType('bpy.app.handlers')
+app.handlers.persistent = lambda f: f
+app.handlers.frame_change_pre = []
+app.handlers.frame_change_post = []
+sys.modules['bpy.app'] = app
+sys.modules['bpy.app.handlers'] = app.handlers
+
+
+class _Vertex:
+
+
+    def __init__(self, vertices, index):
+        self._vertices = vertices
+        self.index = index
+
+    co = property(lambda self: Vector(self._vertices.co[self.index]),
+                  lambda self, value: self._vertices.co.__setitem__(self.index, tuple(value)))
+    normal = property(lambda self: Vector(self._vertices.normal[self.index]),
+                      lambda self, value: self._vertices.normal.__setitem__(self.index, tuple(value)))
+    select = property(lambda self: bool(self._vertices.select[self.index]),
+                      lambda self, value: self._vertices.select.__setitem__(self.index, value))
+
+
+class _Vertices:
+
+
+    def __init__(self):
+        self.co = np.zeros((0, 3), dtype=np.float32)
+        self.normal = np.zeros((0, 3), dtype=np.float32)
+        self.select = np.zeros(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.co)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return _Vertex(self, index)
+
+    def __iter__(self):
+        return (_Vertex(self, i) for i in range(len(self)))
+
+    def add(self, count):
+        self.co = np.concatenate((self.co, np.zeros((count, 3), dtype=np.float32)))
+        self.normal = np.concatenate((self.normal, np.zeros((count, 3), dtype=np.float32)))
+        self.select = np.concatenate((self.select, np.zeros(count, dtype=bool)))
+
+    def foreach_set(self, attr, seq):
+        target = getattr(self, attr)
+        target.flat[:] = np.asarray(seq, dtype=target.dtype).ravel()
+
+    def foreach_get(self, attr, seq):
+        seq[:] = getattr(self, attr).ravel()
+
+
+class _Edges(list):
+
+
+    def add(self, count):
+        self.extend([0, 0] for i in range(count))
+
+    def foreach_get(self, attr, seq):
+        seq[:] = [i for edge in self for i in edge]
+
+
+class _ID:
+    '''Custom properties and user count of a datablock'''
+
+
+    users = 0
+
+    def __getitem__(self, key):
+        return self._properties[key]
+
+    def __setitem__(self, key, value):
+        self._properties[key] = value
+
+    def __contains__(self, key):
+        return key in self._properties
+
+    def get(self, key, default=None):
+        return self._properties.get(key, default)
+
+
+class _Int_layer_data:
+
+
+    def __init__(self, vertices):
+        self.value = np.zeros(len(vertices), dtype=np.int32)
+
+    def foreach_set(self, attr, seq):
+        getattr(self, attr)[:] = np.asarray(seq).ravel()
+
+    def foreach_get(self, attr, seq):
+        seq[:] = getattr(self, attr)
+
+
+class _Int_layers(dict):
+
+
+    def __init__(self, mesh):
+        self.mesh = mesh
+
+    def new(self, name=''):
+        layer = _types.SimpleNamespace(name=name, data=_Int_layer_data(self.mesh.vertices))
+        self[name] = layer
+        return layer
+
+
+class Mesh(_ID):
+
+
+    def __init__(self, name):
+        self.name = name
+        self._properties = {}
+        self.vertices = _Vertices()
+        self.edges = _Edges()
+        self.polygons = []
+        self.vertex_layers_int = _Int_layers(self)
+
+    def from_pydata(self, vertices, edges, faces):
+        self.vertices = _Vertices()
+        self.vertices.add(len(vertices))
+        self.vertices.foreach_set('co', np.asarray(vertices, dtype=np.float32).ravel())
+        self.edges = _Edges(list(edge) for edge in edges)
+        self.polygons = list(faces)
+
+    def update(self, *args, **kwargs):
+        pass
+
+
+class _Keyframes(list):
+
+
+    def add(self, count):
+        self.extend(_types.SimpleNamespace(co=(0.0, 0.0), interpolation='BEZIER') for i in range(count))
+
+    def foreach_set(self, attr, seq):
+        for i, key in enumerate(self):
+            setattr(key, attr, tuple(seq[2*i:2*i+2]))
+
+
+class _Fcurve:
+
+
+    def __init__(self, data_path, index=0):
+        self.data_path = data_path
+        self.array_index = index
+        self.keyframe_points = _Keyframes()
+
+    def update(self):
+        pass
+
+
+class _Fcurves(list):
+
+
+    def new(self, data_path, index=0, action_group=''):
+        fcurve = _Fcurve(data_path, index)
+        self.append(fcurve)
+        return fcurve
+
+
+class Action(_ID):
+
+
+    def __init__(self, name):
+        self.name = name
+        self.fcurves = _Fcurves()
+        self._properties = {}
+
+
+def _swap_user(old, new):
+    if old is not None:
+        old.users -= 1
+    if new is not None:
+        new.users += 1
+
+
+class _Animation_data:
+
+
+    def __init__(self):
+        self._action = None
+
+    @property
+    def action(self):
+        return self._action
+
+    @action.setter
+    def action(self, action):
+        _swap_user(self._action, action)
+        self._action = action
+
+
+class Camera(_ID):
+    '''Perspective or orthographic camera data, 16:9 frame'''
+
+
+    aspect = 9.0 / 16.0
+
+    def __init__(self, name, angle=0.8):
+        self.name = name
+        self._properties = {}
+        self.type = 'PERSP'
+        self.angle = angle
+        self.ortho_scale = 6.0
+        self.clip_start = 0.1
+        self.clip_end = 100.0
+        self.animation_data = None
+
+    def view_frame(self, scene=None):
+        '''Frame corners in camera space, at a depth of one for perspective'''
+        if self.type == 'ORTHO':
+            x, z = self.ortho_scale / 2.0, -1.0
+        else:
+            x, z = np.tan(self.angle / 2.0), -1.0
+        y = x * self.aspect
+        return [Vector((x, y, z)), Vector((x, -y, z)), Vector((-x, -y, z)), Vector((-x, y, z))]
+
+
+class Object(_ID):
+
+
+    def __init__(self, name, data=None):
+        self.name = name
+        self._data = None
+        self.data = data
+        self.parent = None
+        self.matrix_world = np.identity(4).tolist()
+        self.constraints = []
+        self.hide = False
+        self.hide_render = False
+        self.modifiers = []
+        self.animation_data = None
+        self._properties = {}
+        # scenes and groups the object is linked in
+        self._linked = []
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        _swap_user(self._data, data)
+        self._data = data
+
+    @property
+    def users_scene(self):
+        return [owner for owner in self._linked if isinstance(owner, _Scene)]
+
+    @property
+    def bound_box(self):
+        co = self.data.vertices.co if len(self.data.vertices) else np.zeros((1, 3))
+        low, high = co.min(axis=0), co.max(axis=0)
+        return [(x, y, z) for x in (low[0], high[0]) for y in (low[1], high[1]) for z in (low[2], high[2])]
+
+    def animation_data_create(self):
+        if self.animation_data is None:
+            self.animation_data = _Animation_data()
+        return self.animation_data
+
+    def keyframe_insert(self, *args, **kwargs):
+        pass
+
+    def user_clear(self):
+        pass
+
+    def closest_point_on_mesh(self, co, distance=1.84467e19):
+        '''Vertical projection on the object's height function, see ground()'''
+        height = getattr(self, 'height', None)
+        if height is None:
+            return Vector((co[0], co[1], 0.0)), Vector((0.0, 0.0, 1.0)), 0
+        z, dx, dy = height(co[0], co[1])
+        return Vector((co[0], co[1], z)), Vector((-dx, -dy, 1.0)).normalized(), 0
+
+
+class _Collection:
+
+
+    def __init__(self, new):
+        self._new = new
+        self._items = {}
+
+    def __getitem__(self, name):
+        return self._items[name]
+
+    def __contains__(self, name):
+        return name in self._items
+
+    def __iter__(self):
+        return iter(list(self._items.values()))
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, name, default=None):
+        return self._items.get(name, default)
+
+    def new(self, name, *args):
+        # unique names like Blender, name.001
+        unique, n = name, 0
+        while unique in self._items:
+            n += 1
+            unique = '{}.{:03}'.format(name, n)
+        item = self._new(unique, *args)
+        self._items[unique] = item
+        return item
+
+    def remove(self, item, *args, **kwargs):
+        if isinstance(item, Object) and item._linked:
+            # Blender 2.7x refuses, or leaves dangling links with user_clear
+            raise RuntimeError('Error: Object "{}" must have zero users to be removed, found {}'.format(
+                item.name, len(item._linked)))
+        self._items.pop(item.name, None)
+        if isinstance(item, Object):
+            item.data = None
+            if item.animation_data is not None:
+                item.animation_data.action = None
+
+    def clear(self):
+        self._items.clear()
+
+
+class _Group:
+
+
+    def __init__(self, name):
+        self.name = name
+        self.objects = _SceneObjects(self)
+
+
+class _Data:
+
+
+    def __init__(self):
+        self.objects = _Collection(Object)
+        self.meshes = _Collection(Mesh)
+        self.actions = _Collection(Action)
+        self.groups = _Collection(_Group)
+        self.cameras = _Collection(Camera)
+        self.filepath = ''
+
+data = _Data()
+
+
+class _SceneObjects:
+    '''Objects of a scene or group, in link order'''
+
+
+    def __init__(self, owner):
+        self.owner = owner
+        self._objects = {}
+
+    def __iter__(self):
+        return iter(list(self._objects.values()))
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __contains__(self, obj):
+        return id(obj) in self._objects
+
+    def link(self, obj):
+        if id(obj) not in self._objects:
+            self._objects[id(obj)] = obj
+            obj._linked.append(self.owner)
+
+    def unlink(self, obj):
+        del self._objects[id(obj)]
+        obj._linked.remove(self.owner)
+
+    def clear(self):
+        for obj in self:
+            self.unlink(obj)
+
+
+class _Scene:
+
+
+    def __init__(self):
+        self.objects = _SceneObjects(self)
+        self.frame_current = 1
+        self.frame_subframe = 0.0
+        self.camera = None
+
+    def frame_set(self, frame, subframe=0.0):
+        self.frame_current = frame
+        self.frame_subframe = subframe
+
+
+context = _types.SimpleNamespace(scene=_Scene(), mode='OBJECT', object=None)
+
+
+def _abspath(path):
+    # blend relative paths resolve against the working directory
+    return os.path.abspath(path[2:]) if path.startswith('//') else path
+
+path = _types.SimpleNamespace(abspath=_abspath)
+
+
+def _primitive_ico_sphere_add(location=(0.0, 0.0, 0.0), **kwargs):
+    obj = data.objects.new('Icosphere', data.meshes.new('Icosphere'))
+    context.scene.objects.link(obj)
+    context.object = obj
+    return {'FINISHED'}
+
+ops = _types.SimpleNamespace(mesh=_types.SimpleNamespace(primitive_ico_sphere_add=_primitive_ico_sphere_add))
+
+
+def reset():
+    '''Empty the data and the scene between benchmark runs'''
+    data.__init__()
+    context.scene.objects.clear()
+    context.scene.camera = None
+    context.object = None
+
+
+def ground(name, size=8.0, resolution=64, amplitude=0.2):
+    '''
+    Gentle hills as a regular grid mesh, its closest_point_on_mesh projects
+    vertically on the same analytic surface
+    '''
+    def height(x, y):
+        return (amplitude * sin(x) * cos(y),
+                amplitude * cos(x) * cos(y),
+                -amplitude * sin(x) * sin(y))
+
+    axis = np.linspace(-size / 2, size / 2, resolution)
+    x, y = np.meshgrid(axis, axis, indexing='ij')
+    co = np.stack((x, y, amplitude * np.sin(x) * np.cos(y)), axis=-1).reshape(-1, 3)
+
+    mesh = data.meshes.new(name)
+    mesh.vertices.add(len(co))
+    mesh.vertices.foreach_set('co', co.ravel())
+    obj = data.objects.new(name, mesh)
+    obj.height = height
+    context.scene.objects.link(obj)
+    return obj
+
+
+def guide(name, vertex_count=200, length=6.0):
+    '''A wavy edge-only curve along x'''
+    t = np.linspace(0.0, length, vertex_count)
+    co = np.stack((t - length / 2, 0.3 * np.sin(2 * t), np.zeros_like(t)), axis=1)
+    mesh = data.meshes.new(name)
+    mesh.from_pydata(co.tolist(), [(i, i+1) for i in range(vertex_count - 1)], [])
+    obj = data.objects.new(name, mesh)
+    context.scene.objects.link(obj)
+    return obj
+
+
+def camera(name, location, target=(0.0, 0.0, 0.0), angle=0.8):
+    '''Scene camera at location looking at target, z up'''
+    location = np.asarray(location, dtype=np.float64)
+    forward = np.asarray(target, dtype=np.float64) - location
+    forward /= np.sqrt((forward * forward).sum())
+    x = np.cross(forward, (0.0, 0.0, 1.0))
+    x /= np.sqrt((x * x).sum())
+    y = np.cross(x, forward)
+    matrix = np.identity(4)
+    matrix[:3, 0], matrix[:3, 1], matrix[:3, 2], matrix[:3, 3] = x, y, -forward, location
+
+    obj = data.objects.new(name, data.cameras.new(name, angle))
+    obj.matrix_world = matrix.tolist()
+    context.scene.objects.link(obj)
+    context.scene.camera = obj
+    return obj
@@ -0,0 +1,120 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from math import sqrt
+
+'''
+Plain Python stand-in for the parts of mathutils the simulations use, so the
+benchmarks run outside of Blender. Same API, not the same numbers.
+'''
+
+
+class Vector:
+    __slots__ = ('_v',)
+
+
+    def __init__(self, seq=(0.0, 0.0, 0.0)):
+        self._v = [float(c) for c in seq]
+
+    def copy(self):
+        return Vector(self._v)
+
+    def __len__(self):
+        return len(self._v)
+
+    def __iter__(self):
+        return iter(self._v)
+
+    def __getitem__(self, i):
+        return self._v[i]
+
+    def __setitem__(self, i, value):
+        self._v[i] = float(value)
+
+    def __repr__(self):
+        return 'Vector({!r})'.format(tuple(self._v))
+
+    x = property(lambda self: self._v[0], lambda self, value: self.__setitem__(0, value))
+    y = property(lambda self: self._v[1], lambda self, value: self.__setitem__(1, value))
+    z = property(lambda self: self._v[2], lambda self, value: self.__setitem__(2, value))
+
+    def __add__(self, other):
+        return Vector([a + b for a, b in zip(self._v, other)])
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Vector([a - b for a, b in zip(self._v, other)])
+
+    def __rsub__(self, other):
+        return Vector([b - a for a, b in zip(self._v, other)])
+
+    def __mul__(self, k):
+        return Vector([a * k for a in self._v])
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, k):
+        return Vector([a / k for a in self._v])
+
+    def __neg__(self):
+        return Vector([-a for a in self._v])
+
+    def __iadd__(self, other):
+        self._v = [a + b for a, b in zip(self._v, other)]
+        return self
+
+    def __isub__(self, other):
+        self._v = [a - b for a, b in zip(self._v, other)]
+        return self
+
+    def __imul__(self, k):
+        self._v = [a * k for a in self._v]
+        return self
+
+    def __itruediv__(self, k):
+        self._v = [a / k for a in self._v]
+        return self
+
+    def dot(self, other):
+        return sum(a * b for a, b in zip(self._v, other))
+
+    def cross(self, other):
+        a, b = self._v, list(other)
+        return Vector((a[1]*b[2] - a[2]*b[1], a[2]*b[0] - a[0]*b[2], a[0]*b[1] - a[1]*b[0]))
+
+    @property
+    def length_squared(self):
+        return self.dot(self._v)
+
+    def _get_length(self):
+        return sqrt(self.dot(self._v))
+
+    def _set_length(self, value):
+        length = self._get_length()
+        if length:
+            self._v = [a * value / length for a in self._v]
+
+    length = property(_get_length, _set_length)
+
+    def normalized(self):
+        length = self._get_length()
+        return Vector([a / length for a in self._v]) if length else Vector(self._v)
+
+    def normalize(self):
+        self._v = list(self.normalized())
@@ -0,0 +1,36 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+'''
+mathutils.bvhtree stand-in, answers from the stand-in object's analytic ground
+'''
+
+
+class BVHTree:
+
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    @classmethod
+    def FromObject(cls, obj, scene, deform=True, render=False, cage=False, epsilon=0.0):
+        return cls(obj)
+
+    def find_nearest(self, co, distance=1.84467e19):
+        location, normal, index = self.obj.closest_point_on_mesh(co)
+        return location, normal, index, (location - co).length
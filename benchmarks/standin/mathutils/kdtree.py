@@ -0,0 +1,75 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import numpy as np
+
+from . import Vector
+
+'''
+mathutils.kdtree stand-in over NumPy arrays
+find is brute force, find_range buckets the points in cells the size of the
+radius, built on the first query for that radius
+'''
+
+
+class KDTree:
+
+
+    def __init__(self, size):
+        self.size = size
+        self.points = []
+        self.indices = []
+        self.cells = {}
+
+    def insert(self, co, index):
+        self.points.append(tuple(co))
+        self.indices.append(index)
+
+    def balance(self):
+        self.co = np.array(self.points, dtype=np.float64).reshape(-1, 3)
+        self.index = np.array(self.indices, dtype=np.int64)
+        self.cells = {}
+
+    def find(self, co):
+        distance = ((self.co - tuple(co)) ** 2).sum(axis=1)
+        i = int(np.argmin(distance))
+        return Vector(self.co[i]), int(self.index[i]), float(np.sqrt(distance[i]))
+
+    def bucket(self, radius):
+        if radius not in self.cells:
+            keys = np.floor(self.co / radius).astype(np.int64)
+            order = np.lexsort(keys.T[::-1])
+            buckets = {}
+            for key, i in zip(map(tuple, keys[order].tolist()), order.tolist()):
+                buckets.setdefault(key, []).append(i)
+            self.cells[radius] = dict((k, np.array(v)) for k, v in buckets.items())
+        return self.cells[radius]
+
+    def find_range(self, co, radius):
+        buckets = self.bucket(radius)
+        x, y, z = (int(np.floor(c / radius)) for c in co)
+        near = [buckets[key] for key in
+                ((x+i, y+j, z+k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1))
+                if key in buckets]
+        if not near:
+            return []
+        near = np.concatenate(near)
+        distance = ((self.co[near] - tuple(co)) ** 2).sum(axis=1)
+        found = near[distance <= radius * radius]
+        distance = distance[distance <= radius * radius]
+        return [(Vector(self.co[i]), int(self.index[i]), float(np.sqrt(d))) for i, d in zip(found, distance)]
@@ -0,0 +1,58 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+from math import sin, cos, sqrt
+from random import Random
+
+from . import Vector
+
+'''
+mathutils.noise stand-in: its own random generator and a smooth
+trigonometric field in place of Perlin turbulence
+'''
+
+_random = Random(0)
+
+
+def seed_set(seed):
+    _random.seed(seed)
+
+
+def random_unit_vector():
+    while True:
+        v = [_random.uniform(-1.0, 1.0) for i in range(3)]
+        length = sqrt(v[0]*v[0] + v[1]*v[1] + v[2]*v[2])
+        if 0.0 < length <= 1.0:
+            return Vector([c / length for c in v])
+
+
+def _smooth(x, y, z, k):
+    return sin(1.7*x + 2.3*y + k) * cos(1.3*y - 0.7*z + 2*k) + 0.5 * sin(2.9*z + 0.3*x - k)
+
+
+def turbulence_vector(position, octaves, hard, noise_basis=0, amplitude_scale=0.5, frequency_scale=2.0):
+    x, y, z = position
+    out = [0.0, 0.0, 0.0]
+    amplitude, frequency = 1.0, 1.0
+    for o in range(octaves):
+        for k in range(3):
+            value = _smooth(x * frequency, y * frequency, z * frequency, k)
+            out[k] += amplitude * (abs(value) if hard else value)
+        amplitude *= amplitude_scale
+        frequency *= frequency_scale
+    return Vector(out)
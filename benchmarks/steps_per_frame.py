@@ -0,0 +1,69 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import argparse
+import numpy as np
+from time import time
+
+import simulation
+
+'''
+Cost and accuracy of the fixed time step
+One colony is stepped at several steps per frame on the stand-ins, every
+run is compared with the finest one: the mean and largest distance between
+the same ants at the last frame, and the time per output frame.
+    python benchmarks/steps_per_frame.py --ants 2000 --frames 50 --steps 0.25,0.5,1,2,4,8
+
+The turbulence lattice is baked by simulation.create, before the timer
+starts. A run that had to bake a new one while timed is marked, its time
+is mostly the bake.
+'''
+
+
+def run(ants, frames, steps_per_frame):
+    a_ps = simulation.create('ARRAY_STREAMS', ants, 1.0, steps_per_frame=steps_per_frame)
+    lattice = a_ps.turbulence_field
+    start = time()
+    for f in range(frames):
+        a_ps.step()
+    elapsed = time() - start
+    a_ps.writer.close()
+    co, velocity, ids = a_ps.frame_arrays()
+    return elapsed / frames, co.reshape(-1, 3)[np.argsort(ids)], a_ps.turbulence_field is not lattice
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cost and accuracy of the fixed time step')
+    parser.add_argument('--ants', type=int, default=2000)
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--steps', default='0.25,0.5,1,2,4,8', help='steps per frame, comma separated')
+    args = parser.parse_args(argv)
+
+    steps = sorted(float(s) for s in args.steps.split(','))
+    results = [run(args.ants, args.frames, s) for s in steps]
+    reference = results[-1][1]
+    print('{} ants x {} frames, compared with {} steps per frame'.format(args.ants, args.frames, steps[-1]))
+    print('{:>10} {:>12} {:>12} {:>12} {:>8}'.format('steps', 's/frame', 'mean dist', 'max dist', 'rebaked'))
+    for steps_per_frame, (per_frame, co, rebaked) in zip(steps, results):
+        distance = np.sqrt(((co - reference) ** 2).sum(axis=1))
+        print('{:>10g} {:>12.4f} {:>12.4f} {:>12.4f} {:>8}'.format(
+            steps_per_frame, per_frame, distance.mean(), distance.max(), str(rebaked)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import sys
+import numpy as np
+from time import time
+
+'''
+Teardown of a previous bake in scenes of growing size
+The name-prefix scan visits every object of the file, the output registry
+only the outputs it created. Runs outside of Blender on the stand-ins:
+    python benchmarks/teardown.py
+'''
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+if 'bpy' in sys.modules:
+    sys.exit('Run with a plain Python, the stand-ins cannot replace a loaded bpy')
+sys.path.insert(0, os.path.join(HERE, 'standin'))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import bpy
+from frame_writer import Frame_writer
+from output_registry import Output_registry
+
+
+def name_scan():
+    '''The removal fourmis used before the registry'''
+    for o in bpy.data.objects:
+        if o.name.startswith('generator') or o.name.startswith('Ico') or o.name.startswith('instance'):
+            o.user_clear()
+            bpy.context.scene.objects.unlink(o)
+            bpy.data.objects.remove(o)
+
+
+def populate(scene_objects, frames, registry):
+    '''Unrelated objects, then frames written as generator and instance objects'''
+    bpy.reset()
+    for i in range(scene_objects):
+        obj = bpy.data.objects.new('prop_{}'.format(i), bpy.data.meshes.new('prop_{}'.format(i)))
+        bpy.context.scene.objects.link(obj)
+    instance_mesh = bpy.data.meshes.new('instance')
+    writer = Frame_writer(instance_mesh, registry)
+    co = np.zeros(3 * 10, dtype=np.float32)
+    for frame in range(frames):
+        writer.write(frame, co, co)
+    writer.close()
+
+
+def main(scene_sizes=(0, 10000, 100000), frames=250):
+    print('{:>10} {:>8} {:>12} {:>14} {:>12} {:>16}'.format(
+        'scene', 'frames', 'scan s', 'scan orphans', 'registry s', 'registry orphans'))
+    for size in scene_sizes:
+        populate(size, frames, None)
+        start = time()
+        name_scan()
+        scan_time = time() - start
+        # meshes left behind, minus the scene's and the instance mesh
+        scan_orphans = len(bpy.data.meshes) - size - 1
+
+        registry = Output_registry('teardown')
+        populate(size, frames, registry)
+        start = time()
+        removed = registry.clear()
+        registry_time = time() - start
+        assert removed == 2 * frames and len(bpy.data.objects) == size
+        print('{:>10} {:>8} {:>12.4f} {:>14} {:>12.4f} {:>16}'.format(
+            size, frames, scan_time, scan_orphans, registry_time, len(bpy.data.meshes) - size - 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import argparse
+import numpy as np
+from time import time
+
+import simulation
+import ant_engine
+
+'''
+Strong scaling of the tiled parallel step
+One colony of a fixed size is stepped with 1 to 32 tile workers on the
+bpy and mathutils stand-ins, each run must end in the same state as the
+serial step, bit for bit:
+    python benchmarks/tile_scaling.py --ants 100000 --workers 1,2,4,8,16,32
+
+The tiles are threads, only the stages that spend their time in NumPy
+release the GIL and can scale: the grid repulsion, the velocity limits, and
+with ARRAY_STREAMS the height field ground, the turbulence lattice and the
+arc length guide. ARRAY calls the mathutils KDTree, BVH and noise once per
+ant, those stages hold the GIL and run one tile at a time.
+
+Setup is not timed: the turbulence lattice is baked by simulation.create
+and one step warms up the worker pool. A run that had to bake a new
+lattice while timed is marked, its time is not the scaling of the tiles.
+'''
+
+
+def run(engine, ants, frames, workers):
+    a_ps = simulation.create(engine, ants, 1.0, workers=workers)
+    a_ps.step(write=False)
+    lattice = a_ps.turbulence_field
+    start = time()
+    for f in range(frames):
+        a_ps.step(write=False)
+    seconds = (time() - start) / frames
+    rebaked = a_ps.turbulence_field is not lattice
+    if a_ps.tiles is not None:
+        a_ps.tiles.close()
+    return a_ps, seconds, rebaked
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Strong scaling of the tiled parallel step')
+    parser.add_argument('--ants', type=int, default=100000)
+    parser.add_argument('--frames', type=int, default=5)
+    parser.add_argument('--workers', default='1,2,4,8,16,32', help='worker counts, comma separated')
+    parser.add_argument('--engine', default='ARRAY_STREAMS', choices=('ARRAY', 'ARRAY_BAKED', 'ARRAY_STREAMS'))
+    args = parser.parse_args(argv)
+
+    serial, serial_time, serial_rebaked = run(args.engine, args.ants, args.frames, 1)
+    print('{} {} ants, {} frames, serial {:.4f} s per frame{}'.format(
+        args.engine, args.ants, args.frames, serial_time, ', lattice rebaked' if serial_rebaked else ''))
+    print('{:>8} {:>12} {:>9} {:>11} {:>8} {:>10} {:>8}'.format(
+        'workers', 's/frame', 'speedup', 'efficiency', 'halo %', 'identical', 'rebaked'))
+    for workers in [int(n) for n in args.workers.split(',')]:
+        a_ps, seconds, rebaked = run(args.engine, args.ants, args.frames, workers)
+        identical = all(np.array_equal(getattr(a_ps, attr), getattr(serial, attr)) for attr in ant_engine.STATE)
+        halo = 0.0
+        if a_ps.tiles is not None:
+            halo = 100.0 * sum(h for o, h in a_ps.tiles.sizes) / max(len(a_ps), 1)
+        print('{:>8} {:>12.4f} {:>9.2f} {:>11.2f} {:>8.2f} {:>10} {:>8}'.format(
+            workers, seconds, serial_time / seconds, serial_time / seconds / workers, halo, str(identical),
+            str(rebaked or serial_rebaked)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import sys
+import numpy as np
+from time import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import noise_field
+
+'''
+Accuracy against lattice spacing for the baked turbulence
+Run inside Blender:
+    blender -b --python benchmarks/turbulence_field.py
+'''
+
+# fourmis settings at scale 1
+STRENGTH = 1.0
+FREQUENCY = 10.0
+
+BOUNDS_MIN = (-1.0, -1.0, -1.0)
+BOUNDS_MAX = (1.0, 1.0, 1.0)
+
+
+def main(spacings=(0.2, 0.1, 0.05, 0.025), samples=2000):
+    rng = np.random.RandomState(0)
+    points = rng.uniform(BOUNDS_MIN, BOUNDS_MAX, (samples, 3))
+
+    start = time()
+    exact = np.array([noise_field.turbulence(co, STRENGTH, FREQUENCY) for co in points])
+    exact_time = (time() - start) / samples
+    magnitude = np.sqrt((exact * exact).sum(axis=1)).mean()
+
+    print('exact: {:.3f} us per ant, mean magnitude {:.4f}'.format(exact_time * 1e6, magnitude))
+    print('{:>8} {:>12} {:>10} {:>10} {:>10} {:>10} {:>14}'.format(
+        'spacing', 'lattice', 'MB', 'build s', 'mean err', 'max err', 'sample us/ant'))
+    for spacing in spacings:
+        field = noise_field.Turbulence_field(BOUNDS_MIN, BOUNDS_MAX, spacing, STRENGTH, FREQUENCY)
+        start = time()
+        field.sample(points)
+        sample_time = (time() - start) / samples
+        error = np.sqrt(((field.sample(points) - exact) ** 2).sum(axis=1))
+        print('{:>8} {:>12} {:>10.1f} {:>10.2f} {:>10.4f} {:>10.4f} {:>14.3f}'.format(
+            spacing, 'x'.join(str(n) for n in field.shape), field.nbytes / 2**20,
+            field.build_time, error.mean(), error.max(), sample_time * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import numpy as np
+
+'''
+Camera culling and distance bands at the output stage
+Each frame's particles are tested against the scene camera's frustum,
+particles outside are not written, the others are sorted into distance
+bands: the nearest band keeps the instance object, farther bands write to
+their own generator duplicating a cheaper proxy mesh, or are culled too.
+Only the output is filtered, the simulation keeps every particle, and each
+written point keeps its particle id so ants leaving and re-entering the view
+are matched again.
+
+The camera is sampled for every frame before the bake, with scene.frame_set,
+so animated and parented cameras work without changing frames mid-bake.
+'''
+
+
+def camera_animated(camera):
+    '''True if the camera, its lens or one of its parents can move'''
+    if camera.data.animation_data is not None:
+        return True
+    obj = camera
+    while obj is not None:
+        if obj.animation_data is not None or len(obj.constraints):
+            return True
+        obj = obj.parent
+    return False
+
+
+def camera_view(camera, scene):
+    '''
+    World to camera matrix without scale, the frame borders as
+    (xmin, xmax, ymin, ymax), slopes per unit of depth for perspective cameras
+    '''
+    matrix = np.array(camera.matrix_world, dtype=np.float64)
+    # renders ignore the camera's scale
+    matrix[:3, :3] /= np.sqrt((matrix[:3, :3] ** 2).sum(axis=0))
+    world_to_camera = np.linalg.inv(matrix)
+
+    corners = np.array([tuple(c) for c in camera.data.view_frame(scene)], dtype=np.float64)
+    ortho = camera.data.type == 'ORTHO'
+    if not ortho:
+        corners[:, :2] /= -corners[:, 2:3]
+    borders = (corners[:, 0].min(), corners[:, 0].max(), corners[:, 1].min(), corners[:, 1].max())
+    return world_to_camera, borders
+
+
+class Camera_culling:
+
+
+    def __init__(self, camera, scene, frame_start, frame_end, margin=0.0, bands=()):
+        '''
+        margin: distance outside the frame an instance is still written at,
+            about the instance radius so ants don't pop at the borders
+        bands: (distance, mesh) sorted by distance, particles beyond a
+            band's distance duplicate its mesh, culled when mesh is None
+        '''
+        self.margin = margin
+        self.ortho = camera.data.type == 'ORTHO'
+        self.clip_start = camera.data.clip_start
+        self.clip_end = camera.data.clip_end
+        self.bands = sorted(bands, key=lambda band: band[0])
+        self.band_distances = np.array([distance for distance, mesh in self.bands], dtype=np.float64)
+
+        # one view per frame for moving cameras, else one for the bake
+        self.views = {}
+        if camera_animated(camera):
+            current = scene.frame_current
+            for frame in range(frame_start, frame_end + 1):
+                scene.frame_set(frame)
+                self.views[frame] = camera_view(camera, scene)
+            scene.frame_set(current)
+        self.view = camera_view(camera, scene)
+
+    def visible(self, frame, co):
+        '''Boolean mask of the points in the frustum, and their distance to the camera'''
+        world_to_camera, (xmin, xmax, ymin, ymax) = self.views.get(frame, self.view)
+        local = np.dot(co, world_to_camera[:3, :3].T) + world_to_camera[:3, 3]
+        x, y, depth = local[:, 0], local[:, 1], -local[:, 2]
+        margin = self.margin
+
+        mask = (depth >= self.clip_start - margin) & (depth <= self.clip_end + margin)
+        if self.ortho:
+            mask &= (x >= xmin - margin) & (x <= xmax + margin)
+            mask &= (y >= ymin - margin) & (y <= ymax + margin)
+        else:
+            # margin measured perpendicular to the side planes
+            for coordinate, low, high in ((x, xmin, xmax), (y, ymin, ymax)):
+                mask &= coordinate >= low * depth - margin * np.hypot(1.0, low)
+                mask &= coordinate <= high * depth + margin * np.hypot(1.0, high)
+        return mask, np.sqrt((local * local).sum(axis=1))
+
+    def classify(self, frame, co):
+        '''Band of each point, 0 for the instance object, -1 if culled'''
+        mask, distance = self.visible(frame, co)
+        band = np.searchsorted(self.band_distances, distance, side='right')
+        for index, (distance, mesh) in enumerate(self.bands):
+            if mesh is None:
+                mask &= band != index + 1
+        return np.where(mask, band, -1)
+
+
+class Culling_writer:
+    '''Output backend filtering the frames of another one, see Camera_culling'''
+
+
+    def __init__(self, culling, output, proxies=None):
+        '''
+        output writes the particles in the nearest band, proxies maps band
+        indices to the writers of their proxy meshes, bands without a writer
+        go to output
+        '''
+        self.culling = culling
+        self.output = output
+        self.proxies = proxies or {}
+        # (frame, particle count, culled, count per band) for each written frame
+        self.counts = []
+
+    def write(self, frame, co, normal, ids=None):
+        co = np.asarray(co, dtype=np.float32).reshape(-1, 3)
+        normal = np.asarray(normal, dtype=np.float32).reshape(-1, 3)
+        ids = np.arange(len(co)) if ids is None else np.asarray(ids, dtype=np.int64)
+
+        band = self.culling.classify(frame, co)
+        culled = int((band < 0).sum())
+        per_band = np.bincount(band[band >= 0], minlength=len(self.culling.bands) + 1)
+        self.counts.append((frame, len(co), culled, per_band))
+
+        # every writer gets every frame, empty or not, for one object per frame
+        keep = band >= 0
+        for index, writer in self.proxies.items():
+            mask = band == index
+            keep &= ~mask
+            self.write_to(writer, frame, co[mask], normal[mask], ids[mask], culled)
+        return self.write_to(self.output, frame, co[keep], normal[keep], ids[keep], culled)
+
+    def write_to(self, writer, frame, co, normal, ids, culled):
+        obj = writer.write(frame, co.ravel(), normal.ravel(), ids)
+        if obj is not None:
+            obj['culled'] = culled
+        return obj
+
+    def close(self):
+        self.output.close()
+        for writer in self.proxies.values():
+            writer.close()
+
+    def report(self):
+        self.output.report()
+        for writer in self.proxies.values():
+            writer.report()
+        if not self.counts:
+            return
+        total = sum(n for f, n, c, b in self.counts)
+        culled = [c for f, n, c, b in self.counts]
+        frame, most = max(((f, c) for f, n, c, b in self.counts), key=lambda item: item[1])
+        per_band = sum(b for f, n, c, b in self.counts)
+        print('Culled {} of {} instances, {:.1f}%, per frame mean {:.0f}, max {} on frame {}'.format(
+            sum(culled), total, 100.0 * sum(culled) / max(total, 1), sum(culled) / len(culled), most, frame))
+        print('    written per band: {}'.format(', '.join(
+            '{} {}'.format(name, int(count)) for name, count in
+            zip(['instance'] + ['beyond {:g}'.format(d) for d, mesh in self.culling.bands], per_band))))
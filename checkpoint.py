@@ -0,0 +1,102 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import pickle
+import random
+import re
+import numpy as np
+from mathutils import noise
+
+'''
+Checkpoints of a running simulation
+The full particle state plus the state of the random module, saved every N
+frames so a bake can resume, or re-simulate from the last checkpoint before
+a changed frame, and give the same result as an uninterrupted run.
+
+mathutils.noise has no way to read its random state back, so it is reseeded
+from (seed, frame) at every checkpoint, by the uninterrupted run as well as
+the resumed one.
+'''
+
+# float64 holds both engines' vectors exactly
+DTYPES = {
+    'location': np.float64,
+    'velocity': np.float64,
+    'noise_seed': np.float64,
+    'MAX_VEL': np.float64,
+    'guide_index': np.int64,
+    'guide_param': np.float64,
+    'direction': np.int64,
+    'behaviour': np.float64,
+    'active': bool,
+    'ids': np.int64,
+    'age': np.int64,
+    'lifetime': np.int64,
+    'next_id': np.int64,
+    }
+
+FILE_NAME = 'frame_{:05}.npz'
+
+
+def reseed_noise(random_seed, frame):
+    noise.seed_set(random_seed * 100003 + frame)
+
+
+def save(a_ps, directory, random_seed):
+    '''Checkpoint a_ps after its current frame, works with both engines'''
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    state = a_ps.get_state()
+    arrays = dict((key, np.asarray(state[key], dtype=dtype)) for key, dtype in DTYPES.items() if key in state)
+    # empty colonies still need their vector shape
+    for key in ('location', 'velocity', 'noise_seed'):
+        arrays[key] = arrays[key].reshape(-1, 3)
+
+    path = os.path.join(directory, FILE_NAME.format(state['frame']))
+    random_state = np.frombuffer(pickle.dumps(random.getstate()), dtype=np.uint8)
+    with open(path, 'wb') as f:
+        np.savez(f, frame=state['frame'], random_seed=random_seed, random_state=random_state, **arrays)
+    reseed_noise(random_seed, state['frame'])
+    return path
+
+
+def load(a_ps, path):
+    '''Restore a_ps and the random generators as they were at the checkpoint'''
+    with np.load(path) as data:
+        state = dict((key, data[key]) for key in DTYPES if key in data.files)
+        state['frame'] = int(data['frame'])
+        random.setstate(pickle.loads(data['random_state'].tobytes()))
+        reseed_noise(int(data['random_seed']), state['frame'])
+    a_ps.set_state(state)
+    return state['frame']
+
+
+def find(directory, frame):
+    '''Path of the last checkpoint taken before frame, None if there is none'''
+    best, best_frame = None, None
+    if not os.path.isdir(directory):
+        return None
+    for name in os.listdir(directory):
+        match = re.match(r'frame_(-?\d+)\.npz$', name)
+        if not match:
+            continue
+        checkpoint_frame = int(match.group(1))
+        if checkpoint_frame < frame and (best_frame is None or checkpoint_frame > best_frame):
+            best, best_frame = os.path.join(directory, name), checkpoint_frame
+    return best
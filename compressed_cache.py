@@ -0,0 +1,366 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import zlib
+import numpy as np
+from time import time
+
+from frame_cache import Frame_cache_reader, Frame_cache_writer, frame_size
+
+'''
+Compressed frame cache, same content and interface as frame_cache
+
+    header      HEADER
+    index       INDEX * frame_count, one entry per frame of the range
+    frames      for each written frame, at its index offset, zlib of:
+                    FRAME
+                    ids         id differences, or nothing if the same as the base frame
+                    positions   keyframes: quantized positions
+                                others: quantized moves since the base frame,
+                                then the indices and positions of new ids
+                    directions  int16 * count * 2, octahedral unit vectors
+                    speeds      uint16 * count, fraction of the frame's top speed
+
+Positions are quantized on a grid of step 2 * error from the lower corner of
+the ground's bounding box, so no coordinate is off by more than error. Moves
+are taken between quantized positions, decoding adds up integers and never
+drifts. Every keyframe_interval frames, and on the first frame written after
+a resume, a keyframe stores the positions themselves: decoding any frame
+reads at most keyframe_interval frames, playing forward reads one.
+Each array is stored with the narrowest integer type its values fit in.
+'''
+
+MAGIC = b'ANTCMPRS'
+VERSION = 1
+
+HEADER = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('frame_start', '<i4'),
+    ('frame_count', '<u4'),
+    ('keyframe_interval', '<u4'),
+    ('origin', '<f8', 3),
+    ('step', '<f8'),
+    ])
+
+INDEX = np.dtype([
+    ('offset', '<u8'),
+    ('size', '<u4'),
+    ('count', '<u4'),
+    # frame index the moves apply to, its own index for keyframes
+    ('base', '<u4'),
+    ('reserved', '<u4'),
+    ])
+
+FRAME = np.dtype([
+    ('flags', 'u1'),
+    ('ids_type', 'u1'),
+    ('position_type', 'u1'),
+    ('reserved', 'u1'),
+    ('new_count', '<u4'),
+    ('top_speed', '<f4'),
+    ])
+
+KEYFRAME = 1
+SAME_IDS = 2
+
+# integer types by code, narrowest first
+TYPES = [np.dtype(t) for t in ('<i1', '<i2', '<i4', '<i8')]
+
+OCT_SCALE = 32767
+SPEED_SCALE = 65535
+
+
+def narrowest(values):
+    '''Code of the smallest signed type holding all values'''
+    if not len(values):
+        return 0
+    low, high = int(values.min()), int(values.max())
+    for code, dtype in enumerate(TYPES):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return code
+    raise ValueError('Values do not fit in 64 bits')
+
+
+def oct_encode(vectors):
+    '''Unit vectors (n, 3) to two int16 each, octahedral mapping'''
+    l1 = np.abs(vectors).sum(axis=1)
+    p = vectors[:, :2] / np.where(l1 > 0, l1, 1.0)[:, None]
+    below = vectors[:, 2] < 0
+    sign = np.where(p >= 0, 1.0, -1.0)
+    folded = (1.0 - np.abs(p[:, ::-1])) * sign
+    p = np.where(below[:, None], folded, p)
+    return np.round(np.clip(p, -1.0, 1.0) * OCT_SCALE).astype('<i2')
+
+
+def oct_decode(encoded):
+    p = encoded.astype(np.float32) / OCT_SCALE
+    z = 1.0 - np.abs(p).sum(axis=1)
+    t = np.maximum(-z, 0.0)
+    p -= np.where(p >= 0, t[:, None], -t[:, None])
+    vectors = np.column_stack((p, z))
+    return vectors / np.sqrt((vectors * vectors).sum(axis=1))[:, None]
+
+
+class Compressed_cache_writer(Frame_cache_writer):
+    '''Output backend with the same interface as frame_writer.Frame_writer'''
+
+    HEADER = HEADER
+    INDEX = INDEX
+    MAGIC = MAGIC
+    VERSION = VERSION
+
+
+    def __init__(self, path, frame_start, frame_end, bounds_min, error=0.001, keyframe_interval=25, level=6):
+        '''
+        bounds_min: lower corner positions are quantized from, eg. the ground's
+        error: largest error on a coordinate, the quantization step is twice that
+        '''
+        self.keyframe_interval = keyframe_interval
+        self.origin = np.asarray(bounds_min, dtype=np.float64)
+        self.step = 2.0 * error
+        self.level = level
+        self.raw_size = 0
+        self.base = None
+        Frame_cache_writer.__init__(self, path, frame_start, frame_end)
+        self.first = self.end
+
+    def header(self):
+        header = Frame_cache_writer.header(self)
+        header['keyframe_interval'] = self.keyframe_interval
+        header['origin'] = self.origin
+        header['step'] = self.step
+        return header
+
+    def read_header(self, header):
+        Frame_cache_writer.read_header(self, header)
+        self.keyframe_interval = int(header['keyframe_interval'])
+        self.origin = header['origin'].astype(np.float64)
+        self.step = float(header['step'])
+
+    @classmethod
+    def reopen(cls, path, frame, level=6):
+        '''Continue writing an existing cache after frame, later frames are dropped'''
+        writer = super(Compressed_cache_writer, cls).reopen(path, frame)
+        writer.level = level
+        writer.raw_size = 0
+        # no decoded frame to take moves from, the next one is a keyframe
+        writer.base = None
+        # report() counts the frames written from here on
+        writer.first = writer.end
+        return writer
+
+    def quantize(self, co):
+        return np.round((co.astype(np.float64) - self.origin) / self.step).astype(np.int64)
+
+    def write(self, frame, co, velocity, ids=None):
+        '''Append one frame, ids default to the particle order'''
+        start = time()
+        i = frame - self.frame_start
+        if not 0 <= i < self.frame_count:
+            raise ValueError('Frame {} outside of the cache range'.format(frame))
+
+        co = np.asarray(co, dtype=np.float32).reshape(-1, 3)
+        velocity = np.asarray(velocity, dtype=np.float32).reshape(-1, 3)
+        # a copy, the next frame takes its moves from these ids and the
+        # engines change their id arrays in place
+        ids = np.arange(len(co)) if ids is None else np.array(ids, dtype=np.int64)
+        q = self.quantize(co)
+
+        info = np.zeros(1, dtype=FRAME)
+        arrays = []
+        keyframe = self.base is None or i - self.base[3] >= self.keyframe_interval
+        base_index = keyframe_index = i
+        if keyframe:
+            info['flags'] = KEYFRAME
+            positions = q.ravel()
+            new = np.zeros(0, dtype=np.int64)
+        else:
+            base_index, base_ids, base_q, keyframe_index = self.base
+            if len(ids) == len(base_ids) and np.array_equal(ids, base_ids):
+                info['flags'] = SAME_IDS
+                positions = (q - base_q).ravel()
+                new = np.zeros(0, dtype=np.int64)
+            else:
+                # match ids with the base frame, ids seen there move, others are new
+                order = np.argsort(base_ids, kind='mergesort')
+                found = np.minimum(np.searchsorted(base_ids[order], ids), max(len(order) - 1, 0))
+                known = (base_ids[order][found] == ids) if len(order) else np.zeros(len(ids), dtype=bool)
+                new = np.flatnonzero(~known)
+                positions = (q[known] - base_q[order[found[known]]]).ravel()
+
+        if not info['flags'][0] & SAME_IDS:
+            id_steps = np.diff(ids, prepend=0)
+            info['ids_type'] = narrowest(id_steps)
+            arrays.append(id_steps.astype(TYPES[info['ids_type'][0]]))
+        info['position_type'] = narrowest(positions)
+        arrays.append(positions.astype(TYPES[info['position_type'][0]]))
+        if len(new):
+            info['new_count'] = len(new)
+            arrays.append(new.astype('<u4'))
+            arrays.append(q[new].astype('<i8'))
+
+        speed = np.sqrt((velocity.astype(np.float64) ** 2).sum(axis=1))
+        top_speed = float(speed.max()) if len(speed) else 0.0
+        info['top_speed'] = top_speed
+        arrays.append(oct_encode(velocity))
+        arrays.append(np.round(speed / (top_speed or 1.0) * SPEED_SCALE).astype('<u2'))
+
+        block = zlib.compress(info.tobytes() + b''.join(a.tobytes() for a in arrays), self.level)
+
+        offset = self.end
+        self.file.seek(offset)
+        self.file.write(block)
+        self.end = self.file.tell()
+
+        entry = np.zeros(1, dtype=INDEX)
+        entry['offset'] = offset
+        entry['size'] = len(block)
+        entry['count'] = len(co)
+        entry['base'] = base_index
+        self.file.seek(HEADER.itemsize + i * INDEX.itemsize)
+        self.file.write(entry.tobytes())
+
+        self.base = (i, ids, q, keyframe_index)
+        self.raw_size += frame_size(len(co))
+        self.timings.append((frame, len(co), time() - start))
+
+    def report(self):
+        if not self.timings:
+            return
+        seconds = sum(t for f, n, t in self.timings)
+        size = self.end - self.first
+        print('Frames cached: {} in {}, {:.1f} MB for {:.1f} MB raw, ratio {:.1f}, total {:05.5f} seconds'.format(
+            len(self.timings), self.path, size / 2**20, self.raw_size / 2**20,
+            self.raw_size / max(size, 1), seconds))
+        print('    position error at most {:g}'.format(self.step / 2.0))
+
+
+class Compressed_cache_reader(Frame_cache_reader):
+
+    HEADER = HEADER
+    INDEX = INDEX
+    MAGIC = MAGIC
+    VERSION = VERSION
+
+
+    def read_header(self, header):
+        Frame_cache_reader.read_header(self, header)
+        self.keyframe_interval = int(header['keyframe_interval'])
+        self.origin = header['origin'].astype(np.float64)
+        self.step = float(header['step'])
+        # (frame index, ids, quantized positions, velocity) of the last
+        # decoded frame, a resumed bake may have written it again
+        self.decoded = None
+
+    def entry(self, i):
+        entry = self.index[i]
+        if not entry['offset'] or int(entry['offset']) + int(entry['size']) > len(self.data):
+            self.refresh()
+            entry = self.index[i]
+        return entry
+
+    def decode(self, i, base):
+        '''(i, ids, quantized positions, velocity) of frame index i, given its base frame's'''
+        entry = self.entry(i)
+        offset, count = int(entry['offset']), int(entry['count'])
+        block = zlib.decompress(self.data[offset:offset + int(entry['size'])].tobytes())
+        info = np.frombuffer(block, dtype=FRAME, count=1)[0]
+        position = FRAME.itemsize
+
+        def take(dtype, n):
+            nonlocal position
+            array = np.frombuffer(block, dtype=dtype, count=n, offset=position)
+            position += array.nbytes
+            return array
+
+        flags = int(info['flags'])
+        if flags & SAME_IDS:
+            ids = base[1]
+        else:
+            ids = np.cumsum(take(TYPES[info['ids_type']], count).astype(np.int64))
+
+        if flags & KEYFRAME:
+            q = take(TYPES[info['position_type']], count * 3).astype(np.int64).reshape(count, 3)
+        else:
+            base_ids, base_q = base[1], base[2]
+            new_count = int(info['new_count'])
+            moves = take(TYPES[info['position_type']], (count - new_count) * 3).astype(np.int64).reshape(-1, 3)
+            q = np.empty((count, 3), dtype=np.int64)
+            if flags & SAME_IDS:
+                q[:] = base_q + moves
+            else:
+                new = take('<u4', new_count).astype(np.int64)
+                known = np.ones(count, dtype=bool)
+                known[new] = False
+                order = np.argsort(base_ids, kind='mergesort')
+                found = np.searchsorted(base_ids[order], ids[known])
+                q[known] = base_q[order[found]] + moves
+                q[new] = take('<i8', new_count * 3).reshape(new_count, 3)
+
+        directions = oct_decode(take('<i2', count * 2).reshape(count, 2))
+        speed = take('<u2', count).astype(np.float32) * (float(info['top_speed']) / SPEED_SCALE)
+        return i, ids, q, directions * speed[:, None]
+
+    def frame(self, frame):
+        '''(ids, co, velocity) of a frame, None if it was not written'''
+        i = frame - self.frame_start
+        if not 0 <= i < self.frame_count:
+            return None
+        if not self.entry(i)['offset']:
+            return None
+
+        # frames to decode, back to the keyframe or to the last decoded frame
+        chain = []
+        j = i
+        while self.decoded is None or self.decoded[0] != j:
+            chain.append(j)
+            base = int(self.index[j]['base'])
+            if base == j:
+                break
+            j = base
+        state = self.decoded
+        for j in reversed(chain):
+            state = self.decode(j, state)
+        self.decoded = state
+
+        i, ids, q, velocity = state
+        co = (q * self.step + self.origin).astype(np.float32)
+        return ids.astype('<u4'), co, velocity.astype(np.float32)
+
+
+def open_cache(path):
+    '''Reader for a raw or compressed frame cache'''
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+    if magic == MAGIC:
+        return Compressed_cache_reader(path)
+    return Frame_cache_reader(path)
+
+
+def reopen_cache(path, frame):
+    '''Raw or compressed cache writer continuing after frame'''
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+    if magic == MAGIC:
+        return Compressed_cache_writer.reopen(path, frame)
+    return Frame_cache_writer.reopen(path, frame)
+
+
+CACHE_WRITERS = (Frame_cache_writer, Compressed_cache_writer)
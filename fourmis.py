@@ -17,18 +17,41 @@
 
 
 import bpy
+import os
+import sys
 from mathutils import Vector, noise
 from mathutils.kdtree import KDTree
 from random import random, randint, gauss, seed
 from math import fabs
 from time import time
 
+# helper modules live next to this script
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import checkpoint
+from camera_culling import Camera_culling, Culling_writer
+from compressed_cache import CACHE_WRITERS, Compressed_cache_writer, reopen_cache
+from frame_cache import Frame_cache_writer
+from frame_writer import Frame_writer
+from particle_store import Particle_store
+from lifecycle import Lifecycle, Rate_emitter, Vertex_emitter, swap_remove_order
+import modal_bake
+from modal_bake import Bake_job, Modal_bake
+from output_registry import Output_registry
+import point_cache
+from profiling import No_profiler, Stage_profiler
+from time_integration import subframe_path
+
 '''
 Template for a particle system
 Includes efficient caching using duplication
 '''
 
+# generator and instance objects of the last bake
+OUTPUTS = Output_registry('fourmis')
+
 class Particle:
+    __slots__ = ('MAX_VEL', 'location', 'velocity', 'guide_index', 'noise_seed', 'active', 'direction', 'behaviour',
+                 'id', 'age', 'lifetime')
 
 
     def __init__(self, index, scale, location=Vector()):
@@ -53,10 +76,31 @@ class Particle:
 
         self.behaviour = 0.6 # 1 = guide ; 0 = turbulence
 
+        # set by the system, see lifecycle
+        self.id = 0
+        self.age = 0
+        self.lifetime = 0
+
+# Particle attributes in a Particle_store, vectors in single precision like mathutils
+COMPACT_FIELDS = (
+    ('location', 3, 'f4'),
+    ('velocity', 3, 'f4'),
+    ('noise_seed', 3, 'f4'),
+    ('MAX_VEL', 1, 'f8'),
+    ('guide_index', 1, 'i8'),
+    ('direction', 1, 'i8'),
+    ('behaviour', 1, 'f8'),
+    ('active', 1, '?'),
+    ('id', 1, 'i8'),
+    ('age', 1, 'i8'),
+    ('lifetime', 1, 'i8'),
+    )
+
 class Particle_system:
 
 
-    def __init__(self, guide, ground, scale):
+    def __init__(self, guide, ground, scale, compact=False):
+        '''compact keeps the particles in a Particle_store instead of one object each'''
 
         self.GUIDE_STRENGTH = 1.0 * scale
 
@@ -67,8 +111,12 @@ class Particle_system:
         self.AVOID_STRENGTH = 0.2 * scale
 
         self.frame = 0
+        self.next_id = 0
+        # births and deaths, see lifecycle
+        self.lifecycle = None
 
-        self.particles = []
+        self.compact = compact
+        self.particles = Particle_store(COMPACT_FIELDS) if compact else []
         self.guide = guide
 #        self.vertex_distance = (self.guide.data.vertices[0].co - self.guide.data.vertices[1].co).length_squared
 
@@ -85,52 +133,147 @@ class Particle_system:
 #        self.instance_obj = bpy.data.objects['Fleche']
         self.instance_obj = bpy.data.objects[bpy.context.scene.ant_instance]
         self.instance_mesh = self.instance_obj.data
+        self.writer = Frame_writer(self.instance_mesh)
+        self.profiler = No_profiler()
 #        self.instance_mesh.materials.append(bpy.data.materials['noir'])
 
 
-    def add_particles(self, particles_number):
-        '''Add a new particle to the system'''
+    def add_particles(self, particles_number, guide_indices=None):
+        '''Add new particles to the system, on random guide vertices or the given ones'''
+        if self.compact:
+            self.particles.reserve(len(self.particles) + particles_number)
         for p in range(particles_number):
-            ind = randint(1, len(self.guide.data.vertices)-2)
-            self.particles.append(Particle(ind, self.scale, self.guide.data.vertices[ind].co))
+            ind = randint(1, len(self.guide.data.vertices)-2) if guide_indices is None else guide_indices[p]
+            part = Particle(ind, self.scale, self.guide.data.vertices[ind].co)
+            part.id = self.next_id
+            part.lifetime = self.lifecycle.draw_lifetime() if self.lifecycle else 0
+            self.next_id += 1
+            self.particles.append(part)
 
     def kill_particle(self, part):
-        self.particles.remove(part)
+        self.kill_index(part.index if self.compact else self.particles.index(part))
+
+    def kill_index(self, index):
+        '''Move the last particle in place of the dead one'''
+        if self.compact:
+            self.particles.swap_remove(index)
+            return
+        last = self.particles.pop()
+        if index < len(self.particles):
+            self.particles[index] = last
+
+    def kill_particles(self, indices):
+        for i in swap_remove_order(indices):
+            self.kill_index(i)
+
+    def get_state(self):
+        '''Particle attributes as lists, in the layout of ant_engine.STATE'''
+        return {
+            'frame': self.frame,
+            'location': [tuple(p.location) for p in self.particles],
+            'velocity': [tuple(p.velocity) for p in self.particles],
+            'noise_seed': [tuple(p.noise_seed) for p in self.particles],
+            'MAX_VEL': [p.MAX_VEL for p in self.particles],
+            'guide_index': [p.guide_index for p in self.particles],
+            'direction': [p.direction for p in self.particles],
+            'behaviour': [p.behaviour for p in self.particles],
+            'active': [p.active for p in self.particles],
+            'ids': [p.id for p in self.particles],
+            'age': [p.age for p in self.particles],
+            'lifetime': [p.lifetime for p in self.particles],
+            'next_id': self.next_id,
+            }
+
+    def set_state(self, state):
+        self.frame = int(state['frame'])
+        count = len(state['location'])
+        # checkpoints from before the lifecycle
+        state = dict(state)
+        state.setdefault('ids', range(count))
+        state.setdefault('age', [0] * count)
+        state.setdefault('lifetime', [0] * count)
+        self.next_id = int(state.get('next_id', count))
+
+        if self.compact:
+            self.particles = Particle_store(COMPACT_FIELDS, count)
+            state['id'] = state['ids']
+            self.particles.extend(state)
+            return
+        self.particles = []
+        for i in range(count):
+            # skip __init__, it draws random numbers
+            part = Particle.__new__(Particle)
+            part.location = Vector(state['location'][i])
+            part.velocity = Vector(state['velocity'][i])
+            part.noise_seed = Vector(state['noise_seed'][i])
+            part.MAX_VEL = float(state['MAX_VEL'][i])
+            part.guide_index = int(state['guide_index'][i])
+            part.direction = int(state['direction'][i])
+            part.behaviour = float(state['behaviour'][i])
+            part.active = bool(state['active'][i])
+            part.id = int(state['ids'][i])
+            part.age = int(state['age'][i])
+            part.lifetime = int(state['lifetime'][i])
+            self.particles.append(part)
 
     def create_tree(self):
         self.parts_tree = KDTree(len(self.particles))
-        for i, p in enumerate(self.particles):
-            self.parts_tree.insert(p.location, i)
+        locations = self.particles.column('location') if self.compact else (p.location for p in self.particles)
+        for i, co in enumerate(locations):
+            self.parts_tree.insert(co, i)
         self.parts_tree.balance()
 
 
-    def step(self):
+    def step(self, write=True):
         '''Simulate next frame'''
         self.frame += 1
+        profiler = self.profiler
+        profiler.start()
+        lifecycle = self.lifecycle
+        if lifecycle is not None:
+            lifecycle.emit(self, self.frame)
+            profiler.lap('lifecycle')
         self.create_tree()
+        profiler.lap('tree build')
 
-        for part in self.particles:
+        # stages are timed on one ant in sample, see profiling
+        sample = profiler.ant_sample
+        dead = []
+        for i, part in enumerate(self.particles):
             if part.active:
+                timed = sample and i % sample == 0
+                if timed:
+                    profiler.start()
 
-                previous_velocity = part.velocity.copy()
+                # vectors are read once and written back at the end, for
+                # compact particles each read builds a new Vector from the row
+                location = part.location
+                velocity = part.velocity
+                noise_seed = part.noise_seed
+                previous_velocity = velocity.copy()
 
                 #guide vector
-                guide_vector = self.guide.data.vertices[part.guide_index].co - part.location
-                guide_vector = guide_vector.normalized() * self.GUIDE_STRENGTH
+                guide_vector = self.guide.data.vertices[part.guide_index].co - location
+                guide_vector.normalize()
+                guide_vector *= self.GUIDE_STRENGTH
+                if timed:
+                    profiler.lap('guide', sample)
 
                 #turbulence vector
-                turbulence = noise.turbulence_vector(part.noise_seed+part.location, 2, False, 1, self.TURBULENCE_STRENGTH, self.TURBULENCE_FREQUENCY)
+                turbulence = noise.turbulence_vector(noise_seed+location, 2, False, 1, self.TURBULENCE_STRENGTH, self.TURBULENCE_FREQUENCY)
 #                part.noise_seed += turbulence / 50
 #                if part.velocity.length_squared < 0.0001:
 #                    part.noise_seed = noise.random_unit_vector()
-                part.noise_seed.z += 0.01
+                noise_seed.z += 0.01
+                if timed:
+                    profiler.lap('turbulence', sample)
 
                 #boid-like vector
-                too_close = self.parts_tree.find_range(part.location, self.AVOID_THRESHOLD)
+                too_close = self.parts_tree.find_range(location, self.AVOID_THRESHOLD)
                 avoid_vector = Vector()
                 for p in too_close:
 
-                    other_vec = part.location - p[0]
+                    other_vec = location - p[0]
                     if other_vec.length_squared < 0.0001:
                         continue
                     other_vec /= other_vec.length
@@ -139,51 +282,68 @@ class Particle_system:
 #                avoid_vector.normalize()
 #                avoid_vector -= part.velocity
                 avoid_vector *= self.AVOID_STRENGTH
+                if timed:
+                    profiler.lap('avoidance', sample)
 
                 #velocity change
+                behaviour = part.behaviour
 
-                part.velocity += avoid_vector
+                velocity += avoid_vector
 
-                part.velocity += turbulence * (1.0-part.behaviour)
-                part.velocity += guide_vector * part.behaviour
+                turbulence *= 1.0-behaviour
+                velocity += turbulence
+                guide_vector *= behaviour
+                velocity += guide_vector
 
                 #limit velocity (drag and shit)
-                if part.velocity.length > part.MAX_VEL:
-                    part.velocity.length = part.MAX_VEL
+                max_vel = part.MAX_VEL
+                if velocity.length > max_vel:
+                    velocity.length = max_vel
 
                 # limit rotation
-                rotation_scalar = previous_velocity.dot(part.velocity) * 0.5 + 0.5 # normalized 0-1
+                rotation_scalar = previous_velocity.dot(velocity) * 0.5 + 0.5 # normalized 0-1
 #                rotation_scalar **= 3
                 if rotation_scalar > 0.1:
                     rotation_scalar = 0.1
 #                rotation_scalar = 0
-                part.velocity *= (rotation_scalar)
-                part.velocity += previous_velocity * (1-rotation_scalar)
+                velocity *= (rotation_scalar)
+                previous_velocity *= 1-rotation_scalar
+                velocity += previous_velocity
+                if timed:
+                    profiler.lap('velocity limits', sample)
 
                 # put that shit on the ground
-                closest = self.ground.closest_point_on_mesh(part.location)
-                part.location = closest[0]
+                closest = self.ground.closest_point_on_mesh(location)
+                location = closest[0]
                 # velocity parallel to the ground
-                vel_norm = part.velocity.length
-                inter = part.velocity.cross(closest[1])
-                part.velocity = closest[1].cross(inter)
-                part.velocity.length = vel_norm
+                vel_norm = velocity.length
+                inter = velocity.cross(closest[1])
+                velocity = closest[1].cross(inter)
+                velocity.length = vel_norm
 #                print(part.velocity)
 
                 # SET NEW LOCATION
-                part.location += part.velocity
+                location += velocity
+                part.location = location
+                part.velocity = velocity
+                part.noise_seed = noise_seed
+                if timed:
+                    profiler.lap('ground snap', sample)
 
                 # behaviour change
-                part.behaviour += random()*0.1-0.05
-                if part.behaviour < 0.8:
-                    part.behaviour = 0.8
-                if part.behaviour > 0.9:
-                    part.behaviour = 0.9
+                behaviour += random()*0.1-0.05
+                if behaviour < 0.8:
+                    behaviour = 0.8
+                if behaviour > 0.9:
+                    behaviour = 0.9
+                part.behaviour = behaviour
 
 #                # set goal to next vertex if close enough
-                pt, ind, dist = self.guide_tree.find(part.location)
-                if fabs(ind - part.guide_index) < 2:
-                    part.guide_index += part.direction
+                guide_index = part.guide_index
+                direction = part.direction
+                pt, ind, dist = self.guide_tree.find(location)
+                if fabs(ind - guide_index) < 2:
+                    guide_index += direction
 #                if self.frame % 20 == 0:
 #                    part.guide_index += part.direction
 
@@ -191,90 +351,434 @@ class Particle_system:
 #                    part.guide_index += 1
 
                 # switch direction if end reached
-                if part.guide_index >= len(self.guide.data.vertices)-1 or part.guide_index == 1:
+                end_reached = guide_index >= len(self.guide.data.vertices)-1 or guide_index == 1
+                if end_reached:
 #                    part.active = False
 #                    self.kill_particle(part)
-                    part.direction = -part.direction
-                    part.guide_index += part.direction
-
-        self.create_frame(self.frame)
+                    direction = -direction
+                    guide_index += direction
+                    part.direction = direction
+                part.guide_index = guide_index
+                if timed:
+                    profiler.lap('guide', sample)
+
+                age = part.age + 1
+                part.age = age
+                if lifecycle is not None and lifecycle.dead(age, part.lifetime, end_reached):
+                    dead.append(i)
+
+        if dead:
+            profiler.start()
+            self.kill_particles(dead)
+            profiler.lap('lifecycle')
+
+        if write:
+            self.create_frame(self.frame)
 
     def create_frame(self, frame):
-        '''
-        For each frame:
-            - create a new instance of the object to duplicate (eg. a sphere)
-            - get a list of vertices from particles' positions
-            - create a new generator objects, use the vertex list to generate mesh
-                - this object will be used for duplication
-            - parent the object to duplicate to the generator object
-            - animate the visibility of both objects
-            '''
-
-        instance_obj_frame = bpy.data.objects.new('instance_{:05}'.format(frame), self.instance_mesh)
-        bpy.context.scene.objects.link(instance_obj_frame)
-
-
-        vertices = [(p.location, p.velocity) for p in self.particles]
-        generator_mesh = bpy.data.meshes.new('generator_{:05}'.format(frame))
-
-#        generator_mesh.from_pydata(vertices, [], [])
-
-        ## Track to camera
-#        cam = bpy.context.scene.camera
-        for v in vertices:
-            generator_mesh.vertices.add(1)
-            generator_mesh.vertices[-1].co = v[0]
-            generator_mesh.vertices[-1].normal = v[1]
-#            generator_mesh.vertices[-1].normal = cam.location - v
-
-        generator_obj = bpy.data.objects.new('generator_{:05}'.format(frame), generator_mesh)
-        bpy.context.scene.objects.link(generator_obj)
-
-        instance_obj_frame.parent = generator_obj
-        generator_obj.dupli_type = "VERTS"
-        generator_obj.use_dupli_vertices_rotation = True
-
-        #anim
-        generator_obj.keyframe_insert('hide', frame=frame)
-        generator_obj.keyframe_insert('hide_render', frame=frame)
-        generator_obj.hide = True
-        generator_obj.hide_render = True
-        generator_obj.keyframe_insert('hide', frame=frame+1)
-        generator_obj.keyframe_insert('hide_render', frame=frame+1)
-        generator_obj.keyframe_insert('hide', frame=frame-1)
-        generator_obj.keyframe_insert('hide_render', frame=frame-1)
-
-
-def main(context):
-
-    for o in bpy.data.objects:
-        if o.name.startswith('generator') or o.name.startswith('Ico') or o.name.startswith('instance'):
-            o.user_clear()
-            bpy.context.scene.objects.unlink(o)
-            bpy.data.objects.remove(o)
-
-#    guide = bpy.data.objects['Chemin']
-#    ground = bpy.data.objects['Sol']
-    guide = bpy.data.objects[bpy.context.scene.ant_guide]
-    ground = bpy.data.objects[bpy.context.scene.ant_ground]
-    number_ants = bpy.context.scene.ant_number
-    start_frame = bpy.context.scene.ant_start_frame
-    end_frame = bpy.context.scene.ant_end_frame
-    scale = bpy.context.scene.ant_scale
-#    ground = bpy.context.selected_objects[-1]
-    a_ps = Particle_system(guide, ground, scale)
+        '''Write this frame's particles as a new generator object'''
+        self.profiler.start()
+        if self.compact:
+            co = self.particles.column('location').ravel()
+            normal = self.particles.column('velocity').ravel()
+            ids = self.particles.column('id')
+        else:
+            co = [c for p in self.particles for c in p.location]
+            normal = [c for p in self.particles for c in p.velocity]
+            ids = [p.id for p in self.particles]
+        self.writer.write(frame, co, normal, ids)
+        self.profiler.lap('frame output')
+
+
+def create_system(engine, guide, ground, scale, **options):
+    '''
+    Build the simulation for the chosen engine ('OBJECT', 'COMPACT' or 'ARRAY')
+    options are Ant_system settings, the object engines have none
+    '''
+    if engine == 'ARRAY':
+        from ant_engine import Ant_system
+        return Ant_system(guide, ground, scale, **options)
+    return Particle_system(guide, ground, scale, compact=engine == 'COMPACT')
+
+
+def compare_engines(guide, ground, scale, number_ants, frames, tolerance=1e-4):
+    '''
+    Run both engines from the same seed without writing frames
+    Returns the largest location difference seen, fails above tolerance
+    '''
+    systems = []
+    for engine in ('OBJECT', 'ARRAY'):
+        seed(0)
+        noise.seed_set(0)
+        a_ps = create_system(engine, guide, ground, scale)
+        a_ps.add_particles(number_ants)
+        systems.append(a_ps)
+
+    object_ps, array_ps = systems
+    max_error = 0.0
+    # both engines draw from the global random module, keep their streams in step
+    for f in range(frames):
+        seed(f)
+        object_ps.step(write=False)
+        seed(f)
+        array_ps.step(write=False)
+        for p, co in zip(object_ps.particles, array_ps.location):
+            max_error = max(max_error, max(fabs(a - b) for a, b in zip(p.location, co)))
+        if max_error > tolerance:
+            raise ValueError('Engines diverged at frame {}: {}'.format(f+1, max_error))
+    return max_error
+
+
+def prepare_bake(guide, ground, scale, number_ants, start_frame, end_frame, engine='OBJECT', cache_path=None,
+                 random_seed=0, checkpoint_interval=0, resume_frame=None, profiler=None, lifecycle=None, culling=None,
+                 cache_error=0.0, cache_keyframes=25, **options):
+    '''
+    Colony ready to step to end_frame, and the function to call after each
+    step, it saves the checkpoints
+    Written to new objects or to a frame cache if cache_path is set
+    With checkpoint_interval the state is saved every that many frames next to
+    the cache, resume_frame re-simulates from the last checkpoint before it
+    A profiler (see profiling.py) times the stages of every step
+    A lifecycle (see lifecycle.py) emits and kills ants during the bake
+    A culling (see camera_culling.py) only writes the ants the camera sees,
+    proxy bands get their own generators, or go to the cache with the rest
+    With cache_error the cache is compressed (see compressed_cache.py), positions
+    within that distance, a keyframe every cache_keyframes frames
+    steps_per_frame and subframes options step the Ant_system with a fixed dt
+    (see time_integration.py), sub-frame samples go to a cache next to cache_path
+    options go to the Ant_system, random_streams draws from counter-based
+    streams keyed by random_seed
+    '''
+    seed(random_seed)
+    noise.seed_set(random_seed)
+    if options.pop('random_streams', False):
+        options['stream_seed'] = random_seed
+    a_ps = create_system(engine, guide, ground, scale, **options)
+    a_ps.lifecycle = lifecycle
     a_ps.add_particles(number_ants)
+    a_ps.frame = start_frame - 1
+    if getattr(a_ps, 'compact', False):
+        a_ps.particles.report()
+    if profiler is not None:
+        a_ps.profiler = profiler
+
+    checkpoint_dir = (cache_path or bpy.path.abspath('//ants')) + '.checkpoints'
+    if resume_frame is not None:
+        if not cache_path:
+            raise ValueError('Resuming a bake needs a frame cache')
+        path = checkpoint.find(checkpoint_dir, resume_frame)
+        if path:
+            checkpoint.load(a_ps, path)
+            print('Resuming after frame {} from {}'.format(a_ps.frame, path))
+        else:
+            resume_frame = None
+
+    if cache_path:
+        point_cache.forget(cache_path)
+        if resume_frame is not None:
+            a_ps.writer = reopen_cache(cache_path, a_ps.frame)
+        else:
+            a_ps.writer = create_cache_writer(cache_path, start_frame, end_frame, ground, cache_error, cache_keyframes)
+    else:
+        a_ps.writer = Frame_writer(a_ps.instance_mesh, OUTPUTS)
+
+    integrator = getattr(a_ps, 'integrator', None)
+    if integrator is not None:
+        # checkpoints are only complete on frames that end a step
+        if checkpoint_interval % integrator.frames_per_step:
+            raise ValueError('Checkpoint every {} frames, not a multiple of the {} frames of a step'.format(
+                checkpoint_interval, integrator.frames_per_step))
+        if integrator.subframes:
+            if not cache_path:
+                raise ValueError('Sub-frame samples are written next to a frame cache')
+            path = subframe_path(cache_path)
+            point_cache.forget(path)
+            if resume_frame is not None:
+                integrator.subframe_writer = reopen_cache(path, a_ps.frame * integrator.subframes)
+            else:
+                integrator.subframe_writer = create_cache_writer(
+                    path, (start_frame - 1) * integrator.subframes + 1, end_frame * integrator.subframes,
+                    ground, cache_error, cache_keyframes)
+
+    if culling is not None:
+        proxies = {}
+        if not cache_path:
+            for band, (distance, mesh) in enumerate(culling.bands, 1):
+                if mesh is not None:
+                    proxies[band] = Frame_writer(mesh, OUTPUTS, 'lod{}_'.format(band))
+        a_ps.writer = Culling_writer(culling, a_ps.writer, proxies)
+
+    def after_step(frame):
+        if checkpoint_interval and (frame - start_frame + 1) % checkpoint_interval == 0:
+            checkpoint.save(a_ps, checkpoint_dir, random_seed)
+
+    return a_ps, after_step
+
+
+def create_cache_writer(path, start_frame, end_frame, ground, error=0.0, keyframe_interval=25):
+    '''Raw frame cache, or compressed when error is set'''
+    if not error:
+        return Frame_cache_writer(path, start_frame, end_frame)
+    # quantized from the ground's lower corner
+    bounds_min = [min(co[axis] for co in ground.bound_box) for axis in range(3)]
+    return Compressed_cache_writer(path, start_frame, end_frame, bounds_min, error, keyframe_interval)
+
+
+def subframe_writer(a_ps):
+    '''Writer of the sub-frame samples, None without'''
+    integrator = getattr(a_ps, 'integrator', None)
+    return integrator.subframe_writer if integrator is not None else None
+
+
+def finish_bake(a_ps, seconds):
+    a_ps.writer.close()
+    subframes = subframe_writer(a_ps)
+    if subframes is not None:
+        subframes.close()
+    a_ps.profiler.disable()
+    tiles = getattr(a_ps, 'tiles', None)
+    if tiles is not None:
+        tiles.close()
+    print('Simulated in {:05.5f} seconds'.format(seconds))
+    a_ps.writer.report()
+    if subframes is not None:
+        subframes.report()
+    a_ps.profiler.report()
+    if tiles is not None:
+        tiles.report()
+
+
+def bake(guide, ground, scale, number_ants, start_frame, end_frame, engine='OBJECT', cache_path=None, random_seed=0,
+         checkpoint_interval=0, resume_frame=None, profiler=None, lifecycle=None, culling=None,
+         cache_error=0.0, cache_keyframes=25, **options):
+    '''Simulate the colony, settings as in prepare_bake'''
+    a_ps, after_step = prepare_bake(guide, ground, scale, number_ants, start_frame, end_frame, engine, cache_path,
+                                    random_seed, checkpoint_interval, resume_frame, profiler, lifecycle, culling,
+                                    cache_error, cache_keyframes, **options)
 
     print('\n---')
     start = time()
-    seed(0)
-    noise.seed_set(0)
-    for f in range(start_frame, end_frame+1):
+    a_ps.profiler.enable()
+    for f in range(a_ps.frame+1, end_frame+1):
 #        a_ps.add_particles(1)
         if f%10 == 0:
             print('frame: {:04}'.format(f))
         a_ps.step()
-    print('Simulated in {:05.5f} seconds'.format(time() - start))
+        after_step(f)
+    finish_bake(a_ps, time() - start)
+    return a_ps
+
+
+def engine_options(scene):
+    '''Ant_system settings from the scene'''
+    if scene.ant_engine != 'ARRAY':
+        return {}
+    return {
+        'heightfield': scene.ant_ground_heightfield,
+        'turbulence_spacing': scene.ant_turbulence_spacing,
+        'turbulence_cache': bpy.path.abspath('//turbulence_cache') if bpy.data.filepath else None,
+        'guide_mode': scene.ant_guide_mode,
+        'workers': scene.ant_workers,
+        'random_streams': scene.ant_random_streams,
+        'steps_per_frame': scene.ant_steps_per_frame,
+        'subframes': scene.ant_subframes if scene.ant_output == 'CACHE' else 0,
+        }
+
+
+def create_lifecycle(guide, emit_rate, emit_from='RANDOM', lifetime=0, lifetime_variation=0.0, kill_at_path_end=False):
+    '''Lifecycle from the scene or command line settings, None when ants live forever'''
+    if not (emit_rate or lifetime or kill_at_path_end):
+        return None
+    emitters = []
+    if emit_rate:
+        if emit_from == 'ENDS':
+            # the first and last vertices ants can target
+            emitters.append(Vertex_emitter((1, len(guide.data.vertices)-2), emit_rate))
+        else:
+            emitters.append(Rate_emitter(emit_rate))
+    return Lifecycle(emitters, lifetime, lifetime_variation, kill_at_path_end)
+
+
+def create_culling(scene, start_frame, end_frame, margin=0.0, proxy_distance=0.0, proxy='', cull_distance=0.0):
+    '''
+    Camera culling from the scene or command line settings, None without a
+    scene camera. Ants beyond proxy_distance duplicate the proxy object,
+    beyond cull_distance they are not written, 0 for neither
+    '''
+    if scene.camera is None:
+        return None
+    bands = []
+    if proxy_distance and proxy:
+        bands.append((proxy_distance, bpy.data.objects[proxy].data))
+    if cull_distance:
+        bands.append((cull_distance, None))
+    return Camera_culling(scene.camera, scene, start_frame, end_frame, margin, bands)
+
+
+def bake_arguments(scene, cprofile=True):
+    '''bake() arguments from the scene settings'''
+#    guide = bpy.data.objects['Chemin']
+#    ground = bpy.data.objects['Sol']
+    guide = bpy.data.objects[scene.ant_guide]
+    ground = bpy.data.objects[scene.ant_ground]
+#    ground = bpy.context.selected_objects[-1]
+    cache_path = None
+    if scene.ant_output == 'CACHE':
+        cache_path = bpy.path.abspath(scene.ant_cache_path)
+    profiler = None
+    if scene.ant_stage_timings:
+        profile_path = bpy.path.abspath(scene.ant_profile_path) if scene.ant_profile_path and cprofile else None
+        profiler = Stage_profiler(profile_path)
+
+    arguments = dict(guide=guide, ground=ground, scale=scene.ant_scale, number_ants=scene.ant_number,
+                     start_frame=scene.ant_start_frame, end_frame=scene.ant_end_frame,
+                     engine=scene.ant_engine, cache_path=cache_path,
+                     checkpoint_interval=scene.ant_checkpoint_interval,
+                     resume_frame=scene.ant_resume_frame if cache_path and scene.ant_resume_frame else None,
+                     profiler=profiler,
+                     cache_error=scene.ant_cache_error if scene.ant_cache_compress else 0.0,
+                     cache_keyframes=scene.ant_cache_keyframes,
+                     lifecycle=create_lifecycle(guide, scene.ant_emit_rate, scene.ant_emit_from, scene.ant_lifetime,
+                                                scene.ant_lifetime_variation, scene.ant_kill_at_path_end))
+    if scene.ant_cull_camera:
+        arguments['culling'] = create_culling(scene, scene.ant_start_frame, scene.ant_end_frame, scene.ant_cull_margin,
+                                              scene.ant_proxy_distance, scene.ant_proxy, scene.ant_cull_distance)
+    arguments.update(engine_options(scene))
+    return arguments
+
+
+def main(context):
+
+    OUTPUTS.clear()
+    scene = bpy.context.scene
+    a_ps = bake(**bake_arguments(scene))
+
+    if scene.ant_output == 'CACHE':
+        subframes = a_ps.integrator.subframes if subframe_writer(a_ps) is not None else 0
+        point_cache.playback_object('ant_cache', scene.ant_cache_path, a_ps.instance_mesh, subframes)
+
+
+def parse_frames(text):
+    '''"1-1500" or a single frame "12"'''
+    start, _, end = text.partition('-')
+    return int(start), int(end or start)
+
+
+def add_switch(parser, name, default, help=None):
+    '''
+    --name and --no-name, so a setting saved on in the scene can be turned
+    off, argparse.BooleanOptionalAction is newer than Blender's Python
+    '''
+    dest = name.replace('-', '_')
+    parser.add_argument('--' + name, dest=dest, action='store_true', default=default, help=help)
+    parser.add_argument('--no-' + name, dest=dest, action='store_false')
+
+
+def run_batch(argv):
+    '''
+    Headless bake to a frame cache, settings default to the ones saved in the scene
+        blender -b file.blend --python fourmis.py -- --ants 20000 --frames 1-1500 --out cache/
+    '''
+    import argparse
+    scene = bpy.context.scene
+
+    parser = argparse.ArgumentParser(prog='fourmis.py', description='Bake an ant colony to a frame cache')
+    parser.add_argument('--ants', type=int, default=scene.ant_number)
+    parser.add_argument('--frames', type=parse_frames,
+                        default=(scene.ant_start_frame, scene.ant_end_frame),
+                        help='frame range, eg. 1-1500')
+    parser.add_argument('--scale', type=float, default=scene.ant_scale)
+    parser.add_argument('--ground', default=scene.ant_ground)
+    parser.add_argument('--guide', default=scene.ant_guide)
+    parser.add_argument('--instance', default=scene.ant_instance)
+    parser.add_argument('--engine', choices=('OBJECT', 'COMPACT', 'ARRAY'), default=scene.ant_engine)
+    parser.add_argument('--seed', type=int, default=0)
+    add_switch(parser, 'heightfield', scene.ant_ground_heightfield,
+               help='project on the ground as a height field, for regular grids')
+    parser.add_argument('--guide-mode', choices=('VERTEX', 'ARC'), default=scene.ant_guide_mode)
+    parser.add_argument('--turbulence-spacing', type=float, default=scene.ant_turbulence_spacing,
+                        help='bake the turbulence on a lattice of this spacing, 0 for exact')
+    parser.add_argument('--workers', type=int, default=scene.ant_workers,
+                        help='step spatial tiles of the colony on this many threads')
+    add_switch(parser, 'random-streams', scene.ant_random_streams,
+               help='per ant random streams, the same draws in any order, tiling or resume')
+    parser.add_argument('--steps-per-frame', type=float, default=scene.ant_steps_per_frame,
+                        help='simulation steps per frame, eg. 4, or 0.5 to step every other frame and interpolate')
+    parser.add_argument('--subframes', type=int, default=scene.ant_subframes,
+                        help='sub-frame samples per frame for motion blur, written next to the cache')
+    parser.add_argument('--out', default=os.path.dirname(scene.ant_cache_path) or '//', help='cache directory')
+    parser.add_argument('--name', default=os.path.splitext(os.path.basename(scene.ant_cache_path))[0] or 'ants',
+                        help='cache file name, without extension')
+    parser.add_argument('--cache-error', type=float,
+                        default=scene.ant_cache_error if scene.ant_cache_compress else 0.0,
+                        help='compress the cache, positions within this distance, 0 for a raw cache')
+    parser.add_argument('--keyframes', type=int, default=scene.ant_cache_keyframes,
+                        help='frames between full frames of a compressed cache')
+    parser.add_argument('--checkpoint-every', type=int, default=scene.ant_checkpoint_interval,
+                        help='save the full state every N frames, 0 for never')
+    parser.add_argument('--resume', type=int, nargs='?', const=-1, default=None,
+                        help='re-simulate from the last checkpoint before this frame, alone: after the last checkpoint')
+    parser.add_argument('--emit-rate', type=float, default=scene.ant_emit_rate,
+                        help='new ants per frame, 0 for none')
+    parser.add_argument('--emit-from', choices=('RANDOM', 'ENDS'), default=scene.ant_emit_from)
+    parser.add_argument('--lifetime', type=int, default=scene.ant_lifetime, help='frames, 0 to live forever')
+    parser.add_argument('--lifetime-variation', type=float, default=scene.ant_lifetime_variation)
+    add_switch(parser, 'kill-at-ends', scene.ant_kill_at_path_end,
+               help='ants die at the ends of the guide instead of turning around')
+    add_switch(parser, 'cull-camera', scene.ant_cull_camera, help='only write the ants the scene camera sees')
+    parser.add_argument('--cull-margin', type=float, default=scene.ant_cull_margin)
+    parser.add_argument('--cull-distance', type=float, default=scene.ant_cull_distance,
+                        help='do not write ants farther from the camera, 0 for the clip end')
+    add_switch(parser, 'stage-timings', scene.ant_stage_timings, help='time each stage of the step')
+    parser.add_argument('--profile', metavar='PATH', help='also run under cProfile and write the stats there')
+    parser.add_argument('--allocations', action='store_true',
+                        help='count allocated blocks per stage, slow on large heaps')
+    args = parser.parse_args(argv)
+
+    out = bpy.path.abspath(args.out)
+    if not os.path.isdir(out):
+        os.makedirs(out)
+    cache_path = os.path.join(out, args.name + '.cache')
+
+    scene.ant_instance = args.instance
+    start_frame, end_frame = args.frames
+    resume_frame = args.resume
+    options = {}
+    if args.engine == 'ARRAY':
+        options['heightfield'] = args.heightfield
+        options['turbulence_spacing'] = args.turbulence_spacing
+        options['guide_mode'] = args.guide_mode
+        options['workers'] = args.workers
+        options['random_streams'] = args.random_streams
+        options['steps_per_frame'] = args.steps_per_frame
+        options['subframes'] = args.subframes
+        options['turbulence_cache'] = os.path.join(out, 'turbulence_cache')
+    if resume_frame == -1:
+        resume_frame = end_frame + 1
+    guide = bpy.data.objects[args.guide]
+    lifecycle = create_lifecycle(guide, args.emit_rate, args.emit_from, args.lifetime,
+                                 args.lifetime_variation, args.kill_at_ends)
+    profiler = None
+    if args.stage_timings or args.profile or args.allocations:
+        profiler = Stage_profiler(args.profile, args.allocations)
+    culling = None
+    if args.cull_camera:
+        # proxies need object output, a cache has one instance
+        culling = create_culling(scene, start_frame, end_frame, args.cull_margin, cull_distance=args.cull_distance)
+    start = time()
+    a_ps = bake(guide, bpy.data.objects[args.ground], args.scale, args.ants,
+                start_frame, end_frame, args.engine, cache_path, args.seed,
+                args.checkpoint_every, resume_frame, profiler, lifecycle, culling,
+                args.cache_error, args.keyframes, **options)
+    elapsed = time() - start
+
+    # a resumed bake only simulates the frames after its checkpoint, and
+    # births and deaths change the ants from frame to frame
+    timings = getattr(a_ps.writer, 'output', a_ps.writer).timings
+    ants = timings[-1][1] if timings else 0
+    print('Baked {} frames to {}, {} ants at the end, in {:05.5f} seconds, {:.0f} ants.frames/s'.format(
+        len(timings), cache_path, ants, elapsed, sum(n for f, n, t in timings) / elapsed))
+    return cache_path
 
 
 class AntPanel(bpy.types.Panel):
@@ -297,6 +801,46 @@ class AntPanel(bpy.types.Panel):
         column.prop(scene, "ant_start_frame")
         column.prop(scene, "ant_end_frame")
         column.prop(scene, "ant_scale")
+        column.prop(scene, "ant_engine")
+        if scene.ant_engine == 'ARRAY':
+            column.prop(scene, "ant_ground_heightfield")
+            column.prop(scene, "ant_turbulence_spacing")
+            column.prop(scene, "ant_guide_mode")
+            column.prop(scene, "ant_worker_thread")
+            column.prop(scene, "ant_workers")
+            column.prop(scene, "ant_random_streams")
+            column.prop(scene, "ant_steps_per_frame")
+            if scene.ant_output == 'CACHE':
+                column.prop(scene, "ant_subframes")
+        column = layout.column(align=True)
+        column.prop(scene, "ant_emit_rate")
+        if scene.ant_emit_rate:
+            column.prop(scene, "ant_emit_from")
+        column.prop(scene, "ant_lifetime")
+        if scene.ant_lifetime:
+            column.prop(scene, "ant_lifetime_variation")
+        column.prop(scene, "ant_kill_at_path_end")
+        column = layout.column(align=True)
+        column.prop(scene, "ant_cull_camera")
+        if scene.ant_cull_camera:
+            column.prop(scene, "ant_cull_margin")
+            column.prop(scene, "ant_cull_distance")
+            if scene.ant_output == 'OBJECTS':
+                column.prop(scene, "ant_proxy_distance")
+                column.prop_search(scene, "ant_proxy", scene, "objects")
+        column = layout.column(align=True)
+        column.prop(scene, "ant_output")
+        if scene.ant_output == 'CACHE':
+            column.prop(scene, "ant_cache_path")
+            column.prop(scene, "ant_cache_compress")
+            if scene.ant_cache_compress:
+                column.prop(scene, "ant_cache_error")
+                column.prop(scene, "ant_cache_keyframes")
+            column.prop(scene, "ant_checkpoint_interval")
+            column.prop(scene, "ant_resume_frame")
+        column.prop(scene, "ant_stage_timings")
+        if scene.ant_stage_timings:
+            column.prop(scene, "ant_profile_path")
         column = layout.column(align=True)
         column.prop_search(scene, "ant_ground", scene, "objects")
         column.prop_search(scene, "ant_guide", scene, "objects")
@@ -306,6 +850,14 @@ class AntPanel(bpy.types.Panel):
 
         column = layout.row()
         column.operator("ant.generate")
+        job = modal_bake.running.get("ant.generate_modal")
+        if job is not None:
+            layout.label(text=job.status())
+        else:
+            column = layout.row(align=True)
+            column.operator("ant.generate_modal", text='Interactive Bake')
+            if "ant.generate_modal" in modal_bake.paused:
+                column.operator("ant.generate_modal", text='Resume').resume = True
 
 
 class AntOperator(bpy.types.Operator):
@@ -321,6 +873,54 @@ class AntOperator(bpy.types.Operator):
         main(context)
         return {'FINISHED'}
 
+
+class AntModalOperator(Modal_bake, bpy.types.Operator):
+    """Generate ant colony in the background, Esc to stop"""
+    bl_idname = "ant.generate_modal"
+    bl_label = "Ant Generator (Interactive)"
+
+    resume = bpy.props.BoolProperty(name='Resume', description='Continue the stopped bake', default=False)
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT' and cls.bl_idname not in modal_bake.running
+
+    def create_job(self, context):
+        scene = context.scene
+        OUTPUTS.clear()
+        # cProfile would also profile the UI between timer events
+        arguments = bake_arguments(scene, cprofile=False)
+        a_ps, after_step = prepare_bake(**arguments)
+        threaded = scene.ant_engine == 'ARRAY' and scene.ant_worker_thread
+        return Bake_job(a_ps, arguments['end_frame'], after_step, threaded)
+
+    def resume_job(self, context, job):
+        # the stopped bake closed its cache, write on after the last frame
+        writer = job.a_ps.writer
+        cache = getattr(writer, 'output', writer)
+        if isinstance(cache, CACHE_WRITERS):
+            point_cache.forget(cache.path)
+            cache = type(cache).reopen(cache.path, job.a_ps.frame)
+            if isinstance(writer, Culling_writer):
+                writer.output = cache
+            else:
+                job.a_ps.writer = cache
+        subframes = subframe_writer(job.a_ps)
+        if subframes is not None:
+            point_cache.forget(subframes.path)
+            job.a_ps.integrator.subframe_writer = type(subframes).reopen(
+                subframes.path, job.a_ps.frame * job.a_ps.integrator.subframes)
+
+    def finish(self, context, job, cancelled):
+        finish_bake(job.a_ps, job.seconds)
+        if cancelled:
+            self.report({'INFO'}, 'Stopped after frame {}, Resume continues the bake'.format(job.frame))
+        if isinstance(getattr(job.a_ps.writer, 'output', job.a_ps.writer), CACHE_WRITERS):
+            subframes = job.a_ps.integrator.subframes if subframe_writer(job.a_ps) is not None else 0
+            point_cache.playback_object('ant_cache', context.scene.ant_cache_path, job.a_ps.instance_mesh,
+                                        subframes)
+
+
 def register():
     bpy.types.Scene.ant_number = bpy.props.IntProperty(name='Number Of Ants', description='Number Of Ants', min=1, soft_max=1000, default = 100)
     bpy.types.Scene.ant_start_frame = bpy.props.IntProperty(name='Start Frame', description='Start Frame', min=0, soft_max=1000, default = 1)
@@ -329,14 +929,60 @@ def register():
     bpy.types.Scene.ant_ground = bpy.props.StringProperty(name='Ground Object', description='Ground Object', default='')
     bpy.types.Scene.ant_guide = bpy.props.StringProperty(name='Guide Object', description='Guide Object', default='')
     bpy.types.Scene.ant_instance = bpy.props.StringProperty(name='Instance Object', description='Instance Object', default='')
+    bpy.types.Scene.ant_engine = bpy.props.EnumProperty(name='Engine', description='Simulation Engine', items=[
+        ('OBJECT', 'Objects', 'One Python object per ant'),
+        ('COMPACT', 'Compact Objects', 'Objects stored in shared arrays, for memory only: a fraction of the memory, slower to step'),
+        ('ARRAY', 'Arrays', 'NumPy arrays, all ants stepped at once'),
+        ], default='OBJECT')
+    bpy.types.Scene.ant_ground_heightfield = bpy.props.BoolProperty(name='Height Field Ground', description='Project ants vertically on the ground, for grounds that are a regular grid', default=False)
+    bpy.types.Scene.ant_turbulence_spacing = bpy.props.FloatProperty(name='Turbulence Lattice', description='Spacing of the baked turbulence lattice, 0 for exact turbulence', min=0.0, soft_max=1.0, default=0.0, precision=3)
+    bpy.types.Scene.ant_guide_mode = bpy.props.EnumProperty(name='Guide', description='How ants follow the guide', items=[
+        ('VERTEX', 'Vertices', 'Target the next guide vertex'),
+        ('ARC', 'Arc Length', 'Target a distance along the guide, smooth on sparse guides'),
+        ], default='VERTEX')
+    bpy.types.Scene.ant_emit_rate = bpy.props.FloatProperty(name='Emission Rate', description='New ants per frame during the bake, 0 for none', min=0.0, soft_max=100.0, default=0.0)
+    bpy.types.Scene.ant_emit_from = bpy.props.EnumProperty(name='Emit From', description='Where new ants appear', items=[
+        ('RANDOM', 'Random Vertices', 'Random guide vertices, like the first ants'),
+        ('ENDS', 'Path Ends', 'Both ends of the guide, each emits the rate'),
+        ], default='RANDOM')
+    bpy.types.Scene.ant_lifetime = bpy.props.IntProperty(name='Lifetime', description='Frames an ant lives, 0 to live forever', min=0, soft_max=1000, default=0)
+    bpy.types.Scene.ant_lifetime_variation = bpy.props.FloatProperty(name='Lifetime Variation', description='Standard deviation of the lifetime, in frames', min=0.0, soft_max=100.0, default=0.0)
+    bpy.types.Scene.ant_kill_at_path_end = bpy.props.BoolProperty(name='Die At Path Ends', description='Ants die when they reach an end of the guide instead of turning around', default=False)
+    bpy.types.Scene.ant_output = bpy.props.EnumProperty(name='Output', description='Simulation Output', items=[
+        ('OBJECTS', 'Objects', 'Two new objects per frame'),
+        ('CACHE', 'Point Cache', 'One cache file, played back by a single object'),
+        ], default='OBJECTS')
+    bpy.types.Scene.ant_cache_path = bpy.props.StringProperty(name='Cache File', description='Cache File', subtype='FILE_PATH', default='//ants.cache')
+    bpy.types.Scene.ant_cache_compress = bpy.props.BoolProperty(name='Compress Cache', description='Quantize and delta encode the cache, a fraction of the size', default=False)
+    bpy.types.Scene.ant_cache_error = bpy.props.FloatProperty(name='Position Error', description='Largest error on a cached coordinate', min=0.00001, soft_max=0.1, default=0.001, precision=4)
+    bpy.types.Scene.ant_cache_keyframes = bpy.props.IntProperty(name='Keyframe Every', description='Frames between full frames, seeking reads at most that many', min=1, soft_max=250, default=25)
+    bpy.types.Scene.ant_checkpoint_interval = bpy.props.IntProperty(name='Checkpoint Every', description='Save the simulation state every N frames, 0 to disable', min=0, soft_max=1000, default = 0)
+    bpy.types.Scene.ant_resume_frame = bpy.props.IntProperty(name='Resume From', description='Re-simulate from the last checkpoint before this frame, 0 for a full bake', min=0, soft_max=1000, default = 0)
+    bpy.types.Scene.ant_steps_per_frame = bpy.props.FloatProperty(name='Steps Per Frame', description='Simulation steps per frame: more for fast ants, less than one (1/2, 1/3...) steps every few frames and interpolates the frames in between', min=0.01, soft_max=8.0, default=1.0)
+    bpy.types.Scene.ant_subframes = bpy.props.IntProperty(name='Motion Blur Samples', description='Sub-frame samples per frame written next to the cache, played back at sub-frames for motion blur, 0 for none', min=0, soft_max=16, default=0)
+    bpy.types.Scene.ant_workers = bpy.props.IntProperty(name='Tile Workers', description='Step spatial tiles of the colony on this many threads, same result as one', min=1, soft_max=32, default=1)
+    bpy.types.Scene.ant_random_streams = bpy.props.BoolProperty(name='Random Streams', description='Each ant draws from its own random stream, keyed by the seed, its id and the frame: the same result in any order, with tiles or emission. Not the same colony as the Objects engine', default=False)
+    bpy.types.Scene.ant_worker_thread = bpy.props.BoolProperty(name='Worker Thread', description='Interactive bakes step the ants on a worker thread, only the frame output runs in the interface', default=True)
+    bpy.types.Scene.ant_stage_timings = bpy.props.BoolProperty(name='Stage Timings', description='Time each stage of the step and print a breakdown after the bake', default=False)
+    bpy.types.Scene.ant_cull_camera = bpy.props.BoolProperty(name='Camera Culling', description='Only write the ants the scene camera sees, the simulation is unchanged', default=False)
+    bpy.types.Scene.ant_cull_margin = bpy.props.FloatProperty(name='Cull Margin', description='Ants this far outside the frame are still written, about the instance size', min=0.0, soft_max=1.0, default=0.05)
+    bpy.types.Scene.ant_cull_distance = bpy.props.FloatProperty(name='Cull Distance', description='Do not write ants farther from the camera, 0 for the camera clip end', min=0.0, soft_max=1000.0, default=0.0)
+    bpy.types.Scene.ant_proxy_distance = bpy.props.FloatProperty(name='Proxy Distance', description='Farther ants duplicate the proxy object, 0 for no proxy', min=0.0, soft_max=1000.0, default=0.0)
+    bpy.types.Scene.ant_proxy = bpy.props.StringProperty(name='Proxy Object', description='Cheaper object duplicated by distant ants', default='')
+    bpy.types.Scene.ant_profile_path = bpy.props.StringProperty(name='Profile File', description='Also run the bake under cProfile and write the stats to this file, empty to disable', subtype='FILE_PATH', default='')
 
     bpy.utils.register_module(__name__)
+    point_cache.register_playback()
 
 def unregister():
+    point_cache.unregister_playback()
     bpy.utils.unregister_module(__name__)
 
 if __name__ == "__main__":
     register()
+    # arguments after '--' are for the headless bake
+    if '--' in sys.argv:
+        run_batch(sys.argv[sys.argv.index('--')+1:])
 #
 #    # test call
 #    bpy.ops.object.simple_operator()
@@ -0,0 +1,271 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import numpy as np
+from time import time
+
+'''
+Binary frame cache, read through numpy.memmap
+
+    header      HEADER
+    index       INDEX * frame_count, one entry per frame of the range
+    frames      for each written frame, at its index offset:
+                    ids         uint32 * count
+                    co          float32 * count * 3
+                    velocity    float32 * count * 3
+
+Frames are appended as they are simulated, the index entry is written after
+the data so an interrupted bake still reads back up to its last frame.
+Unwritten frames have a zero offset. Every frame has its own particle count.
+'''
+
+MAGIC = b'ANTCACHE'
+VERSION = 1
+
+HEADER = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('frame_start', '<i4'),
+    ('frame_count', '<u4'),
+    ('reserved', '<u4'),
+    ])
+
+INDEX = np.dtype([
+    ('offset', '<u8'),
+    ('count', '<u4'),
+    ('reserved', '<u4'),
+    ])
+
+
+def frame_size(count):
+    '''Bytes taken by a frame of count particles'''
+    return count * (4 + 12 + 12)
+
+
+def check_header(header, layout, path):
+    '''header read from path, checked against the MAGIC and VERSION of layout'''
+    if header['magic'] != layout.MAGIC or header['version'] != layout.VERSION:
+        raise ValueError('{} is not a {} file'.format(path, layout.__name__))
+    return header
+
+
+class Frame_cache_writer:
+    '''
+    Output backend with the same interface as frame_writer.Frame_writer
+    Other cache formats with a header and a per-frame index of offsets
+    subclass it, with their own layout and write()
+    '''
+
+    HEADER = HEADER
+    INDEX = INDEX
+    MAGIC = MAGIC
+    VERSION = VERSION
+
+
+    def __init__(self, path, frame_start, frame_end):
+        self.path = path
+        self.frame_start = frame_start
+        self.frame_count = frame_end - frame_start + 1
+        self.timings = []
+
+        self.file = open(path, 'wb')
+        self.file.write(self.header().tobytes())
+        self.file.write(np.zeros(self.frame_count, dtype=self.INDEX).tobytes())
+        self.end = self.file.tell()
+
+    def header(self):
+        header = np.zeros(1, dtype=self.HEADER)
+        header['magic'] = self.MAGIC
+        header['version'] = self.VERSION
+        header['frame_start'] = self.frame_start
+        header['frame_count'] = self.frame_count
+        return header
+
+    def read_header(self, header):
+        self.frame_start = int(header['frame_start'])
+        self.frame_count = int(header['frame_count'])
+
+    @classmethod
+    def reopen(cls, path, frame):
+        '''Continue writing an existing cache after frame, later frames are dropped'''
+        writer = cls.__new__(cls)
+        writer.path = path
+        writer.timings = []
+        writer.file = open(path, 'r+b')
+
+        header = np.frombuffer(writer.file.read(cls.HEADER.itemsize), dtype=cls.HEADER)[0]
+        writer.read_header(check_header(header, cls, path))
+        index = np.frombuffer(writer.file.read(writer.frame_count * cls.INDEX.itemsize), dtype=cls.INDEX).copy()
+
+        # frames are stored in the order they were simulated, cut at the
+        # first dropped one
+        first_dropped = max(frame - writer.frame_start + 1, 0)
+        dropped = index['offset'][first_dropped:]
+        dropped = dropped[dropped > 0]
+        writer.file.seek(0, 2)
+        writer.end = int(dropped.min()) if len(dropped) else writer.file.tell()
+
+        index[first_dropped:] = np.zeros(1, dtype=cls.INDEX)
+        writer.file.seek(cls.HEADER.itemsize)
+        writer.file.write(index.tobytes())
+        writer.file.truncate(writer.end)
+        return writer
+
+    def write(self, frame, co, velocity, ids=None):
+        '''Append one frame, ids default to the particle order'''
+        start = time()
+        i = frame - self.frame_start
+        if not 0 <= i < self.frame_count:
+            raise ValueError('Frame {} outside of the cache range'.format(frame))
+
+        co = np.ascontiguousarray(co, dtype='<f4').reshape(-1, 3)
+        velocity = np.ascontiguousarray(velocity, dtype='<f4').reshape(-1, 3)
+        if ids is None:
+            ids = np.arange(len(co), dtype='<u4')
+        ids = np.ascontiguousarray(ids, dtype='<u4')
+
+        offset = self.end
+        self.file.seek(offset)
+        self.file.write(ids.tobytes())
+        self.file.write(co.tobytes())
+        self.file.write(velocity.tobytes())
+        self.end = self.file.tell()
+
+        entry = np.zeros(1, dtype=INDEX)
+        entry['offset'] = offset
+        entry['count'] = len(co)
+        self.file.seek(HEADER.itemsize + i * INDEX.itemsize)
+        self.file.write(entry.tobytes())
+
+        self.timings.append((frame, len(co), time() - start))
+
+    def close(self):
+        self.file.close()
+
+    def report(self):
+        if not self.timings:
+            return
+        seconds = sum(t for f, n, t in self.timings)
+        print('Frames cached: {} in {}, {:.1f} MB, total {:05.5f} seconds'.format(
+            len(self.timings), self.path, self.end / 2**20, seconds))
+
+
+class Frame_cache_reader:
+
+    HEADER = HEADER
+    INDEX = INDEX
+    MAGIC = MAGIC
+    VERSION = VERSION
+
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self.refresh()
+
+    def refresh(self):
+        '''Map the file again if it grew, eg. while it is still being baked'''
+        size = os.path.getsize(self.path)
+        if size == self.size:
+            return
+        self.size = size
+        header = np.fromfile(self.path, dtype=self.HEADER, count=1)[0]
+        self.read_header(check_header(header, type(self), self.path))
+        self.index = np.memmap(self.path, dtype=self.INDEX, mode='r',
+                               offset=self.HEADER.itemsize, shape=(self.frame_count,))
+        self.data = np.memmap(self.path, dtype=np.uint8, mode='r')
+
+    def read_header(self, header):
+        self.frame_start = int(header['frame_start'])
+        self.frame_count = int(header['frame_count'])
+
+    @property
+    def frame_end(self):
+        return self.frame_start + self.frame_count - 1
+
+    def frames(self):
+        '''Frame numbers that were written'''
+        return np.flatnonzero(self.index['offset']) + self.frame_start
+
+    def frame(self, frame):
+        '''
+        (ids, co, velocity) of a frame, None if it was not written
+        The arrays are views on the mapped file, only this frame's pages are read
+        '''
+        i = frame - self.frame_start
+        if not 0 <= i < self.frame_count:
+            return None
+        entry = self.index[i]
+        offset, count = int(entry['offset']), int(entry['count'])
+        if not offset:
+            self.refresh()
+            entry = self.index[i]
+            offset, count = int(entry['offset']), int(entry['count'])
+            if not offset:
+                return None
+        if offset + frame_size(count) > len(self.data):
+            self.refresh()
+
+        block = self.data[offset:offset + frame_size(count)]
+        ids = block[:4 * count].view('<u4')
+        co = block[4 * count:16 * count].view('<f4').reshape(count, 3)
+        velocity = block[16 * count:].view('<f4').reshape(count, 3)
+        return ids, co, velocity
+
+    def close(self):
+        del self.index
+        del self.data
+
+
+def merge(paths, path, open_reader=Frame_cache_reader):
+    '''
+    Combine several caches into one, frame by frame
+    Particle ids are shifted so they stay unique across the inputs
+    open_reader opens the inputs, compressed_cache.open_cache for any kind
+    '''
+    readers = [open_reader(p) for p in paths]
+    frame_start = min(r.frame_start for r in readers)
+    frame_end = max(r.frame_end for r in readers)
+
+    # id offset of each input: the ids of all the previous ones come first
+    offsets = []
+    next_id = 0
+    for r in readers:
+        offsets.append(next_id)
+        last = 0
+        for f in r.frames():
+            ids = r.frame(f)[0]
+            if len(ids):
+                last = max(last, int(ids.max()) + 1)
+        next_id += last
+
+    writer = Frame_cache_writer(path, frame_start, frame_end)
+    for f in range(frame_start, frame_end+1):
+        frames = [(r.frame(f), offset) for r, offset in zip(readers, offsets)]
+        frames = [(data, offset) for data, offset in frames if data is not None]
+        if not frames:
+            continue
+        writer.write(f,
+                     np.concatenate([co for (ids, co, vel), offset in frames]),
+                     np.concatenate([vel for (ids, co, vel), offset in frames]),
+                     np.concatenate([ids.astype(np.int64) + offset for (ids, co, vel), offset in frames]))
+    writer.close()
+    for r in readers:
+        r.close()
+    return writer
@@ -0,0 +1,116 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import bpy
+from time import time
+
+from visibility import Visibility_animator
+
+'''
+Frame output shared by the particle system template and fourmis
+Each frame is a generator mesh with one vertex per particle, duplicating an
+instance object, visible on its own frame only
+'''
+
+ID_LAYER = 'id'
+
+
+def write_vertices(mesh, co, normal):
+    '''
+    Allocate all the vertices at once and fill them from flat float buffers
+    (x0, y0, z0, x1, ...), NumPy float32 arrays are used without copy
+    '''
+    mesh.vertices.add(len(co) // 3)
+    mesh.vertices.foreach_set('co', co)
+    mesh.vertices.foreach_set('normal', normal)
+
+
+def write_ids(mesh, ids):
+    '''Particle ids in an integer vertex layer, vertex order alone loses them once particles are culled'''
+    layer = mesh.vertex_layers_int.new(ID_LAYER)
+    layer.data.foreach_set('value', ids)
+
+
+class Frame_writer:
+
+
+    def __init__(self, instance_mesh, registry=None, prefix=''):
+        '''
+        registry (output_registry.Output_registry) tracks the created objects for teardown,
+        prefix starts the object names, for several writers in one bake
+        '''
+        self.instance_mesh = instance_mesh
+        self.registry = registry
+        self.prefix = prefix
+        # (frame, particle count, seconds) for each written frame
+        self.timings = []
+        self.visibility = Visibility_animator(registry)
+
+    def write(self, frame, co, normal, ids=None):
+        '''
+        For each frame:
+            - create a new instance of the object to duplicate (eg. a sphere)
+            - create a new generator object, its vertices are the particles
+                - this object will be used for duplication
+            - parent the object to duplicate to the generator object
+            - animate the visibility of the generator, keys are written on close
+        ids go to the generator's id vertex layer
+            '''
+        start = time()
+
+        instance_obj_frame = bpy.data.objects.new('{}instance_{:05}'.format(self.prefix, frame), self.instance_mesh)
+        bpy.context.scene.objects.link(instance_obj_frame)
+
+        name = '{}generator_{:05}'.format(self.prefix, frame)
+        generator_mesh = bpy.data.meshes.new(name)
+        write_vertices(generator_mesh, co, normal)
+        if ids is not None:
+            write_ids(generator_mesh, ids)
+
+        generator_obj = bpy.data.objects.new(name, generator_mesh)
+        bpy.context.scene.objects.link(generator_obj)
+
+        instance_obj_frame.parent = generator_obj
+        generator_obj.dupli_type = "VERTS"
+        generator_obj.use_dupli_vertices_rotation = True
+
+        if self.registry is not None:
+            self.registry.tag(generator_mesh)
+            self.registry.add(instance_obj_frame, generator_obj)
+
+        #anim
+        self.visibility.add(generator_obj, frame)
+
+        self.timings.append((frame, len(co) // 3, time() - start))
+        return generator_obj
+
+    def close(self):
+        self.visibility.write()
+
+    def report(self):
+        '''Print per-frame write times, the cost per particle should stay flat'''
+        if not self.timings:
+            return
+        seconds = [t for f, n, t in self.timings]
+        per_particle = [t / max(n, 1) * 1e6 for f, n, t in self.timings]
+        print('Frames written: {}, total {:05.5f} seconds'.format(len(seconds), sum(seconds)))
+        print('    per frame: mean {:.2f} ms, max {:.2f} ms'.format(
+            sum(seconds) / len(seconds) * 1000, max(seconds) * 1000))
+        print('    per particle: first frame {:.3f} us, last frame {:.3f} us, max {:.3f} us'.format(
+            per_particle[0], per_particle[-1], max(per_particle)))
+        print('Visibility keys written in {:05.5f} seconds'.format(self.visibility.seconds))
@@ -0,0 +1,129 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import bpy
+import numpy as np
+from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+
+'''
+Ground projection for all ants at once
+A BVH tree is built once over the ground instead of asking the object for
+its closest point every frame. Grounds that are a regular grid with a
+single height per (x, y) can use a height field instead, which needs no
+tree at all.
+Everything is in the ground object's local space, like
+Object.closest_point_on_mesh.
+'''
+
+
+class Height_field:
+    '''
+    Regular grid of heights, bilinear between vertices
+    Points are projected vertically, which is close to the closest point as
+    long as the ground has no steep slopes
+    '''
+
+
+    def __init__(self, origin, spacing, heights):
+        self.origin = origin
+        self.spacing = spacing
+        # heights[row (y), column (x)]
+        self.heights = heights
+
+    @classmethod
+    def from_vertices(cls, co, tolerance=1e-5):
+        '''Height field from a (n, 3) vertex array, None if it isn't a regular grid'''
+        if len(co) < 4:
+            return None
+        xs = np.unique(np.round(co[:, 0] / tolerance)) * tolerance
+        ys = np.unique(np.round(co[:, 1] / tolerance)) * tolerance
+        if len(xs) < 2 or len(ys) < 2 or len(xs) * len(ys) != len(co):
+            return None
+        dx, dy = np.diff(xs), np.diff(ys)
+        if not (np.allclose(dx, dx[0], atol=tolerance * 10) and np.allclose(dy, dy[0], atol=tolerance * 10)):
+            return None
+
+        spacing = np.array((dx[0], dy[0]))
+        origin = np.array((xs[0], ys[0]))
+        cells = np.round((co[:, :2] - origin) / spacing).astype(np.int64)
+        heights = np.full((len(ys), len(xs)), np.nan)
+        heights[cells[:, 1], cells[:, 0]] = co[:, 2]
+        # two vertices on the same (x, y): not single-valued in z
+        if np.isnan(heights).any():
+            return None
+        return cls(origin, spacing, heights)
+
+    def project(self, location):
+        rows, columns = self.heights.shape
+        grid = (location[:, :2] - self.origin) / self.spacing
+        grid[:, 0] = np.clip(grid[:, 0], 0, columns - 1)
+        grid[:, 1] = np.clip(grid[:, 1], 0, rows - 1)
+        i = np.minimum(np.floor(grid[:, 0]).astype(np.int64), columns - 2)
+        j = np.minimum(np.floor(grid[:, 1]).astype(np.int64), rows - 2)
+        tx = grid[:, 0] - i
+        ty = grid[:, 1] - j
+
+        z00 = self.heights[j, i]
+        z10 = self.heights[j, i+1]
+        z01 = self.heights[j+1, i]
+        z11 = self.heights[j+1, i+1]
+
+        closest = np.empty_like(location)
+        closest[:, :2] = grid * self.spacing + self.origin
+        closest[:, 2] = (z00 * (1-tx) + z10 * tx) * (1-ty) + (z01 * (1-tx) + z11 * tx) * ty
+
+        normal = np.empty_like(location)
+        normal[:, 0] = -((z10 - z00) * (1-ty) + (z11 - z01) * ty) / self.spacing[0]
+        normal[:, 1] = -((z01 - z00) * (1-tx) + (z11 - z10) * tx) / self.spacing[1]
+        normal[:, 2] = 1.0
+        normal /= np.sqrt((normal * normal).sum(axis=1))[:, None]
+        return closest, normal
+
+
+class Ground_projector:
+
+
+    def __init__(self, ground, heightfield=False):
+        self.ground = ground
+        self.tree = BVHTree.FromObject(ground, bpy.context.scene)
+
+        self.heightfield = None
+        if heightfield:
+            if ground.modifiers:
+                print('Ground has modifiers, height field disabled')
+            else:
+                vertices = ground.data.vertices
+                co = np.zeros(len(vertices) * 3, dtype=np.float32)
+                vertices.foreach_get('co', co)
+                self.heightfield = Height_field.from_vertices(co.reshape(-1, 3).astype(np.float64))
+                if self.heightfield is None:
+                    print('Ground is not a regular grid, height field disabled')
+
+    def project(self, location):
+        '''Closest ground point and normal for each location'''
+        if self.heightfield is not None:
+            closest, normal = self.heightfield.project(location.astype(np.float64))
+            return closest.astype(location.dtype), normal.astype(location.dtype)
+
+        closest = np.empty_like(location)
+        normal = np.empty_like(location)
+        find_nearest = self.tree.find_nearest
+        for i, co in enumerate(location):
+            closest[i], normal[i] = find_nearest(Vector(co))[:2]
+        return closest, normal
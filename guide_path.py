@@ -0,0 +1,76 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import numpy as np
+
+'''
+Guide curve as a polyline parameterized by arc length
+Ants track their target as a distance along the path, targets and
+projections are computed for all ants at once
+'''
+
+
+class Guide_path:
+
+
+    def __init__(self, points):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.deltas = np.diff(self.points, axis=0)
+        self.segment_length = np.sqrt((self.deltas * self.deltas).sum(axis=1))
+        # arc length at each vertex
+        self.arc = np.concatenate(([0.0], np.cumsum(self.segment_length)))
+        self.length = self.arc[-1]
+        self.spacing = self.length / max(len(self.segment_length), 1)
+
+    @classmethod
+    def from_object(cls, guide):
+        vertices = guide.data.vertices
+        co = np.zeros(len(vertices) * 3, dtype=np.float32)
+        vertices.foreach_get('co', co)
+        return cls(co.reshape(-1, 3))
+
+    def segment(self, s):
+        '''Index of the segment holding each arc length'''
+        return np.clip(np.searchsorted(self.arc, s, side='right') - 1, 0, len(self.deltas) - 1)
+
+    def point_at(self, s):
+        seg = self.segment(s)
+        t = (np.clip(s, 0.0, self.length) - self.arc[seg]) / np.where(self.segment_length[seg] > 0, self.segment_length[seg], 1.0)
+        return self.points[seg] + self.deltas[seg] * t[:, None]
+
+    def project(self, location, near, window=3):
+        '''
+        Arc length of the closest path point to each location, searched
+        within window segments of the arc length near
+        '''
+        segs = self.segment(near)[:, None] + np.arange(-window, window+1)
+        segs = np.clip(segs, 0, len(self.deltas) - 1)
+
+        start = self.points[segs]
+        delta = self.deltas[segs]
+        length_squared = self.segment_length[segs] ** 2
+        to_location = location[:, None, :] - start
+        t = (to_location * delta).sum(axis=2) / np.where(length_squared > 0, length_squared, 1.0)
+        t = np.clip(t, 0.0, 1.0)
+        offset = to_location - delta * t[:, :, None]
+        distance = (offset * offset).sum(axis=2)
+
+        best = np.argmin(distance, axis=1)
+        rows = np.arange(len(location))
+        best_seg = segs[rows, best]
+        return self.arc[best_seg] + t[rows, best] * self.segment_length[best_seg]
@@ -0,0 +1,127 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import numpy as np
+from math import floor
+from random import gauss
+
+'''
+Birth and death of particles during a bake
+Emitters add particles at the start of a frame, particles die at the end of
+it when their lifetime is over or, optionally, when they reach an end of
+the guide instead of turning around. Every particle gets an id when it is
+born, kept for its whole life and written to the frame cache, so frames can
+be matched particle by particle, eg. for motion blur.
+
+Emitters only depend on the frame, a bake resumed from a checkpoint emits
+exactly what the uninterrupted one did.
+'''
+
+
+class Rate_emitter:
+    '''rate particles per frame on random guide vertices, fractions add up over frames'''
+
+
+    def __init__(self, rate, start_frame=None, end_frame=None):
+        self.rate = rate
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+
+    def emitting(self, frame):
+        return ((self.start_frame is None or frame >= self.start_frame) and
+                (self.end_frame is None or frame <= self.end_frame))
+
+    def emit(self, frame):
+        '''(count, guide vertex of each particle or None for random ones)'''
+        if not self.emitting(frame):
+            return 0, None
+        first = self.start_frame if self.start_frame is not None else 0
+        count = int(floor(self.rate * (frame - first + 1)) - floor(self.rate * (frame - first)))
+        return count, None
+
+
+class Burst_emitter:
+    '''count particles at once on frame'''
+
+
+    def __init__(self, frame, count):
+        self.frame = frame
+        self.count = count
+
+    def emit(self, frame):
+        return (self.count if frame == self.frame else 0), None
+
+
+class Vertex_emitter(Rate_emitter):
+    '''rate particles per frame from each of the given guide vertices, eg. a nest at the end of the path'''
+
+
+    def __init__(self, vertices, rate, start_frame=None, end_frame=None):
+        Rate_emitter.__init__(self, rate, start_frame, end_frame)
+        self.vertices = list(vertices)
+
+    def emit(self, frame):
+        count, _ = Rate_emitter.emit(self, frame)
+        return count * len(self.vertices), [v for v in self.vertices for i in range(count)]
+
+
+class Lifecycle:
+
+
+    def __init__(self, emitters=(), lifetime=0, lifetime_variation=0.0, kill_at_path_end=False):
+        '''
+        lifetime in frames, 0 to live forever, with a gaussian variation
+        drawn for each particle when lifetime_variation is set
+        '''
+        self.emitters = list(emitters)
+        self.lifetime = lifetime
+        self.lifetime_variation = lifetime_variation
+        self.kill_at_path_end = kill_at_path_end
+
+    def emit(self, a_ps, frame):
+        '''Add this frame's new particles to a_ps'''
+        for emitter in self.emitters:
+            count, vertices = emitter.emit(frame)
+            if count:
+                a_ps.add_particles(count, vertices)
+
+    def draw_lifetime(self):
+        '''Lifetime of a new particle, draws from random only with a variation'''
+        if not self.lifetime or not self.lifetime_variation:
+            return self.lifetime
+        return max(int(round(gauss(self.lifetime, self.lifetime_variation))), 1)
+
+    def lifetimes(self, normal):
+        '''Lifetimes of new particles from standard normal draws, see random_streams'''
+        if not self.lifetime or not self.lifetime_variation:
+            return np.full(len(normal), self.lifetime, dtype=np.int64)
+        return np.maximum(np.round(self.lifetime + self.lifetime_variation * normal), 1).astype(np.int64)
+
+    def dead(self, age, lifetime, end_reached):
+        '''Which particles die, scalars or arrays'''
+        expired = (lifetime > 0) & (age >= lifetime)
+        if self.kill_at_path_end:
+            return expired | end_reached
+        return expired
+
+
+def swap_remove_order(indices):
+    '''
+    Kill order for swap-remove: from the last index down, so the particle
+    moved into a freed slot is never one that dies too
+    '''
+    return sorted(set(int(i) for i in indices), reverse=True)
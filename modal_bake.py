@@ -0,0 +1,214 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import queue
+import threading
+from time import time
+
+'''
+Bakes advanced in chunks from a window timer, Blender stays responsive
+Each timer event steps the simulation for a time budget, the header shows
+progress and frames per second, Esc stops the bake and keeps it so it can
+be resumed from the frame it reached.
+
+Threaded jobs step the simulation on a worker thread, without writing, and
+hand copies of each frame's arrays to the main thread, which creates the
+datablocks: bpy is only safe to use from the main thread. Only for the
+NumPy engine, which touches no datablock while stepping.
+'''
+
+# jobs stopped with Esc, by operator id, resumed by the next invoke
+paused = {}
+# jobs running now, by operator id, for the panels
+running = {}
+
+
+class Bake_job:
+
+
+    def __init__(self, a_ps, end_frame, after_step=None, threaded=False):
+        '''
+        a_ps is stepped from the frame after a_ps.frame to end_frame,
+        after_step(frame) is called after each step, eg. to save checkpoints
+        '''
+        self.a_ps = a_ps
+        self.first_frame = a_ps.frame + 1
+        self.start_frame = a_ps.frame + 1
+        self.end_frame = end_frame
+        self.after_step = after_step
+        self.threaded = threaded
+
+        # frames stepped (and written) since the job started or resumed
+        self.written = 0
+        self.seconds = 0.0
+
+        self.frames = None
+        self.worker = None
+        self.stop = threading.Event()
+        self.error = None
+
+    @property
+    def frame(self):
+        '''Last frame written'''
+        return self.start_frame + self.written - 1
+
+    @property
+    def done(self):
+        return self.frame >= self.end_frame
+
+    @property
+    def progress(self):
+        return (self.frame - self.first_frame + 1) / max(self.end_frame - self.first_frame + 1, 1)
+
+    @property
+    def frames_per_second(self):
+        return self.written / self.seconds if self.seconds else 0.0
+
+    def status(self):
+        return 'Frame {} / {} ({:.0%}), {:.1f} frames/s'.format(
+            self.frame, self.end_frame, self.progress, self.frames_per_second)
+
+    def start(self):
+        '''Start or resume stepping from the frame after the last written one'''
+        self.start_frame = self.frame + 1
+        self.written = 0
+        self.seconds = 0.0
+        self.stop.clear()
+        if self.threaded:
+            # a few frames ahead at most, they are full copies of the arrays
+            self.frames = queue.Queue(maxsize=4)
+            self.worker = threading.Thread(target=self.compute)
+            self.worker.daemon = True
+            self.worker.start()
+
+    def compute(self):
+        '''Worker thread: step without writing, queue copies for the main thread'''
+        try:
+            while not self.stop.is_set() and self.a_ps.frame < self.end_frame:
+                self.a_ps.step(write=False)
+                self.frames.put((self.a_ps.frame,) + tuple(a.copy() for a in self.a_ps.frame_arrays()))
+                if self.after_step:
+                    # a checkpoint waits for the frames before it to be written
+                    self.frames.join()
+                    self.after_step(self.a_ps.frame)
+        except Exception as error:
+            self.error = error
+            self.frames.put(None)
+
+    def write(self, item):
+        '''Main thread: create the datablocks of a frame from the worker'''
+        try:
+            if item is None:
+                raise self.error
+            self.a_ps.writer.write(*item)
+            self.written += 1
+        finally:
+            self.frames.task_done()
+
+    def run(self, budget):
+        '''Step, or write frames from the worker, for about budget seconds, True when done'''
+        start = time()
+        while not self.done and time() - start < budget:
+            if self.threaded:
+                try:
+                    self.write(self.frames.get(timeout=budget))
+                except queue.Empty:
+                    break
+            else:
+                self.a_ps.step()
+                if self.after_step:
+                    self.after_step(self.a_ps.frame)
+                self.written += 1
+        self.seconds += time() - start
+        return self.done
+
+    def cancel(self):
+        '''Stop the worker and write the frames it already computed'''
+        self.stop.set()
+        if self.worker is None:
+            return
+        # the worker finishes its frame, it may be waiting for room in the queue
+        while self.worker.is_alive() or not self.frames.empty():
+            try:
+                item = self.frames.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            if item is None:
+                self.frames.task_done()
+            else:
+                self.write(item)
+        self.worker.join()
+        self.worker = None
+
+
+class Modal_bake:
+    '''
+    Operator mixin running a Bake_job from a window timer
+    Subclasses define create_job(context), resume_job(context, job) and
+    finish(context, job, cancelled)
+    '''
+
+    # seconds of simulation per timer event, the UI redraws in between
+    budget = 0.1
+
+    def invoke(self, context, event):
+        job = paused.pop(self.bl_idname, None)
+        if job is not None and self.resume:
+            self.resume_job(context, job)
+        else:
+            job = self.create_job(context)
+        job.start()
+        self.job = job
+        running[self.bl_idname] = job
+
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(0.01, context.window)
+        wm.modal_handler_add(self)
+        wm.progress_begin(0, 100)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.job.cancel()
+            paused[self.bl_idname] = self.job
+            self.end(context, cancelled=True)
+            return {'CANCELLED'}
+
+        if event.type == 'TIMER':
+            try:
+                done = self.job.run(self.budget)
+            except Exception:
+                self.job.cancel()
+                self.end(context, cancelled=True)
+                raise
+            context.window_manager.progress_update(int(self.job.progress * 100))
+            if context.area:
+                context.area.header_text_set(self.job.status() + ', Esc to stop')
+            if done:
+                self.end(context, cancelled=False)
+                return {'FINISHED'}
+
+        return {'PASS_THROUGH'}
+
+    def end(self, context, cancelled):
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        if context.area:
+            context.area.header_text_set()
+        running.pop(self.bl_idname, None)
+        self.finish(context, self.job, cancelled)
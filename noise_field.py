@@ -0,0 +1,151 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import hashlib
+import os
+from collections import OrderedDict
+import numpy as np
+from mathutils import Vector, noise
+from time import time
+
+'''
+Turbulence baked on a lattice
+The ants sample noise.turbulence_vector at noise_seed + location, a smooth
+field whose sample points only drift in z. It is evaluated once on a
+regular lattice and sampled with trilinear interpolation for all ants.
+
+Lattices are kept in memory, the last few built, and optionally on disk,
+keyed by the turbulence settings, bounds and spacing. noise.seed_set() only affects
+mathutils' random functions, not the turbulence, so the random seed is not
+part of the key.
+'''
+
+OCTAVES = 2
+NOISE_BASIS = 1
+
+# lattices kept in memory, a long bake builds a new one every hundred frames or so
+MEMORY_FIELDS = 4
+
+_fields = OrderedDict()
+
+
+def turbulence(co, strength, frequency):
+    '''The exact call made per ant by fourmis'''
+    return noise.turbulence_vector(Vector(co), OCTAVES, False, NOISE_BASIS, strength, frequency)
+
+
+class Turbulence_field:
+
+
+    def __init__(self, bounds_min, bounds_max, spacing, strength, frequency, values=None):
+        self.strength = strength
+        self.frequency = frequency
+        self.spacing = spacing
+        # snap the bounds to the lattice so the same region gives the same key
+        self.bounds_min = np.floor(np.asarray(bounds_min, dtype=np.float64) / spacing) * spacing
+        self.shape = tuple(np.ceil((np.asarray(bounds_max) - self.bounds_min) / spacing).astype(int) + 1)
+        self.shape = tuple(max(n, 2) for n in self.shape)
+        self.bounds_max = self.bounds_min + (np.array(self.shape) - 1) * spacing
+
+        self.build_time = 0.0
+        if values is None:
+            values = self.evaluate()
+        self.values = values
+
+    @property
+    def key(self):
+        return (self.strength, self.frequency, OCTAVES, NOISE_BASIS, self.spacing,
+                tuple(np.round(self.bounds_min / self.spacing).astype(int)), self.shape)
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def lattice_points(self):
+        axes = [self.bounds_min[a] + np.arange(self.shape[a]) * self.spacing for a in range(3)]
+        grid = np.meshgrid(*axes, indexing='ij')
+        return np.stack(grid, axis=-1).reshape(-1, 3)
+
+    def evaluate(self):
+        '''One exact turbulence call per lattice point'''
+        start = time()
+        points = self.lattice_points()
+        values = np.empty((len(points), 3), dtype=np.float32)
+        for i, co in enumerate(points):
+            values[i] = turbulence(co, self.strength, self.frequency)
+        self.build_time = time() - start
+        return values.reshape(self.shape + (3,))
+
+    def contains(self, points):
+        return bool(np.all(points >= self.bounds_min) and np.all(points <= self.bounds_max))
+
+    def sample(self, points):
+        '''Trilinear interpolation for all points, clamped to the lattice'''
+        grid = (np.asarray(points, dtype=np.float64) - self.bounds_min) / self.spacing
+        shape = np.array(self.shape)
+        grid = np.clip(grid, 0, shape - 1)
+        corner = np.minimum(np.floor(grid).astype(np.int64), shape - 2)
+        t = grid - corner
+        i, j, k = corner[:, 0], corner[:, 1], corner[:, 2]
+        tx, ty, tz = t[:, 0:1], t[:, 1:2], t[:, 2:3]
+
+        v = self.values
+        c00 = v[i, j, k] * (1-tx) + v[i+1, j, k] * tx
+        c10 = v[i, j+1, k] * (1-tx) + v[i+1, j+1, k] * tx
+        c01 = v[i, j, k+1] * (1-tx) + v[i+1, j, k+1] * tx
+        c11 = v[i, j+1, k+1] * (1-tx) + v[i+1, j+1, k+1] * tx
+        c0 = c00 * (1-ty) + c10 * ty
+        c1 = c01 * (1-ty) + c11 * ty
+        return (c0 * (1-tz) + c1 * tz).astype(np.float32)
+
+    def error(self, points):
+        '''Distance between the interpolated and the exact turbulence at points'''
+        exact = np.array([turbulence(co, self.strength, self.frequency) for co in points])
+        return np.sqrt(((self.sample(points) - exact) ** 2).sum(axis=1))
+
+
+def cache_path(directory, key):
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return os.path.join(directory, 'turbulence_{}.npy'.format(digest))
+
+
+def field(bounds_min, bounds_max, spacing, strength, frequency, directory=None):
+    '''Turbulence field from the memory or disk cache, evaluated if missing'''
+    candidate = Turbulence_field(bounds_min, bounds_max, spacing, strength, frequency, values=np.zeros(0))
+    key = candidate.key
+    if key in _fields:
+        _fields.move_to_end(key)
+        return _fields[key]
+
+    path = cache_path(directory, key) if directory else None
+    if path and os.path.exists(path):
+        candidate.values = np.load(path)
+    else:
+        candidate.values = candidate.evaluate()
+        if path:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            np.save(path, candidate.values)
+    _fields[key] = candidate
+    while len(_fields) > MEMORY_FIELDS:
+        _fields.popitem(last=False)
+    return candidate
+
+
+def clear():
+    _fields.clear()
@@ -0,0 +1,102 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import bpy
+from time import time
+
+'''
+Registry of the datablocks a simulation created
+Outputs are linked in a group named after their owner and tagged with an
+ownership property, a re-bake removes them by walking the group instead of
+every object of the file, so teardown costs O(outputs), not O(scene).
+Meshes and actions are only removed when they are tagged as outputs and no
+longer used, the instance mesh shared by the generators is left alone.
+'''
+
+# custom property naming the owner on every registered datablock
+OWNER_PROPERTY = 'simulation_output'
+
+
+class Output_registry:
+
+
+    def __init__(self, owner):
+        self.owner = owner
+        self.group_name = '{} outputs'.format(owner)
+
+    def group(self):
+        group = bpy.data.groups.get(self.group_name)
+        if group is None:
+            group = bpy.data.groups.new(self.group_name)
+        return group
+
+    def owns(self, block):
+        return block is not None and block.get(OWNER_PROPERTY) == self.owner
+
+    def tag(self, block):
+        '''Mark a mesh or action as an output, removed with the objects using it'''
+        block[OWNER_PROPERTY] = self.owner
+        return block
+
+    def add(self, *objects):
+        group = self.group()
+        for obj in objects:
+            obj[OWNER_PROPERTY] = self.owner
+            group.objects.link(obj)
+
+    def __len__(self):
+        group = bpy.data.groups.get(self.group_name)
+        return len(group.objects) if group is not None else 0
+
+    def clear(self):
+        '''
+        Remove the registered objects, then the output meshes and actions they
+        left without users, returns the number of objects removed
+        '''
+        group = bpy.data.groups.get(self.group_name)
+        if group is None:
+            return 0
+        start = time()
+
+        objects = list(group.objects)
+        # by name, a mesh or action can be shared by several outputs
+        meshes = {}
+        actions = {}
+        for obj in objects:
+            if self.owns(obj.data):
+                meshes[obj.data.name] = obj.data
+            if obj.animation_data is not None and self.owns(obj.animation_data.action):
+                actions[obj.animation_data.action.name] = obj.animation_data.action
+            # 2.7x only removes objects without users: out of the scenes and
+            # the group first, or they are left linked there
+            for scene in obj.users_scene:
+                scene.objects.unlink(obj)
+            group.objects.unlink(obj)
+            obj.user_clear()
+            bpy.data.objects.remove(obj)
+
+        for mesh in meshes.values():
+            if mesh.users == 0:
+                bpy.data.meshes.remove(mesh)
+        for action in actions.values():
+            if action.users == 0:
+                bpy.data.actions.remove(action)
+
+        print('Removed {} outputs, {} meshes, {} actions in {:05.5f} seconds'.format(
+            len(objects), len(meshes), len(actions), time() - start))
+        return len(objects)
@@ -0,0 +1,92 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Domain decomposition of the colony for a parallel step
+The colony is cut in slabs across its longest horizontal axis, each with the
+same number of ants. A tile owns the ants of its slab and reads, without
+moving them, the halo ants of its neighbours within the interaction radius.
+Tiles are cut again every frame from the current positions, which migrates
+the ants that crossed a border.
+
+The workers are threads: the heavy NumPy loops release the GIL, and the
+tiles read and write the colony's arrays in place, with no copy in or out
+of the workers. Processes could not share the Blender data (ground tree,
+guide) the stages read.
+'''
+
+
+class Tile_pool:
+
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = None
+        # (owned, halo) ant counts of the last frame's tiles
+        self.sizes = []
+
+    def split(self, location, radius):
+        '''
+        One tile per worker: (members, owned) with members the indices of
+        the tile's ants in increasing order, owned the mask of the ones it moves
+        '''
+        extent = location[:, :2].max(axis=0) - location[:, :2].min(axis=0) if len(location) else (0, 0)
+        x = location[:, int(np.argmax(extent))]
+        order = np.argsort(x, kind='mergesort')
+        x = x[order]
+
+        tiles = []
+        self.sizes = []
+        bounds = np.linspace(0, len(x), self.workers + 1).astype(np.int64)
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if start == end:
+                continue
+            # everything within the radius of the slab, on both sides
+            low = np.searchsorted(x, x[start] - radius, side='left')
+            high = np.searchsorted(x, x[end-1] + radius, side='right')
+            members = order[low:high]
+            owned = np.zeros(high - low, dtype=bool)
+            owned[start-low:end-low] = True
+            # in index order, neighbours then come in the same order as in
+            # the serial step and the repulsion sums are the same
+            index_order = np.argsort(members)
+            tiles.append((members[index_order], owned[index_order]))
+            self.sizes.append((end - start, high - low - (end - start)))
+        return tiles
+
+    def map(self, function, tiles):
+        '''function(tile) for every tile on the workers, results in tile order'''
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        return list(self.executor.map(function, tiles))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def report(self):
+        if not self.sizes:
+            return
+        owned = sum(o for o, h in self.sizes)
+        halo = sum(h for o, h in self.sizes)
+        print('{} tiles, {} ants, {:.2f}% more read in halos'.format(
+            len(self.sizes), owned, 100.0 * halo / max(owned, 1)))
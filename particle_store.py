@@ -0,0 +1,148 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import numpy as np
+from mathutils import Vector
+
+'''
+Particles as rows of contiguous arrays, behind the per-object API
+A Particle_store keeps one array per attribute, its items are small slotted
+views: reading view.location gives a Vector, assigning it writes the row.
+Vectors read from a view are copies, change them then assign them back
+(part.location += v does, part.location.z += 1 does not).
+This trades speed for memory, reading a view costs more than reading an
+attribute of a plain object, code looping over views steps slower.
+'''
+
+
+def view_class(name, fields):
+    '''Slotted class with a property per field, reading and writing its row'''
+    def vector_property(field):
+        def get(self):
+            # through a list, building from the row converts each item
+            return Vector(self.store.arrays[field][self.index].tolist())
+
+        def set(self, value):
+            self.store.arrays[field][self.index] = value
+        return property(get, set)
+
+    def scalar_property(field):
+        def get(self):
+            return self.store.arrays[field].item(self.index)
+
+        def set(self, value):
+            self.store.arrays[field][self.index] = value
+        return property(get, set)
+
+    attributes = {'__slots__': ('store', 'index')}
+    for field, width, dtype in fields:
+        attributes[field] = vector_property(field) if width > 1 else scalar_property(field)
+    return type(name, (Particle_view,), attributes)
+
+
+class Particle_view:
+    __slots__ = ()
+
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+
+class Particle_store:
+
+
+    def __init__(self, fields, capacity=0):
+        '''fields: (name, width, dtype) for each particle attribute'''
+        self.fields = tuple(fields)
+        self.count = 0
+        self.arrays = {}
+        for field, width, dtype in self.fields:
+            shape = (capacity, width) if width > 1 else (capacity,)
+            self.arrays[field] = np.zeros(shape, dtype=dtype)
+        self.view = view_class('Particle', self.fields)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('particle index out of range')
+        return self.view(self, index)
+
+    def __iter__(self):
+        view = self.view
+        for i in range(self.count):
+            yield view(self, i)
+
+    @property
+    def capacity(self):
+        return len(self.arrays[self.fields[0][0]])
+
+    def reserve(self, capacity):
+        '''Grow the arrays to hold at least capacity particles'''
+        if capacity <= self.capacity:
+            return
+        capacity = max(capacity, self.capacity * 2)
+        for field, array in self.arrays.items():
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self.count] = array[:self.count]
+            self.arrays[field] = grown
+
+    def append(self, particle):
+        '''Copy the attributes of a regular particle object into a new row'''
+        self.reserve(self.count + 1)
+        for field, width, dtype in self.fields:
+            self.arrays[field][self.count] = getattr(particle, field)
+        self.count += 1
+
+    def extend(self, columns):
+        '''Add rows from a sequence per field, eg. a saved state'''
+        added = len(columns[self.fields[0][0]])
+        self.reserve(self.count + added)
+        for field, width, dtype in self.fields:
+            self.arrays[field][self.count:self.count + added] = columns[field]
+        self.count += added
+
+    def remove(self, part):
+        self.swap_remove(part.index)
+
+    def swap_remove(self, index):
+        '''Move the last particle in place of the removed one, the others keep their index'''
+        last = self.count - 1
+        for array in self.arrays.values():
+            array[index] = array[last]
+        self.count = last
+
+    def column(self, field):
+        '''The used rows of a field, a view on the array'''
+        return self.arrays[field][:self.count]
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def report(self):
+        '''Memory per field, to size bakes on the render nodes'''
+        print('Particle store: {} particles, {} allocated, {:.2f} MB'.format(
+            self.count, self.capacity, self.nbytes / 2**20))
+        for field, width, dtype in self.fields:
+            array = self.arrays[field]
+            print('    {:<12} {:>10.2f} MB, {} bytes per particle'.format(
+                field, array.nbytes / 2**20, array.itemsize * width))
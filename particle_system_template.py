@@ -17,32 +17,62 @@
 
 
 import bpy
+import os
+import sys
 from mathutils import Vector, noise
 from time import time
 
+# helper modules live next to this script
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from frame_writer import Frame_writer
+import modal_bake
+from modal_bake import Bake_job, Modal_bake
+from output_registry import Output_registry
+from particle_store import Particle_store
+
 '''
 Template for a particle system
 Includes efficient caching using duplication
 '''
 
+# generator, instance and sphere objects of the last simulation
+OUTPUTS = Output_registry('particle_simulation')
+
 class Particle:
+    __slots__ = ('location', 'velocity', 'active')
+
     def __init__(self, location=Vector()):
         self.location = location.copy()
         self.velocity = noise.random_unit_vector()
 
         self.active = True
 
+# Particle attributes in a Particle_store, add a field for each new attribute
+COMPACT_FIELDS = (
+    ('location', 3, 'f4'),
+    ('velocity', 3, 'f4'),
+    ('active', 1, '?'),
+    )
+
 
 class Particle_system:
 
-    def __init__(self):
+    def __init__(self, compact=False):
+        '''
+        compact keeps the particles in a Particle_store instead of one object
+        each, vectors read from its particles are copies: assign them back
+        '''
         self.frame = 0
 
-        self.particles = []
+        self.compact = compact
+        self.particles = Particle_store(COMPACT_FIELDS) if compact else []
 
         bpy.ops.mesh.primitive_ico_sphere_add(location=(0,0,0))
+        OUTPUTS.tag(bpy.context.object.data)
+        OUTPUTS.add(bpy.context.object)
         self.instance_obj = bpy.data.objects[bpy.context.scene.particle_simulation_settings.instance]
         self.instance_mesh = self.instance_obj.data
+        self.writer = Frame_writer(self.instance_mesh, OUTPUTS)
 
 
     def add_particle(self, particles_number):
@@ -51,7 +81,16 @@ class Particle_system:
             self.particles.append(Particle())
 
     def kill_particle(self, part):
-        self.particles.remove(part)
+        self.kill_index(part.index if self.compact else self.particles.index(part))
+
+    def kill_index(self, index):
+        '''Move the last particle in place of the dead one, kill from the last index down'''
+        if self.compact:
+            self.particles.swap_remove(index)
+            return
+        last = self.particles.pop()
+        if index < len(self.particles):
+            self.particles[index] = last
 
 
     def step(self):
@@ -74,63 +113,35 @@ class Particle_system:
         self.create_frame(self.frame)
 
     def create_frame(self, frame):
-        '''
-        For each frame:
-            - create a new instance of the object to duplicate (eg. a sphere)
-            - get a list of vertices from particles' positions
-            - create a new generator objects, use the vertex list to generate mesh
-                - this object will be used for duplication
-            - parent the object to duplicate to the generator object
-            - animate the visibility of both objects
-            '''
-
-        instance_obj_frame = bpy.data.objects.new('instance_{:05}'.format(frame), self.instance_mesh)
-        bpy.context.scene.objects.link(instance_obj_frame)
-
-
-        vertices = ((p.location, p.velocity) for p in self.particles)
-        generator_mesh = bpy.data.meshes.new('generator_{:05}'.format(frame))
-
-        for v in vertices:
-            generator_mesh.vertices.add(1)
-            generator_mesh.vertices[-1].co = v[0]
-            generator_mesh.vertices[-1].normal = v[1]
-
-        generator_obj = bpy.data.objects.new('generator_{:05}'.format(frame), generator_mesh)
-        bpy.context.scene.objects.link(generator_obj)
+        '''Write this frame's particles as a new generator object'''
+        if self.compact:
+            co = self.particles.column('location').ravel()
+            normal = self.particles.column('velocity').ravel()
+        else:
+            co = [c for p in self.particles for c in p.location]
+            normal = [c for p in self.particles for c in p.velocity]
+        self.writer.write(frame, co, normal)
 
-        instance_obj_frame.parent = generator_obj
-        generator_obj.dupli_type = "VERTS"
-        generator_obj.use_dupli_vertices_rotation = True
 
-        #anim
-        generator_obj.keyframe_insert('hide', frame=frame)
-        generator_obj.keyframe_insert('hide_render', frame=frame)
-        generator_obj.hide = True
-        generator_obj.hide_render = True
-        generator_obj.keyframe_insert('hide', frame=frame+1)
-        generator_obj.keyframe_insert('hide_render', frame=frame+1)
-        generator_obj.keyframe_insert('hide', frame=frame-1)
-        generator_obj.keyframe_insert('hide_render', frame=frame-1)
+# Operator and panel for ease of use
 
+def prepare_simulation(settings):
+    '''The system of both operators, its first step writes settings.start_frame'''
+    a_ps = Particle_system()
+    a_ps.add_particle(settings.number)
+    a_ps.frame = settings.start_frame - 1
+    return a_ps
 
-# Operator and panel for ease of use
 
 def main(context):
 
     #Remove objects from previous sim
-    for o in bpy.data.objects:
-        if o.name.startswith('generator') or o.name.startswith('Ico') or o.name.startswith('instance'):
-            o.user_clear()
-            bpy.context.scene.objects.unlink(o)
-            bpy.data.objects.remove(o)
+    OUTPUTS.clear()
 
-    number = bpy.context.scene.particle_simulation_settings.number
     start_frame = bpy.context.scene.particle_simulation_settings.start_frame
     end_frame = bpy.context.scene.particle_simulation_settings.end_frame
     scale = bpy.context.scene.particle_simulation_settings.scale
-    a_ps = Particle_system()
-    a_ps.add_particle(number)
+    a_ps = prepare_simulation(bpy.context.scene.particle_simulation_settings)
 
     print('\n---')
     start = time()
@@ -139,7 +150,9 @@ def main(context):
         if f%10 == 0:
             print('frame: {:04}'.format(f))
         a_ps.step()
+    a_ps.writer.close()
     print('Simulated in {:05.5f} seconds'.format(time() - start))
+    a_ps.writer.report()
 
 
 class SimulationPanel(bpy.types.Panel):
@@ -169,6 +182,14 @@ class SimulationPanel(bpy.types.Panel):
 
         column = layout.row()
         column.operator("simulation.generate")
+        job = modal_bake.running.get("simulation.generate_modal")
+        if job is not None:
+            layout.label(text=job.status())
+        else:
+            column = layout.row(align=True)
+            column.operator("simulation.generate_modal", text='Interactive Simulation')
+            if "simulation.generate_modal" in modal_bake.paused:
+                column.operator("simulation.generate_modal", text='Resume').resume = True
 
 
 class ParticlesOperator(bpy.types.Operator):
@@ -184,6 +205,31 @@ class ParticlesOperator(bpy.types.Operator):
         main(context)
         return {'FINISHED'}
 
+
+class ParticlesModalOperator(Modal_bake, bpy.types.Operator):
+    """Generate particle simulation in the background, Esc to stop"""
+    bl_idname = "simulation.generate_modal"
+    bl_label = "Particle Simulation (Interactive)"
+
+    resume = bpy.props.BoolProperty(name='Resume', description='Continue the stopped simulation', default=False)
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == 'OBJECT' and cls.bl_idname not in modal_bake.running
+
+    def create_job(self, context):
+        OUTPUTS.clear()
+        settings = context.scene.particle_simulation_settings
+        return Bake_job(prepare_simulation(settings), settings.end_frame)
+
+    def resume_job(self, context, job):
+        pass
+
+    def finish(self, context, job, cancelled):
+        job.a_ps.writer.close()
+        print('Simulated {} frames in {:05.5f} seconds'.format(job.written, job.seconds))
+        job.a_ps.writer.report()
+
 def register():
     class ParticleSimulationSettings(bpy.types.PropertyGroup):
         number = bpy.props.IntProperty(name='Number Of Particles', description='Number Of Particles', min=1, soft_max=1000, default = 100)
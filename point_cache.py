@@ -0,0 +1,129 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import bpy
+import os
+import numpy as np
+from bpy.app.handlers import persistent
+
+from compressed_cache import open_cache
+from frame_writer import write_vertices
+from time_integration import subframe_path
+
+'''
+Point cache playback
+The whole simulation is written to one frame cache on disk (see frame_cache)
+instead of two objects per frame, a single generator object streams the
+current frame's points from a frame_change_pre handler
+'''
+
+# custom property holding the cache path on playback objects
+CACHE_PROPERTY = 'point_cache'
+# sub-frame samples per frame in the cache's subframes cache, see time_integration
+SUBFRAMES_PROPERTY = 'point_cache_subframes'
+
+
+_readers = {}
+
+
+def reader(path):
+    if path not in _readers:
+        _readers[path] = open_cache(path)
+    return _readers[path]
+
+
+def forget(path):
+    '''Drop the open reader of a cache before it is rewritten'''
+    if path in _readers:
+        _readers.pop(path).close()
+
+
+def load_frame(obj, frame, subframe=0.0):
+    '''
+    Replace the points of a playback object by the cached frame, or by the
+    nearest sub-frame sample between frames, eg. while rendering motion blur
+    '''
+    path = bpy.path.abspath(obj[CACHE_PROPERTY])
+    subframes = obj.get(SUBFRAMES_PROPERTY, 0)
+    if subframe and subframes:
+        path = subframe_path(path)
+        frame = int(round((frame + subframe) * subframes))
+    data = reader(path).frame(frame) if os.path.exists(path) else None
+    if data is None:
+        co = normal = np.zeros((0, 3), dtype=np.float32)
+    else:
+        ids, co, normal = data
+
+    mesh = obj.data
+    if len(mesh.vertices) == len(co):
+        mesh.vertices.foreach_set('co', co.ravel())
+        mesh.vertices.foreach_set('normal', normal.ravel())
+        mesh.update()
+        return
+
+    # vertices can't be removed in place, swap in a fresh mesh
+    new_mesh = bpy.data.meshes.new(mesh.name)
+    write_vertices(new_mesh, co.ravel(), normal.ravel())
+    obj.data = new_mesh
+    bpy.data.meshes.remove(mesh)
+    new_mesh.name = obj.name
+
+
+@persistent
+def update_playback(scene):
+    for obj in scene.objects:
+        if CACHE_PROPERTY in obj:
+            load_frame(obj, scene.frame_current, scene.frame_subframe)
+
+
+def playback_object(name, path, instance_mesh, subframes=0):
+    '''
+    Get or create the single object duplicating instance_mesh on the cached points
+    subframes: samples per frame in the sub-frame cache next to path, 0 for none
+    '''
+    obj = bpy.data.objects.get(name)
+    if obj is None:
+        obj = bpy.data.objects.new(name, bpy.data.meshes.new(name))
+        bpy.context.scene.objects.link(obj)
+    obj[CACHE_PROPERTY] = path
+    obj[SUBFRAMES_PROPERTY] = subframes
+    obj.dupli_type = "VERTS"
+    obj.use_dupli_vertices_rotation = True
+
+    instance_name = name + '_instance'
+    instance_obj = bpy.data.objects.get(instance_name)
+    if instance_obj is None:
+        instance_obj = bpy.data.objects.new(instance_name, instance_mesh)
+        bpy.context.scene.objects.link(instance_obj)
+    instance_obj.data = instance_mesh
+    instance_obj.parent = obj
+
+    forget(bpy.path.abspath(path))
+    forget(subframe_path(bpy.path.abspath(path)))
+    load_frame(obj, bpy.context.scene.frame_current)
+    return obj
+
+
+def register_playback():
+    if update_playback not in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.append(update_playback)
+
+
+def unregister_playback():
+    if update_playback in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.remove(update_playback)
@@ -0,0 +1,134 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import cProfile
+import pstats
+import sys
+from time import perf_counter
+
+'''
+Per-stage instrumentation of the simulation step
+The step marks the end of each stage with lap(stage): the time since the
+previous mark is added to that stage. A lap is a clock read and a dict
+lookup, fine once per stage per frame. Engines that step ant by ant only
+time one ant in ant_sample and scale their times and calls up, per ant laps
+on every ant would cost more than some of the stages they time. The report
+marks those stages, their numbers are estimates of the totals.
+With allocations, the change in allocated blocks is also added. Counting
+them walks the whole Python heap, tens of microseconds in a loaded Blender,
+so it is for diagnosis only.
+Optionally the whole bake also runs under cProfile and the stats are dumped
+for pstats or snakeviz.
+'''
+
+# ants between two timed ones in per-ant steps
+ANT_SAMPLE = 32
+
+# printed in this order, stages the engines don't have are skipped
+STAGES = ('lifecycle', 'tree build', 'avoidance', 'turbulence', 'guide', 'ground snap', 'velocity limits', 'frame output')
+
+
+class No_profiler:
+    '''Stands in when instrumentation is off'''
+
+    # no ant is timed
+    ant_sample = 0
+
+    def start(self):
+        pass
+
+    def lap(self, stage, scale=1):
+        pass
+
+    def enable(self):
+        pass
+
+    def disable(self):
+        pass
+
+    def report(self):
+        pass
+
+
+class Stage_profiler:
+
+
+    def __init__(self, profile_path=None, allocations=False, ant_sample=ANT_SAMPLE):
+        # stage: [seconds, calls, allocated blocks]
+        self.stages = {}
+        # stages timed on sampled ants only
+        self.sampled = set()
+        self.allocations = allocations
+        # every ant when counting allocations, that is for diagnosis anyway
+        self.ant_sample = 1 if allocations else ant_sample
+        self.mark = perf_counter()
+        self.blocks = 0
+
+        self.profile_path = profile_path
+        self.profile = cProfile.Profile() if profile_path else None
+
+    def start(self):
+        if self.allocations:
+            self.blocks = sys.getallocatedblocks()
+        self.mark = perf_counter()
+
+    def lap(self, stage, scale=1):
+        '''scale: ants a sampled ant's lap stands for'''
+        now = perf_counter()
+        totals = self.stages.get(stage)
+        if totals is None:
+            totals = self.stages[stage] = [0.0, 0, 0]
+        totals[0] += (now - self.mark) * scale
+        totals[1] += scale
+        if scale != 1:
+            self.sampled.add(stage)
+        if self.allocations:
+            blocks = sys.getallocatedblocks()
+            totals[2] += (blocks - self.blocks) * scale
+            self.blocks = blocks
+            # leave the block count out of the next stage's time
+            now = perf_counter()
+        self.mark = now
+
+    def enable(self):
+        if self.profile:
+            self.profile.enable()
+
+    def disable(self):
+        if self.profile:
+            self.profile.disable()
+
+    def report(self):
+        '''Stage breakdown, and the cProfile dump if one was asked for'''
+        total = sum(seconds for seconds, calls, blocks in self.stages.values())
+        if total:
+            print('Stages:')
+            order = [s for s in STAGES if s in self.stages] + sorted(s for s in self.stages if s not in STAGES)
+            for stage in order:
+                seconds, calls, blocks = self.stages[stage]
+                line = '    {:<16} {:>10.4f} s {:>5.1f} % {:>10} calls'.format(
+                    stage, seconds, seconds / total * 100, calls)
+                if self.allocations:
+                    line += ' {:>+10} blocks'.format(blocks)
+                if stage in self.sampled:
+                    line += ', estimated from 1 ant in {}'.format(self.ant_sample)
+                print(line)
+
+        if self.profile:
+            self.profile.dump_stats(self.profile_path)
+            print('Profile written to {}'.format(self.profile_path))
+            pstats.Stats(self.profile_path).sort_stats('cumulative').print_stats(15)
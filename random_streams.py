@@ -0,0 +1,95 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import numpy as np
+from zlib import crc32
+
+'''
+Counter-based random numbers
+Every draw is a hash of (seed, particle id, frame, purpose, draw index), so
+a particle gets the same numbers whatever order particles are processed in,
+whichever other particles exist, and whether the frame is stepped whole, in
+tiles, or after a resume. Nothing is stored between draws and all the
+particles of a frame draw at once.
+
+The hash chains the SplitMix64 finalizer over the fields. It is a bijection
+for each field, so two particles never share a stream for the same frame and
+purpose.
+'''
+
+MASK = (1 << 64) - 1
+
+
+def mix(x):
+    '''SplitMix64 finalizer on uint64 arrays, wraps around like the C version'''
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xbf58476d1ce4e5b9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94d049bb133111eb)
+    return x ^ (x >> np.uint64(31))
+
+
+def key(*fields):
+    '''Hash of integer fields as a uint64 array of one, for the scalar part of a key'''
+    h = np.zeros(1, dtype=np.uint64)
+    for field in fields:
+        h = mix(h ^ np.uint64(field & MASK))
+    return h
+
+
+def purpose_key(purpose):
+    '''Purposes are names, crc32 is the same in every session unlike hash()'''
+    return crc32(purpose.encode('utf-8'))
+
+
+class Random_streams:
+
+
+    def __init__(self, seed):
+        self.seed = seed
+
+    def bits(self, ids, frame, purpose, count=1):
+        '''(len(ids), count) uint64 draws'''
+        with np.errstate(over='ignore'):
+            h = key(self.seed, purpose_key(purpose), frame)
+            h = mix(np.asarray(ids, dtype=np.int64).astype(np.uint64) ^ h)
+            return mix(h[:, None] ^ np.arange(count, dtype=np.uint64)[None, :])
+
+    def uniform(self, ids, frame, purpose, count=None):
+        '''Floats in [0, 1), one per id or (len(ids), count)'''
+        u = (self.bits(ids, frame, purpose, count or 1) >> np.uint64(11)) * (1.0 / (1 << 53))
+        return u[:, 0] if count is None else u
+
+    def normal(self, ids, frame, purpose, mean=0.0, sigma=1.0):
+        '''Gaussian draws, Box-Muller on two uniforms'''
+        u = self.uniform(ids, frame, purpose, 2)
+        z = np.sqrt(-2.0 * np.log1p(-u[:, 0])) * np.cos(2.0 * np.pi * u[:, 1])
+        return mean + sigma * z
+
+    def integers(self, ids, frame, purpose, low, high):
+        '''Integers from low to high included, like random.randint'''
+        u = self.uniform(ids, frame, purpose)
+        return np.minimum(low + np.floor(u * (high - low + 1)).astype(np.int64), high)
+
+    def unit_vectors(self, ids, frame, purpose):
+        '''Directions uniform on the sphere'''
+        u = self.uniform(ids, frame, purpose, 2)
+        z = 2.0 * u[:, 0] - 1.0
+        phi = 2.0 * np.pi * u[:, 1]
+        r = np.sqrt(np.maximum(1.0 - z * z, 0.0))
+        return np.stack((r * np.cos(phi), r * np.sin(phi), z), axis=1)
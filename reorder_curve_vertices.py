@@ -17,45 +17,121 @@
 
 
 import bpy
-import time
-obj = bpy.context.object
-
-verts = []
-edges = []
-for v in obj.data.vertices:
-    if v.select:
-        verts.append(v)
-        break
-
-print(verts[-1].index)
-while len(verts) != len(obj.data.vertices):
-    print(2, len(verts), len(obj.data.vertices))
-
-    for e in obj.data.edges:
-        if verts[-1].index in e.vertices and e not in edges:
-            current_edge = e
-            if current_edge.vertices[0] == verts[-1]:
-                v_index = current_edge.vertices[0]
-            else:
-                v_index = current_edge.vertices[1]
-
-            verts.append(obj.data.vertices[v_index])
-
-            edges.append(e)
-            break
-print(3)
-edges = [[i, i+1] for i in range(len(verts)-1)]
-
-verts = [v.co for v in verts]
-
-##CREATE NEW MESH
-name = obj.data.name
-new_mesh = bpy.data.meshes.new(obj.data.name + '_Reordered')
-#new_obj = bpy.data.objects.new(obj.name + '_Reordered', new_mesh)
-#bpy.context.scene.objects.link(new_obj)
-new_mesh.from_pydata(verts, edges, [])
-print('lhj')
-obj.data = new_mesh
-obj.data.name = name
-
-print('DONE')
+import numpy as np
+from time import time
+
+'''
+Reorder the vertices of an edge-only mesh (eg. a converted curve) so their
+indices follow the edges, as fourmis expects from its guide.
+Run on the active object, the first selected vertex starts the first strand.
+'''
+
+
+def adjacency(edges, vertex_count):
+    '''(vertex_count, 2) array of each vertex's neighbours, -1 where there is none'''
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    source = np.concatenate((edges[:, 0], edges[:, 1]))
+    target = np.concatenate((edges[:, 1], edges[:, 0]))
+
+    degree = np.bincount(source, minlength=vertex_count)
+    if len(degree) and degree.max() > 2:
+        raise ValueError('Vertex {} has more than two edges, not a chain'.format(int(np.argmax(degree))))
+
+    order = np.argsort(source, kind='mergesort')
+    source, target = source[order], target[order]
+    # second edge of a vertex goes in the second column
+    slot = np.zeros(len(source), dtype=np.int64)
+    slot[1:] = source[1:] == source[:-1]
+
+    neighbours = np.full((vertex_count, 2), -1, dtype=np.int64)
+    neighbours[source, slot] = target
+    return neighbours, degree
+
+
+def chain_order(edges, vertex_count, start=None):
+    '''
+    Strands of vertex indices following the edges, in linear time
+    Returns a list of (indices, closed) with open chains walked from an end,
+    closed loops from their lowest index and lone vertices as one-vertex strands
+    '''
+    neighbours, degree = adjacency(edges, vertex_count)
+    neighbour_list = neighbours.tolist()
+    visited = np.zeros(vertex_count, dtype=bool)
+
+    # a start in the middle of an open chain would cut it in two, use the
+    # end of the chain it leads to instead
+    if start is not None and degree[start] == 2:
+        previous, current = -1, start
+        while True:
+            a, b = neighbour_list[current]
+            previous, current = current, (b if a == previous else a)
+            if current == start or degree[current] == 1:
+                break
+        start = current
+
+    # open chains from their ends first, then whatever is left is a loop
+    starts = [] if start is None else [start]
+    starts += np.flatnonzero(degree == 1).tolist()
+    starts += np.flatnonzero(degree == 0).tolist()
+    starts += np.flatnonzero(degree == 2).tolist()
+
+    strands = []
+    for first in starts:
+        if visited[first]:
+            continue
+        strand = []
+        previous, current = -1, first
+        while current != -1 and not visited[current]:
+            visited[current] = True
+            strand.append(current)
+            a, b = neighbour_list[current]
+            previous, current = current, (b if a == previous else a)
+        closed = len(strand) > 2 and first in neighbour_list[strand[-1]]
+        strands.append((np.array(strand, dtype=np.int64), closed))
+    return strands
+
+
+def reorder_mesh(obj, start=None):
+    '''Rebuild obj's mesh with its vertices in chain order, in one from_pydata'''
+    mesh = obj.data
+    vertex_count = len(mesh.vertices)
+
+    co = np.zeros(vertex_count * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', co)
+    co.shape = (vertex_count, 3)
+    edges = np.zeros(len(mesh.edges) * 2, dtype=np.int32)
+    mesh.edges.foreach_get('vertices', edges)
+
+    if start is None:
+        select = np.zeros(vertex_count, dtype=bool)
+        mesh.vertices.foreach_get('select', select)
+        selected = np.flatnonzero(select)
+        start = int(selected[0]) if len(selected) else None
+
+    strands = chain_order(edges, vertex_count, start)
+
+    # consecutive vertices of a strand are linked, loops are closed again
+    new_edges = []
+    offset = 0
+    for strand, closed in strands:
+        indices = np.arange(offset, offset + len(strand))
+        new_edges.append(np.stack((indices[:-1], indices[1:]), axis=1))
+        if closed:
+            new_edges.append(np.array([[indices[-1], indices[0]]]))
+        offset += len(strand)
+    order = np.concatenate([strand for strand, closed in strands]) if strands else np.zeros(0, dtype=np.int64)
+    new_edges = np.concatenate(new_edges) if new_edges else np.zeros((0, 2), dtype=np.int64)
+
+    ##CREATE NEW MESH
+    name = mesh.name
+    new_mesh = bpy.data.meshes.new(name + '_Reordered')
+    new_mesh.from_pydata(co[order].tolist(), new_edges.tolist(), [])
+    obj.data = new_mesh
+    obj.data.name = name
+    return strands
+
+
+if __name__ == "__main__":
+    start = time()
+    strands = reorder_mesh(bpy.context.object)
+    print('Reordered {} strands in {:05.5f} seconds'.format(len(strands), time() - start))
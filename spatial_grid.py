@@ -0,0 +1,151 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import numpy as np
+
+'''
+Uniform grid for fixed radius neighbour search
+The cell size is the search radius, so every neighbour of a point sits in
+its own cell or one of the 26 around it
+'''
+
+# own cell plus half of the 26 neighbours, the other half is found from the
+# opposite side so every pair comes out once
+HALF_NEIGHBOURHOOD = np.array([(0, 0, 0)] + [
+    (x, y, z)
+    for z in (-1, 0, 1) for y in (-1, 0, 1) for x in (-1, 0, 1)
+    if z > 0 or (z == 0 and y > 0) or (z == 0 and y == 0 and x > 0)
+    ], dtype=np.int64)
+
+
+def expand_ranges(starts, counts):
+    '''Concatenate arange(start, start+count) for every (start, count)'''
+    total = counts.sum()
+    if not total:
+        return np.zeros(0, dtype=np.int64)
+    ends = np.cumsum(counts)
+    steps = np.ones(total, dtype=np.int64)
+    nonzero = counts > 0
+    steps[0] = starts[nonzero][0]
+    # jump from the end of one range to the start of the next
+    firsts = (ends - counts)[nonzero][1:]
+    steps[firsts] = starts[nonzero][1:] - (starts[nonzero] + counts[nonzero] - 1)[:-1]
+    return np.cumsum(steps)
+
+
+class Spatial_grid:
+
+
+    def __init__(self, radius):
+        self.radius = radius
+        self.positions = np.zeros((0, 3))
+        self.cells = None
+        self.order = None
+        self.moved = 0
+
+    def __len__(self):
+        return len(self.positions)
+
+    def update(self, positions):
+        '''
+        Move the points to their new positions
+        Only re-sorts when a point changed cell, starting from the previous
+        order which is already almost sorted from one frame to the next
+        '''
+        self.positions = positions
+        cells = np.floor(positions / self.radius).astype(np.int64)
+
+        if self.cells is not None and len(cells) == len(self.cells):
+            moved = np.any(cells != self.cells, axis=1)
+            self.moved = int(moved.sum())
+            if not self.moved:
+                return
+            order = self.order
+        else:
+            self.moved = len(cells)
+            order = np.arange(len(cells))
+
+        self.cells = cells
+        if not len(cells):
+            self.order = order
+            self.keys = self.cell_keys = self.starts = self.counts = np.zeros(0, dtype=np.int64)
+            return
+
+        # pack cell coordinates in a single key, with a margin of one cell
+        # so that neighbour cells never wrap around
+        self.origin = cells.min(axis=0) - 1
+        self.dims = cells.max(axis=0) - self.origin + 2
+        keys = self.pack(cells)
+
+        self.order = order[np.argsort(keys[order], kind='mergesort')]
+        self.keys = keys[self.order]
+
+        cell_start = np.ones(len(self.keys), dtype=bool)
+        cell_start[1:] = self.keys[1:] != self.keys[:-1]
+        self.starts = np.flatnonzero(cell_start)
+        self.counts = np.diff(np.append(self.starts, len(self.keys)))
+        self.cell_keys = self.keys[self.starts]
+
+    def pack(self, cells):
+        c = cells - self.origin
+        return c[..., 0] + self.dims[0] * (c[..., 1] + self.dims[1] * c[..., 2])
+
+    def pairs(self):
+        '''
+        All pairs of points closer than the radius, in one call
+        Returns (first, second, distance) arrays, each pair appears once with
+        first < second, sorted by first then second
+        '''
+        if len(self) < 2:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0)
+
+        # for each sorted point: its cell, and the cell coordinates
+        cell_of_point = np.repeat(np.arange(len(self.starts)), self.counts)
+        cell_coords = self.cells[self.order[self.starts]]
+
+        first, second = [], []
+        for offset in HALF_NEIGHBOURHOOD:
+            if not offset.any():
+                # same cell: only the points sorted after this one
+                starts = np.arange(1, len(self.keys) + 1)
+                ends = (self.starts + self.counts)[cell_of_point]
+                counts = ends - starts
+            else:
+                neighbour_keys = self.pack(cell_coords + offset)
+                found = np.searchsorted(self.cell_keys, neighbour_keys)
+                found = np.minimum(found, len(self.cell_keys) - 1)
+                valid = self.cell_keys[found] == neighbour_keys
+                starts = self.starts[found][cell_of_point]
+                counts = np.where(valid, self.counts[found], 0)[cell_of_point]
+            first.append(np.repeat(np.arange(len(self.keys)), counts))
+            second.append(expand_ranges(starts, counts))
+
+        first = self.order[np.concatenate(first)]
+        second = self.order[np.concatenate(second)]
+
+        delta = self.positions[first] - self.positions[second]
+        distance = np.sqrt((delta * delta).sum(axis=1))
+        close = distance <= self.radius
+        first, second, distance = first[close], second[close], distance[close]
+
+        # same order whatever the update history, so results built from the
+        # pairs are reproducible after a resume
+        first, second = np.minimum(first, second), np.maximum(first, second)
+        order = np.lexsort((second, first))
+        return first[order], second[order], distance[order]
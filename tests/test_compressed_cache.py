@@ -0,0 +1,64 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import sys
+import numpy as np
+import pytest
+
+# the bpy and mathutils stand-ins, set up by the simulation benchmark
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+import simulation
+import fourmis
+from compressed_cache import Compressed_cache_reader, open_cache
+from frame_cache import Frame_cache_reader
+
+'''
+Compressed caches decode to the raw cache's frames, within the quantization
+step, with ants born and dying during the bake
+'''
+
+ERROR = 0.0005
+
+
+def bake(path, engine, cache_error):
+    guide, ground = simulation.make_scene()
+    # a fraction of an ant per frame, and kills that swap ants around
+    lifecycle = fourmis.create_lifecycle(guide, 0.3, 'RANDOM', 12, 4.0, True)
+    fourmis.bake(guide, ground, 1.0, 60, 1, 40, engine, path, lifecycle=lifecycle, cache_error=cache_error,
+                 cache_keyframes=10)
+
+
+@pytest.mark.parametrize('engine', ['OBJECT', 'COMPACT', 'ARRAY'])
+def test_compressed_matches_raw(tmpdir, engine):
+    raw_path = str(tmpdir.join('raw.cache'))
+    compressed_path = str(tmpdir.join('compressed.cache'))
+    bake(raw_path, engine, 0.0)
+    bake(compressed_path, engine, ERROR)
+
+    raw = Frame_cache_reader(raw_path)
+    compressed = open_cache(compressed_path)
+    assert isinstance(compressed, Compressed_cache_reader)
+    assert list(raw.frames()) == list(compressed.frames())
+    # in order, then seeking, which decodes from the keyframes
+    frames = list(raw.frames())
+    for frame in frames + frames[::-3]:
+        ids, co, velocity = raw.frame(frame)
+        decoded_ids, decoded_co, decoded_velocity = compressed.frame(frame)
+        assert np.array_equal(ids, decoded_ids)
+        assert np.abs(decoded_co - co).max() <= ERROR * 1.001
@@ -0,0 +1,59 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import sys
+
+# the bpy and mathutils stand-ins, set up by the simulation benchmark
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+import simulation
+import bpy
+import fourmis
+
+'''
+A new bake removes every output of the previous one, objects, their links
+in the scene and the registry group, and the meshes they used
+'''
+
+SETTINGS = dict(ant_number=20, ant_start_frame=1, ant_end_frame=5, ant_scale=1.0, ant_ground='Sol',
+                ant_guide='Chemin', ant_engine='OBJECT', ant_output='OBJECTS', ant_ground_heightfield=False,
+                ant_guide_mode='VERTEX', ant_turbulence_spacing=0.0, ant_workers=1, ant_random_streams=False,
+                ant_steps_per_frame=1.0, ant_subframes=0, ant_cache_path='//ants.cache', ant_cache_compress=False,
+                ant_cache_error=0.001, ant_cache_keyframes=25, ant_checkpoint_interval=0, ant_resume_frame=0,
+                ant_emit_rate=0.0, ant_emit_from='RANDOM', ant_lifetime=0, ant_lifetime_variation=0.0,
+                ant_kill_at_path_end=False, ant_cull_camera=False, ant_stage_timings=False)
+
+
+def test_rebake_leaves_no_outputs():
+    simulation.make_scene()
+    scene = bpy.context.scene
+    for name, value in SETTINGS.items():
+        setattr(scene, name, value)
+    scene_objects = set(bpy.data.objects)
+    scene_meshes = set(bpy.data.meshes)
+
+    fourmis.main(bpy.context)
+    first = set(bpy.data.objects) - scene_objects
+    fourmis.main(bpy.context)
+    outputs = set(bpy.data.objects) - scene_objects
+
+    # an instance and a generator per frame, none of the first bake's
+    assert len(outputs) == 2 * 5 and not outputs & first
+    assert set(fourmis.OUTPUTS.group().objects) == outputs
+    assert set(scene.objects) == outputs | (set(scene.objects) & scene_objects)
+    assert set(bpy.data.meshes) - scene_meshes == set(o.data for o in outputs if o.data not in scene_meshes)
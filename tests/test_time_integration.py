@@ -0,0 +1,52 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import sys
+import numpy as np
+
+# the bpy and mathutils stand-ins, set up by the simulation benchmark
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+import simulation
+
+'''
+Long steps write the frames they cover from their own start and end
+states, a frame is never read from a state past the step it falls in
+'''
+
+
+def test_long_steps_interpolate_within_step():
+    a_ps = simulation.create('ARRAY_STREAMS', 200, 1.0, steps_per_frame=0.25)
+    start = a_ps.location.copy()
+    frames = []
+    ends = []
+    for f in range(8):
+        a_ps.step(write=False)
+        # no step runs ahead of the frames it covers
+        assert a_ps.integrator.time - a_ps.frame < 4
+        frames.append(a_ps.frame_arrays()[0].reshape(-1, 3).copy())
+        if a_ps.frame % 4 == 1:
+            ends.append(a_ps.location.copy())
+
+    # frames 1 to 4 lie between the start and the end of the first step,
+    # frames 5 to 8 between the first and the second
+    for n, co in enumerate(frames):
+        before = start if n < 4 else ends[0]
+        after = ends[n // 4]
+        weight = np.float32((n % 4 + 1) / 4.0)
+        assert np.allclose(co, before + (after - before) * weight, atol=1e-6)
@@ -0,0 +1,39 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import sys
+
+# the bpy and mathutils stand-ins, set up by the simulation benchmark
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+import simulation
+
+'''
+The baked turbulence lattice covers a normal walk over the ground, the
+ants going down slopes and their seeds drifting up, without a rebuild
+'''
+
+
+def test_walk_keeps_lattice():
+    # create bakes the lattice over the starting ants
+    a_ps = simulation.create('ARRAY_STREAMS', 300, 1.0, turbulence_spacing=0.2)
+    lattice = a_ps.turbulence_field
+    # well within the hundred frames of drift the lattice is baked for
+    for f in range(80):
+        a_ps.step(write=False)
+    assert a_ps.turbulence_field is lattice
@@ -0,0 +1,140 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import numpy as np
+from fractions import Fraction
+
+'''
+Fixed time steps, apart from the output frames
+The engine is tuned per frame: velocities are distances per frame and every
+force is applied once a frame. The integrator steps the simulation with a
+fixed dt, in frames, and the engine scales its forces and moves by dt:
+
+    steps_per_frame > 1     several substeps per frame, steadier at high speed
+    steps_per_frame < 1     one step every few frames, frames in between are
+                            interpolated, for cheap previews
+
+Emission, aging and deaths still happen once per frame (once per step over
+all its frames for long steps), so lifetimes and emission rates keep their
+meaning. The states at the end of every step are kept until the frames that
+fall between them are written: frame output and sub-frame samples for motion
+blur are both read from them, the simulation is not run again.
+
+A long step is not cut at the output frames: the step that starts at a
+frame simulates all the frames it covers at once, and the frames before its
+end are read between its start and end states, never from a later step.
+Ants born or killed during a long step show from its first frame, and the
+last step of a bake may end past the last frame.
+
+Sub-frame samples are written to their own cache (see subframe_path),
+subframes samples per frame spread over the interval that ends on the frame,
+sample n at frame time n / subframes, the last one is the frame itself.
+'''
+
+
+def subframe_path(cache_path):
+    '''Cache of the sub-frame samples next to a frame cache: ants.cache -> ants.subframes.cache'''
+    root, extension = os.path.splitext(cache_path)
+    return root + '.subframes' + (extension or '.cache')
+
+
+def interpolate(before, after, time):
+    '''
+    (ids, co, velocity) at time between two states (time, ids, co, velocity)
+    Ants are matched by id, ants born in between are at their position
+    after, ants that died are not in it
+    '''
+    time_before, ids_before, co_before, velocity_before = before
+    time_after, ids, co, velocity = after
+    weight = np.float32((time - time_before) / (time_after - time_before))
+
+    order = np.argsort(ids_before, kind='mergesort')
+    found = np.minimum(np.searchsorted(ids_before[order], ids), max(len(order) - 1, 0))
+    if len(order):
+        known = np.flatnonzero(ids_before[order][found] == ids)
+    else:
+        known = np.zeros(0, dtype=np.int64)
+    source = order[found[known]]
+
+    co = co.copy()
+    velocity = velocity.copy()
+    co[known] = co_before[source] + (co[known] - co_before[source]) * weight
+    velocity[known] = velocity_before[source] + (velocity[known] - velocity_before[source]) * weight
+    return ids, co, velocity
+
+
+class Time_integrator:
+
+
+    def __init__(self, steps_per_frame=1.0, subframes=0, subframe_writer=None):
+        '''
+        steps_per_frame: a whole number, or one over a whole number
+        subframes: sub-frame samples per frame written to subframe_writer, 0 for none
+        '''
+        if steps_per_frame >= 1.0:
+            self.substeps, self.frames_per_step = int(round(steps_per_frame)), 1
+        else:
+            self.substeps, self.frames_per_step = 1, int(round(1.0 / steps_per_frame))
+        if abs(float(self.substeps) / self.frames_per_step - steps_per_frame) > 1e-6:
+            raise ValueError('{} steps per frame: use a whole number of steps per frame '
+                             'or of frames per step'.format(steps_per_frame))
+        self.dt = Fraction(self.frames_per_step, self.substeps)
+        self.subframes = subframes
+        self.subframe_writer = subframe_writer
+
+        # simulation time reached, in frames, None until the first step
+        self.time = None
+        # (time, ids, co, velocity) of the steps the next frames are read from
+        self.states = []
+
+    def due(self, frame):
+        '''Whether frame needs a new step, or falls between states already simulated'''
+        return self.time is None or self.time < frame
+
+    def begin(self, a_ps):
+        '''Before a step: keep the state it starts from, eg. first step or after a resume'''
+        if self.time is None:
+            self.time = Fraction(a_ps.frame - 1)
+        if not self.states:
+            self.record(a_ps)
+
+    def advance(self):
+        self.time += self.dt
+
+    def record(self, a_ps):
+        '''Copy of a_ps' ants at the time reached'''
+        self.states.append((self.time, a_ps.ids.copy(), a_ps.location.copy(), a_ps.velocity.copy()))
+
+    def state_at(self, time):
+        '''(ids, co, velocity) at time, interpolated between the two states around it'''
+        for i, state in enumerate(self.states):
+            if state[0] == time:
+                return state[1:]
+            if state[0] > time:
+                return interpolate(self.states[i-1], state, time)
+        raise ValueError('Time {} is not simulated yet'.format(float(time)))
+
+    def frame_done(self, frame):
+        '''Write frame's sub-frame samples, forget the states no later frame needs'''
+        if self.subframes:
+            for n in range((frame - 1) * self.subframes + 1, frame * self.subframes + 1):
+                ids, co, velocity = self.state_at(Fraction(n, self.subframes))
+                self.subframe_writer.write(n, co.ravel(), velocity.ravel(), ids)
+        while len(self.states) > 1 and self.states[1][0] <= frame:
+            self.states.pop(0)
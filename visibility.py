@@ -0,0 +1,63 @@
+# Copyright (C) 2015 Les Fees Speciales
+# voeu@les-fees-speciales.coop
+#
+#    This program is free software; you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation; either version 2 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License along
+#    with this program; if not, write to the Free Software Foundation, Inc.,
+#    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import bpy
+from time import time
+
+'''
+Visibility animation of the per-frame generator objects
+Instead of six keyframe_insert calls per frame, the frames are collected
+during the bake and every object gets its keys in one pass, written
+straight into new fcurves
+'''
+
+PATHS = ('hide', 'hide_render')
+
+
+class Visibility_animator:
+
+
+    def __init__(self, registry=None):
+        self.registry = registry
+        # (object, frame it is visible on)
+        self.pending = []
+        self.seconds = 0.0
+
+    def add(self, obj, frame):
+        obj.hide = True
+        obj.hide_render = True
+        self.pending.append((obj, frame))
+
+    def write(self):
+        '''Hidden on frame-1, visible on frame, hidden on frame+1, constant in between'''
+        start = time()
+        for obj, frame in self.pending:
+            action = bpy.data.actions.new(obj.name)
+            if self.registry is not None:
+                self.registry.tag(action)
+            obj.animation_data_create().action = action
+            co = (frame-1, 1.0, frame, 0.0, frame+1, 1.0)
+            for path in PATHS:
+                fcurve = action.fcurves.new(path)
+                fcurve.keyframe_points.add(3)
+                fcurve.keyframe_points.foreach_set('co', co)
+                for key in fcurve.keyframe_points:
+                    key.interpolation = 'CONSTANT'
+                fcurve.update()
+        self.pending = []
+        self.seconds += time() - start